@@ -0,0 +1,82 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Multi channel acquisition used by the combined mode : the CSV files of one
+                    'Oscilator' capture (Ch1 Tension, Ch2 Current, ...) loaded as CSV_Object
+                    instances sharing one timebase.
+
+                    The first channel parses the time column, the next channels only parse their
+                    value column and use the same 'times' array (one copy in memory instead of one
+                    per channel). The channels must be aligned : same record length, sample interval,
+                    trigger point and horizontal offset (header fields) and same number of samples,
+                    else ValueError is raised.
+                    In streaming mode each channel keeps its own decimated times (not shared).
+
+Class           :
+    - Acquisition(file_paths:list, delimiter:str=',', config=None)
+        - get_channel(channel_number:int)
+        - check_alignment(obj)
+        - times
+        - name
+
+'''
+
+import math
+from api import data_analysis
+
+
+ALIGNMENT_FIELDS = ('record_length', 'sample_interval', 'trigger_point', 'horizontal_offset')
+
+
+class Acquisition():
+    def __init__(self, file_paths:list, delimiter:str=',', config=None):
+        self.channels = {}      # channel number : CSV_Object (files order)
+        self.reference = None   # first channel : owner of the timebase
+
+        for file_path in file_paths:
+            timebase = None
+            if self.reference is not None and not self.reference.streaming:
+                timebase = self.reference.times
+            obj = data_analysis.CSV_Object(file_path, delimiter=delimiter, combined_flag=True, config=config, timebase=timebase)
+
+            if obj.channel_number in self.channels:
+                raise ValueError(f"Channel {obj.channel_number} is given twice : '{self.channels[obj.channel_number].file_name}', '{obj.file_name}'")
+            if self.reference is None:
+                self.reference = obj
+            else:
+                self.check_alignment(obj)
+            self.channels[obj.channel_number] = obj
+
+    @property
+    def times(self):
+        ''' Timebase shared by the channels '''
+        return self.reference.times
+
+    @property
+    def name(self):
+        ''' Acquisition name : file name without '_Ch<n>.csv' '''
+        return self.reference.file_name[:-8]
+
+    def get_channel(self, channel_number:int):
+        try:
+            return self.channels[channel_number]
+        except KeyError:
+            raise ValueError(f"No channel {channel_number} in the acquisition '{self.name}' !")
+
+    def check_alignment(self, obj):
+        ''' Raise ValueError if obj is not sampled as the reference channel '''
+        errors = []
+        for name in ALIGNMENT_FIELDS:
+            value, reference_value = getattr(obj, name), getattr(self.reference, name)
+            if value is None or reference_value is None:
+                continue    # header field not read
+            if not math.isclose(value, reference_value, rel_tol=1e-9, abs_tol=1e-15):
+                errors.append(f"{name} : {value} / {reference_value}")
+
+        if not obj.streaming and len(obj.values) != len(self.reference.values):
+            errors.append(f"samples : {len(obj.values)} / {len(self.reference.values)}")
+
+        if errors:
+            raise ValueError(f"Channels not aligned ('{obj.file_name}' / '{self.reference.file_name}') : " + ', '.join(errors))
@@ -0,0 +1,167 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Compressed and archived captures : the CSV files can be stored as
+                        - plain CSV files : 'X_Ch1.csv'
+                        - gzip files : 'X_Ch1.csv.gz'
+                        - members of a zip archive : 'bundle.zip/X_Ch1.csv' (path of the archive +
+                          '/' + member name, members in sub folders of the archive included)
+                    They are read as streams (decompressed while parsed) : nothing is extracted to
+                    the disk. The plain CSV files are still given by path to numpy (faster parser).
+
+                    The file name of a capture ('X_Ch1.csv', used for the processed dir, the
+                    figures and the Excel file) is the name of the CSV file inside the gzip file /
+                    the archive. The Ch1 / Ch2 files of an acquisition are paired in the same
+                    directory or the same archive.
+
+Functions       :
+    - split_path(file_path)
+    - is_capture_name(file_name:str)
+    - is_compressed(file_path)
+    - strip_extension(file_name:str)
+    - get_csv_name(file_path)
+    - get_directory(file_path)
+    - get_flat_name(file_path)
+    - get_stat(file_path)
+    - open_text(file_path, newline:str='')
+    - open_binary(file_path)
+    - open_csv_source(file_path)
+    - list_captures(directory:str)
+
+'''
+
+import os, io, re, gzip, zipfile, contextlib, collections
+
+
+CSV_EXTENSION = '.csv'
+GZIP_EXTENSION = '.gz'
+ARCHIVE_EXTENSION = '.zip'
+
+# '<archive>.zip' followed by a path separator and the member name
+_MEMBER_PATH = re.compile(r'^(?P<archive>.*?\.zip)[\\/](?P<member>.+)$', re.IGNORECASE)
+
+# os.stat() fields used by the cache / sidecar / catalog to see if a capture changed
+MemberStat = collections.namedtuple('MemberStat', ('st_size', 'st_mtime_ns'))
+
+
+def split_path(file_path):
+    ''' (archive path, member name) of a zip member path, (None, None) for a file on the disk '''
+    match = _MEMBER_PATH.match(str(file_path))
+    if match is None or not os.path.isfile(match.group('archive')):
+        return None, None
+    return match.group('archive'), match.group('member').replace('\\', '/')
+
+
+def is_capture_name(file_name:str):
+    ''' True for 'X.csv' and 'X.csv.gz' '''
+    return file_name.lower().endswith((CSV_EXTENSION, CSV_EXTENSION + GZIP_EXTENSION))
+
+
+def is_compressed(file_path):
+    ''' True for a gzip file or a zip member '''
+    return str(file_path).lower().endswith(GZIP_EXTENSION) or split_path(file_path)[0] is not None
+
+
+def strip_extension(file_name:str):
+    ''' File name without '.csv' / '.csv.gz' (same name if it is not a capture name) '''
+    lower = file_name.lower()
+    for extension in (CSV_EXTENSION + GZIP_EXTENSION, CSV_EXTENSION):
+        if lower.endswith(extension):
+            return file_name[:-len(extension)]
+    return file_name
+
+
+def get_csv_name(file_path):
+    ''' Name of the CSV file : 'X_Ch1.csv' for '.../X_Ch1.csv', '.../X_Ch1.csv.gz' and '.../bundle.zip/X_Ch1.csv' '''
+    file_name = os.path.basename(str(file_path).replace('\\', '/').rstrip('/'))
+    if file_name.lower().endswith(CSV_EXTENSION + GZIP_EXTENSION):
+        return file_name[:-len(GZIP_EXTENSION)]
+    return file_name
+
+
+def get_directory(file_path):
+    ''' Directory of the file, of the archive for a zip member (the processed dir is created in it) '''
+    archive_path, _ = split_path(file_path)
+    return os.path.dirname(archive_path if archive_path is not None else file_path)
+
+
+def get_flat_name(file_path):
+    ''' Unique file name of a capture in a flat directory (sidecar files) : 'bundle.zip__X_Ch1.csv' for a member '''
+    archive_path, member = split_path(file_path)
+    if archive_path is None:
+        return os.path.basename(file_path)
+    return os.path.basename(archive_path) + '__' + member.replace('/', '__')
+
+
+def get_stat(file_path):
+    ''' os.stat() of the file, (uncompressed size, archive mtime) for a zip member '''
+    archive_path, member = split_path(file_path)
+    if archive_path is None:
+        return os.stat(file_path)
+    with zipfile.ZipFile(archive_path) as archive:
+        size = archive.getinfo(member).file_size
+    return MemberStat(size, os.stat(archive_path).st_mtime_ns)
+
+
+@contextlib.contextmanager
+def open_text(file_path, newline:str=''):
+    ''' Text stream of the CSV data : decompressed on the fly for '.gz' files and zip members '''
+    archive_path, member = split_path(file_path)
+    if archive_path is not None:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as raw:
+            with io.TextIOWrapper(raw, newline=newline) as stream:
+                yield stream
+    elif str(file_path).lower().endswith(GZIP_EXTENSION):
+        with gzip.open(file_path, 'rt', newline=newline) as stream:
+            yield stream
+    else:
+        with open(file_path, newline=newline) as stream:
+            yield stream
+
+
+@contextlib.contextmanager
+def open_binary(file_path):
+    ''' Bytes of the stored file (compressed for a '.gz' file), of the member for a zip member '''
+    archive_path, member = split_path(file_path)
+    if archive_path is not None:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as stream:
+            yield stream
+    else:
+        with open(file_path, 'rb') as stream:
+            yield stream
+
+
+@contextlib.contextmanager
+def open_csv_source(file_path):
+    ''' Source given to numpy.loadtxt() : the path of a plain CSV file, else a text stream '''
+    if split_path(file_path)[0] is None and not str(file_path).lower().endswith(GZIP_EXTENSION):
+        yield file_path
+    else:
+        with open_text(file_path) as stream:
+            yield stream
+
+
+def list_captures(directory:str):
+    ''' Sorted [(name, stat)] of the captures of directory : '.csv' / '.csv.gz' files and the '.csv'
+    members of the '.zip' archives ('bundle.zip/X_Ch1.csv'). Only the central directory of the archives is read.
+    '''
+    captures = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if is_capture_name(entry.name):
+                captures.append((entry.name, entry.stat()))
+            elif entry.name.lower().endswith(ARCHIVE_EXTENSION):
+                mtime_ns = entry.stat().st_mtime_ns
+                try:
+                    with zipfile.ZipFile(entry.path) as archive:
+                        members = [info for info in archive.infolist()
+                                   if not info.is_dir() and info.filename.lower().endswith(CSV_EXTENSION)]
+                except (OSError, zipfile.BadZipFile):
+                    continue    # not readable : not listed
+                captures.extend((entry.name + '/' + info.filename, MemberStat(info.file_size, mtime_ns)) for info in members)
+    captures.sort()
+    return captures
@@ -0,0 +1,288 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Batch executor used by main.py to process many files (or Ch1/Ch2 pairs).
+                    With workers > 1 the files are scheduled across a process pool, each
+                    worker runs a whole file and its console output is captured.
+                    The outputs are printed in the files order (not in completion order) so
+                    the console stays readable. An exception in a file is reported and the
+                    batch continues with the next files.
+
+                    With workers == 1 and (load, compute, write) stages, the files go through a
+                    pipeline of threads (run_pipeline) : file k+1 is loaded (disk) and the outputs
+                    of file k-1 are written (disk) while file k is computed. The stages are linked
+                    by bounded queues (queue_size files waiting at most : the memory stays bounded)
+                    and the output of each file is printed in order once its last stage is done.
+
+Functions       :
+    - use_agg_backend()
+    - run_batch(function, args_list:list, titles:list, workers:int=1, config=None, stages:tuple=None)
+        - _run_task(function, args, capture:bool=False)
+        - _init_worker(config=None)
+    - run_pipeline(stages:tuple, args_list:list, titles:list, queue_size:int=1)
+    - print_batch_summary(task_results:list)
+    - write_batch_report(task_results:list, report_path, config=None)
+
+'''
+
+import os, sys, io, json, queue, threading, traceback, contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from colorama import Fore, Back, init
+from colorama.ansitowin32 import AnsiToWin32
+from api import settings
+init(autoreset=True)
+
+
+class TaskResult():
+    __slots__ = ('index', 'title', 'result', 'error')
+
+    def __init__(self, index:int, title:str, result=None, error:str=None):
+        self.index = index
+        self.title = title
+        self.result = result    # value returned by the processing function
+        self.error = error      # traceback text if the processing failed
+
+
+def use_agg_backend():
+    ''' Select the non-interactive matplotlib backend (figures saved, never shown) without importing
+    matplotlib : it is only loaded when a figure is created.
+    '''
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+    else:
+        os.environ['MPLBACKEND'] = 'Agg'
+
+
+def _init_worker(config=None):
+    # Workers never show figures : use the non-interactive backend
+    use_agg_backend()
+    # Same configuration as the main process (command line overrides), config.ini is not read again
+    if config is not None:
+        settings.set_config(config)
+
+
+def _run_task(function, args, capture:bool=False):
+    ''' Run function(*args) and return (result, error, output).
+    :param capture: capture the console output (worker process), colors are kept and reset after each write.
+    '''
+    buffer = io.StringIO()
+    stream = AnsiToWin32(buffer, convert=False, strip=False, autoreset=True).stream
+    result = None
+    error = None
+
+    with contextlib.ExitStack() as stack:
+        if capture:
+            stack.enter_context(contextlib.redirect_stdout(stream))
+        try:
+            result = function(*args)
+        except Exception:
+            error = traceback.format_exc()
+
+    return result, error, buffer.getvalue()
+
+
+class _ThreadOutput():
+    ''' sys.stdout used by run_pipeline() : each thread writes into the buffer of the file it is
+    processing (set_buffer), the console is used when no buffer is set.
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def set_buffer(self, buffer):
+        self._local.buffer = buffer
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        if getattr(self._local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def isatty(self):
+        return getattr(self._local, 'buffer', None) is None and self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _print_task_header(index:int, total:int, title:str):
+    print(f"{Fore.BLACK}{Back.WHITE}\n\n[{index+1}/{total}] Processing File : {title}\n")
+
+
+def _print_task_error(title:str, error:str):
+    print(f"{Fore.RED}\nProcessing failed for '{title}' !\nError Message :\n{error}")
+
+
+def run_batch(function, args_list:list, titles:list, workers:int=1, config=None, stages:tuple=None):
+    ''' Run function(*args) for each args of args_list and return a list of TaskResult (same order).
+    :param titles: name printed in the header of each task.
+    :param workers: number of worker processes, 1 : run in the current process (live console output).
+    :param config: settings.Config sent once to each worker process.
+    :param stages: (load, compute, write) functions doing the same as function (see run_pipeline),
+                   used with workers == 1 and several files.
+    '''
+    total = len(args_list)
+    task_results = []
+
+    if workers <= 1 and total > 1 and stages is not None:
+        if config is not None and config.instrumentation_memory:
+            # tracemalloc is global to the process : the pipeline threads would reset the peak of each other
+            print(f"{Fore.RED}'instrumentation_memory' is disabled with the pipeline (set 'pipeline = no' to measure the peak memory of each stage)")
+            config.instrumentation_memory = False
+        return run_pipeline(stages, args_list, titles)
+
+    if workers <= 1 or total <= 1:
+        for i, args in enumerate(args_list):
+            _print_task_header(i, total, titles[i])
+            result, error, _ = _run_task(function, args)
+            if error:
+                _print_task_error(titles[i], error)
+            task_results.append(TaskResult(i, titles[i], result, error))
+        return task_results
+
+    print(f"\nProcessing {total} files with {min(workers, total)} workers ...")
+    with ProcessPoolExecutor(max_workers=min(workers, total), initializer=_init_worker, initargs=(config,)) as executor:
+        futures = [executor.submit(_run_task, function, args, True) for args in args_list]
+
+        for i, future in enumerate(futures):    # print in the files order
+            try:
+                result, error, output = future.result()
+            except Exception:   # worker process crashed / arguments not picklable
+                result, error, output = None, traceback.format_exc(), ''
+
+            _print_task_header(i, total, titles[i])
+            print(output, end='')
+            if error:
+                _print_task_error(titles[i], error)
+            task_results.append(TaskResult(i, titles[i], result, error))
+
+    return task_results
+
+
+
+def run_pipeline(stages:tuple, args_list:list, titles:list, queue_size:int=1):
+    ''' Run write(compute(load(*args))) for each args of args_list and return a list of TaskResult (same order).
+    load and write run in their own thread, compute in the current thread : the 3 stages of 3 consecutive
+    files overlap. queue_size : files waiting between 2 stages (the loader blocks when the queue is full).
+    '''
+    load, compute, write = stages
+    total = len(args_list)
+    loaded = queue.Queue(maxsize=queue_size)
+    computed = queue.Queue(maxsize=queue_size)
+    buffers = [io.StringIO() for _ in range(total)]
+    streams = [AnsiToWin32(buffer, convert=False, strip=False, autoreset=True).stream for buffer in buffers]
+    results = [None] * total
+    errors = [None] * total
+    done = [threading.Event() for _ in range(total)]
+    stop = threading.Event()
+    output = _ThreadOutput(sys.stdout)
+
+    def run_stage(i, function, value):
+        output.set_buffer(streams[i])
+        try:
+            return function(*value) if function is load else function(value)
+        except Exception:
+            errors[i] = traceback.format_exc()
+        finally:
+            output.set_buffer(None)
+
+    def loader():
+        for i, args in enumerate(args_list):
+            if stop.is_set():
+                break
+            loaded.put((i, run_stage(i, load, args)))
+        loaded.put(None)
+
+    def writer():
+        while True:
+            item = computed.get()
+            if item is None:
+                break
+            i, context = item
+            if errors[i] is None:
+                results[i] = run_stage(i, write, context)
+            done[i].set()
+
+    print(f"\nProcessing {total} files (pipeline : load / compute / write) ...")
+    task_results = []
+
+    def print_done_tasks(wait:bool=False):
+        # outputs printed in the files order, as soon as the file is written
+        while len(task_results) < total and (wait or done[len(task_results)].is_set()):
+            i = len(task_results)
+            done[i].wait()
+            _print_task_header(i, total, titles[i])
+            print(buffers[i].getvalue(), end='')
+            if errors[i]:
+                _print_task_error(titles[i], errors[i])
+            task_results.append(TaskResult(i, titles[i], results[i], errors[i]))
+
+    threads = [threading.Thread(target=loader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    stdout = sys.stdout
+    sys.stdout = output
+    try:
+        for thread in threads:
+            thread.start()
+        while True:
+            item = loaded.get()
+            if item is None:
+                break
+            i, context = item
+            if errors[i] is None:
+                context = run_stage(i, compute, context)
+            computed.put((i, context))
+            print_done_tasks()
+        computed.put(None)
+        print_done_tasks(wait=True)
+    finally:
+        stop.set()
+        sys.stdout = stdout
+    return task_results
+
+
+def print_batch_summary(task_results:list):
+    ''' Print one row per channel : each TaskResult.result is a list of dict returned by
+    data_analysis.get_delta_summary() '''
+    from prettytable import PrettyTable
+    table = PrettyTable(['index', 'File Name', 'Channel', 'Δt Raw (ms)', 'Δt Filtred (ms)', 'Status'])
+    table.align['File Name'] = 'l'
+
+    for task in task_results:
+        if task.error:
+            table.add_row([task.index, task.title, '-', '-', '-', f'{Fore.RED}FAILED{Fore.RESET}'])
+            continue
+        for summary in task.result:
+            table.add_row([task.index, task.title, summary['channel'], f"{summary['delta_time']:.2f}",
+                           f"{summary['delta_time_filtred']:.2f}", f'{Fore.GREEN}OK{Fore.RESET}'])
+
+    failed = sum(1 for task in task_results if task.error)
+    print(f"\n\n{'-'*46}   Batch Summary   {'-'*46}\n")
+    print(table)
+    if failed:
+        print(f"{Fore.RED}{failed}/{len(task_results)} file(s) failed !")
+
+
+def write_batch_report(task_results:list, report_path, config=None):
+    ''' Write the JSON report of the batch : parameters + one entry per channel with the Delta times
+    and the measured stages (wall / CPU time, samples/s, peak memory) of data_analysis.get_delta_summary()
+    '''
+    files = []
+    for task in task_results:
+        if task.error:
+            files.append({'index': task.index, 'title': task.title, 'status': 'failed', 'error': task.error})
+            continue
+        for summary in task.result:
+            files.append(dict({'index': task.index, 'title': task.title, 'status': 'ok'}, **summary))
+
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'config': {key: getattr(config, key) for key in settings.SETTINGS} if config is not None else None,
+        'files': files,
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
@@ -0,0 +1,191 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   On-disk results cache used by CSV_Object (enabled with 'cache' in config.ini).
+                    The entries are content-addressed : the key is a hash of the CSV file contents
+                    plus the parameters used by each processing stage.
+
+                    Stages :
+                        - data  : '<key>.npz'  times, calibrated values, filtred values + header fields
+                                  key = CSV contents + dtype, calibration, filter parameters
+                        - delta : '<key>.json' Delta / DeltaFiltred results (+ events, auto thresholds)
+                                  key = data key + thresholds
+                        - output : '<key>.json' generated files (Excel, figures, columnar file) and their mtime
+                                  key = delta key + the parameters changing the file contents (events,
+                                  charts points, dpi, format ...), see CSV_Object._get_output_cache_key()
+                    So changing a threshold only recomputes the delta stage (no parsing, no filtering),
+                    and a generated file is only skipped if it was written with the same parameters.
+
+                    The hash of each CSV file is remembered with its size and mtime ('paths' dir),
+                    the file is only read again when it changed.
+                    The cache size is limited (cache_max_size_mb) : the least recently used entries
+                    are removed first.
+
+Class           :
+    - ResultCache(cache_dir:str, max_size_mb:float=2048)
+        - content_hash(file_path)
+        - make_key(*parts)
+        - load_data(key) / store_data(key, times, values, values_filtred, header:dict)
+        - load_delta(key) / store_delta(key, delta:dict, delta_filtred:dict, events:dict=None, thresholds:list=None)
+        - is_output_up_to_date(key, output_path) / record_output(key, output_path)
+        - evict()
+
+'''
+
+import os, json, hashlib, tempfile
+import numpy as np
+from api import archives
+
+
+CACHE_VERSION = 1   # increase when the processing results change : old entries are not used anymore
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class ResultCache():
+    def __init__(self, cache_dir:str, max_size_mb:float=2048):
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.paths_dir = os.path.join(cache_dir, 'paths')
+        self._dirs_created = False     # the directories are created with the first entry
+
+    # Keys :   ---------------------------------------------------
+
+    def content_hash(self, file_path):
+        ''' Hash of the file contents (stored bytes : compressed for a '.gz' file), only computed again
+        if the file size or mtime changed '''
+        file_path = os.path.abspath(file_path)
+        stat = archives.get_stat(file_path)
+        path_entry = os.path.join(self.paths_dir, hashlib.sha1(file_path.encode()).hexdigest() + '.json')
+
+        entry = self._read_json(path_entry)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+
+        digest = hashlib.blake2b(digest_size=20)
+        with archives.open_binary(file_path) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        self._write_json(path_entry, {'path': file_path, 'size': stat.st_size,
+                                      'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()})
+        return digest.hexdigest()
+
+    def make_key(self, *parts):
+        text = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    # Data stage :   ---------------------------------------------
+
+    def load_data(self, key):
+        ''' Return (times, values, values_filtred, header) or None '''
+        path = os.path.join(self.cache_dir, key + '.npz')
+        try:
+            with np.load(path) as data:
+                entry = (data['times'], data['values'], data['values_filtred'], json.loads(str(data['header'])))
+        except (OSError, KeyError, ValueError):
+            return None
+        self._touch(path)
+        return entry
+
+    def store_data(self, key, times, values, values_filtred, header:dict):
+        path = os.path.join(self.cache_dir, key + '.npz')
+        self._atomic_write(path, lambda f: np.savez(f, times=times, values=values, values_filtred=values_filtred,
+                                                    header=np.array(json.dumps(header))))
+        self.evict()
+
+    # Delta stage :   --------------------------------------------
+
+    def load_delta(self, key):
+        ''' Return {'delta', 'delta_filtred', 'events', 'thresholds'} (None if not stored) or None '''
+        path = os.path.join(self.cache_dir, key + '.json')
+        entry = self._read_json(path)
+        if entry is None or 'delta' not in entry:
+            return None
+        self._touch(path)
+        return {name: entry.get(name) for name in ('delta', 'delta_filtred', 'events', 'thresholds')}
+
+    def store_delta(self, key, delta:dict, delta_filtred:dict, events:dict=None, thresholds:list=None):
+        path = os.path.join(self.cache_dir, key + '.json')
+        content = {'delta': delta, 'delta_filtred': delta_filtred}
+        if events is not None:
+            content['events'] = events
+        if thresholds is not None:
+            content['thresholds'] = thresholds
+        self._write_json(path, content)
+        self.evict()
+
+    # Output stage :   -------------------------------------------
+
+    def is_output_up_to_date(self, key, output_path):
+        ''' True if output_path was generated with this output key and not modified since '''
+        entry = self._read_json(os.path.join(self.cache_dir, key + '.json'))
+        if entry is None:
+            return False
+        mtime_ns = entry.get('outputs', {}).get(os.path.abspath(output_path))
+        try:
+            return mtime_ns is not None and os.stat(output_path).st_mtime_ns == mtime_ns
+        except OSError:
+            return False
+
+    def record_output(self, key, output_path):
+        path = os.path.join(self.cache_dir, key + '.json')
+        entry = self._read_json(path) or {}
+        entry.setdefault('outputs', {})[os.path.abspath(output_path)] = os.stat(output_path).st_mtime_ns
+        self._write_json(path, entry)
+
+    # Size limit :   ---------------------------------------------
+
+    def evict(self):
+        ''' Remove the least recently used entries until the cache size is below max_size '''
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()  # oldest first
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:   # already removed by another process
+                pass
+            total_size -= size
+
+    # Files :   --------------------------------------------------
+
+    def _touch(self, path):
+        try:
+            os.utime(path)  # mtime = last use (LRU eviction)
+        except OSError:
+            pass
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, content:dict):
+        self._atomic_write(path, lambda f: f.write(json.dumps(content).encode()))
+
+    def _atomic_write(self, path, write_function):
+        if not self._dirs_created:
+            os.makedirs(self.paths_dir, exist_ok=True)
+            self._dirs_created = True
+        # write to a temporary file then rename : the parallel workers never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_function(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,200 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Acquisitions catalog of a CSV directory (enabled with 'catalog' in config.ini) :
+                    a SQLite file indexing each CSV file with its acquisition date and channel
+                    (from the file name), its header fields, its size / mtime and its Ch1 / Ch2 pair.
+
+                    The catalog is updated incrementally. Each update() lists the directory once
+                    (os.scandir + the size / mtime of each CSV file and zip archive, no file opened) :
+                    if nothing changed (no file added, removed, renamed or overwritten in place, no
+                    member added to an archive), nothing else is read. Otherwise the archives are
+                    listed again and only the header of the new or changed files is read. The files
+                    lists (all files, Ch1/Ch2 pairs, a date range or a channel) are SQL queries.
+
+Functions       :
+    - parse_file_name(file_name:str)
+
+Class           :
+    - AcquisitionCatalog(directory:str, catalog_file:str='.catalog.sqlite')
+        - update(force:bool=False)
+        - list_file_names(combined:bool=False, date_from=None, date_to=None, channel:int=None)
+        - get_entry(file_name:str)
+        - close()
+
+'''
+
+import os, csv, json, hashlib, sqlite3
+from datetime import datetime
+from api import archives
+
+
+CATALOG_VERSION = 2     # increase when the tables change : the catalog is rebuilt
+
+HEADER_FIELDS = (('record_length', int), ('sample_interval', float), ('trigger_point', int),
+                 ('trigger_time', float), (None, None), ('horizontal_offset', float))    # rows 0-5, column 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    file_name TEXT PRIMARY KEY,
+    acquisition TEXT,           -- file name without 'Ch<n>.csv' : same value for the files of one acquisition
+    channel INTEGER,
+    aquisition_date TEXT,       -- 'YYYY-MM-DD'
+    size INTEGER,
+    mtime_ns INTEGER,
+    record_length INTEGER,
+    sample_interval REAL,
+    trigger_point INTEGER,
+    trigger_time REAL,
+    horizontal_offset REAL
+);
+CREATE INDEX IF NOT EXISTS files_acquisition ON files (acquisition, channel);
+CREATE INDEX IF NOT EXISTS files_date ON files (aquisition_date, channel);
+'''
+
+
+def parse_file_name(file_name:str):
+    ''' (acquisition date, channel number) of an 'Oscilator' file name : 'YYYYMMDD..._Ch<n>.csv'.
+    Raise ValueError if the name does not follow this layout.
+    '''
+    file_name = archives.get_csv_name(file_name)   # 'X_Ch1.csv.gz', 'bundle.zip/X_Ch1.csv' : 'X_Ch1.csv'
+    aquisition_date = datetime.strptime(file_name[:8], '%Y%m%d')
+    channel_number = int(file_name[-5:-4])
+    return aquisition_date, channel_number
+
+
+class AcquisitionCatalog():
+    def __init__(self, directory:str, catalog_file:str='.catalog.sqlite'):
+        self.directory = directory
+        self.catalog_path = os.path.join(directory, catalog_file)
+        os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+
+        self.connection = sqlite3.connect(self.catalog_path)
+        if self._get_meta('version') != str(CATALOG_VERSION):
+            self.connection.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS meta;')
+        self.connection.executescript(_SCHEMA)
+        self._set_meta('version', CATALOG_VERSION)
+        self.connection.commit()
+
+
+    def update(self, force:bool=False):
+        ''' Add the new / changed files, remove the deleted ones. Return the number of updated entries.
+        The directory is always listed once (see _get_directory_state()), the archives are only opened
+        and the headers read if the directory state changed (or force).
+        '''
+        directory_state = self._get_directory_state()
+        if not force and self._get_meta('directory_state') == directory_state:
+            return 0
+
+        files = dict(archives.list_captures(self.directory))    # '.csv', '.csv.gz' and zip members
+        known = {row[0]: (row[1], row[2]) for row in self.connection.execute('SELECT file_name, size, mtime_ns FROM files')}
+
+        removed = [(file_name,) for file_name in known if file_name not in files]
+        changed = [self._make_row(file_name, stat) for file_name, stat in files.items()
+                   if known.get(file_name) != (stat.st_size, stat.st_mtime_ns)]
+
+        with self.connection:   # one transaction
+            self.connection.executemany('DELETE FROM files WHERE file_name = ?', removed)
+            self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?)', changed)
+            self._set_meta('directory_state', directory_state)
+        return len(removed) + len(changed)
+
+    def _get_directory_state(self):
+        ''' Hash of the directory mtime and of the size / mtime of its CSV files and zip archives
+        (one directory listing, no file opened)
+        '''
+        state = [os.stat(self.directory).st_mtime_ns]
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and (archives.is_capture_name(entry.name) or entry.name.lower().endswith(archives.ARCHIVE_EXTENSION)):
+                    stat = entry.stat()
+                    state.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        state[1:] = sorted(state[1:])
+        return hashlib.sha1(json.dumps(state).encode()).hexdigest()
+
+
+    def list_file_names(self, combined:bool=False, date_from=None, date_to=None, channel:int=None):
+        ''' Sorted list of the file names, (file_name_ch1, file_name_ch2) tuples if combined
+        (the Ch1 files without Ch2 file are returned as (file_name_ch1, None)).
+        :param date_from, date_to: acquisition dates range (datetime / date, both included)
+        :param channel: only the files of this channel (not combined)
+        '''
+        conditions, parameters = [], []
+        if date_from is not None:
+            conditions.append('a.aquisition_date >= ?')
+            parameters.append(date_from.strftime('%Y-%m-%d'))
+        if date_to is not None:
+            conditions.append('a.aquisition_date <= ?')
+            parameters.append(date_to.strftime('%Y-%m-%d'))
+
+        if combined:
+            conditions.append('a.channel = 1')
+            query = '''SELECT a.file_name, b.file_name FROM files a
+                       LEFT JOIN files b ON b.acquisition = a.acquisition AND b.channel = 2'''
+        else:
+            if channel is not None:
+                conditions.append('a.channel = ?')
+                parameters.append(channel)
+            query = 'SELECT a.file_name FROM files a'
+
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        rows = self.connection.execute(query + ' ORDER BY a.file_name', parameters).fetchall()
+        if combined:
+            return [tuple(row) for row in rows]
+        return [row[0] for row in rows]
+
+
+    def get_entry(self, file_name:str):
+        ''' Catalog fields of a file (dict), None if the file is not in the catalog '''
+        cursor = self.connection.execute('SELECT * FROM files WHERE file_name = ?', (file_name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip((column[0] for column in cursor.description), row))
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def _make_row(self, file_name:str, stat):
+        acquisition = aquisition_date = channel_number = None
+        name = archives.strip_extension(file_name)
+        if name[-3:-1] == 'Ch' and name[-1].isdigit():    # paired as in v1.1 : same name + 'Ch1' / 'Ch2' (same archive)
+            acquisition = name[:-3]
+            channel_number = int(name[-1])
+        try:
+            aquisition_date = parse_file_name(file_name)[0].strftime('%Y-%m-%d')
+        except ValueError:
+            pass    # listed, but not selectable by date
+        header = self._read_header(os.path.join(self.directory, file_name))
+        return (file_name, acquisition, channel_number, aquisition_date, stat.st_size, stat.st_mtime_ns) + header
+
+    def _read_header(self, file_path):
+        ''' Header fields of a CSV file (None for a missing or wrong field), see CSV_Object.read_csv_header() '''
+        values = [None] * len(HEADER_FIELDS)
+        try:
+            with archives.open_text(file_path) as csvfile:
+                for i, row in zip(range(len(HEADER_FIELDS)), csv.reader(csvfile)):
+                    name, value_type = HEADER_FIELDS[i]
+                    try:
+                        values[i] = value_type(row[1]) if name is not None else None
+                    except (IndexError, ValueError):
+                        pass
+        except (OSError, UnicodeDecodeError, KeyError, EOFError):   # KeyError : member removed from the archive
+            pass
+        return tuple(value for (name, _), value in zip(HEADER_FIELDS, values) if name is not None)
+
+    def _get_meta(self, key:str):
+        try:
+            row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        except sqlite3.OperationalError:    # new catalog file
+            return None
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key:str, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
@@ -20,6 +20,78 @@ Actual Version  : 1.1
 
 Changelog:
 
+v1.2:
+    - CSV_Object stores 'times', 'values' and 'values_filtred' as contiguous numpy arrays
+      (float64 by default, float32 optional with 'dtype' in config.ini).
+      The per-sample 'data' list of dict is removed.
+    - Delta uses __slots__.
+    - calibrate_data() is vectorized.
+    - Added apply_filter() using the new 'filters' module : running sums SMA (linear cost,
+      independent of N), EMA, moving median and Savitzky-Golay selected from config.ini.
+      apply_moving_average() keeps the v1.1 SMA results (bit-for-bit with 'filter_exact').
+    - _extract_indexes() uses the new 'detection' module : vectorized threshold crossing
+      detection with an optional early exit scan from each end of the signal ('early_exit_scan').
+    - Added get_delta_summary(obj) used by the parallel batch executor ('batch' module).
+    - get_file_names_list() is split into list_file_names(), print_file_names_list() and
+      select_files() (same selection syntax + glob patterns) for the non-interactive mode.
+    - Content-addressed results cache ('cache' module) : parsed + filtred data and Delta results
+      are stored per CSV contents + parameters, generated files are skipped when up to date
+      (output key : Delta results + the parameters of the file, see _get_output_cache_key()).
+    - Streaming mode ('streaming' module) for captures larger than the RAM : the CSV file is read
+      by chunks, the filter and the Delta time are computed online. times / values / values_filtred
+      then hold decimated data (min/max per block) used for the figures and the Excel file.
+    - Added read_csv_header(). The Excel / chart loops use len(times) instead of record_length.
+    - Binary sidecar files ('sidecar' module) : each CSV file is converted once, the next runs
+      open the sidecar with a memory mapping instead of parsing the CSV file (not used with the
+      cache, nor for the '.csv.gz' files and the zip members).
+    - generate_excel() and generate_excel_combined() write the workbooks in 'constant_memory' mode,
+      one write_row() per sample with the number formats set on the columns. The combined charts
+      use a decimated 'Chart Data' sheet (min/max per block, 'excel_chart_points' in config.ini).
+      New signatures :
+        - _write_header_cell_sheet_data(worksheet, cell_format_header, cell_format_time, cell_format_voltage, cell_format_current)
+        - _write_delta_time_info_to_sheet_charts(worksheet_charts, obj, row:int, cell_format_header, cell_format_voltage, cell_format_time)
+        - add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred:bool=False, width:int=0, height:int=450, sheet_name:str='Data', rows:int=0)
+          (sheet_name / rows : the 'Chart Data' sheet or the first data sheet used by the charts)
+    - create_plot_data() only draws the first / min / max / last samples of each pixel column of
+      the image ('plot_decimation' in config.ini) : same figure, cost bounded by the image width.
+    - Added create_figures() : the 4 figures of a channel are drawn with one figure and one Agg
+      canvas ('figures' module), each series is rendered once and the Delta time lines are drawn
+      on top of it (2 full renders per channel instead of 4).
+    - config.ini is read and validated once per run ('settings' module) : CSV_Object takes its
+      parameters from a settings.Config object with apply_config() (typed per channel profiles,
+      command line overrides). The processed dir is created with the first generated file.
+    - matplotlib, xlsxwriter and prettytable are imported by the functions using them (faster start
+      for the delta only runs and the files listing).
+    - Per stage measurements ('instrumentation' module) : parse, calibrate, filter (stream), delta,
+      plot and excel are timed (+ peak memory optional), see print_stage_info() and get_delta_summary().
+      The Excel rows and the streaming chunks report their progress at most every 'progress_interval' s.
+    - list_file_names() reads the files list from the acquisitions catalog ('catalog' module, SQLite
+      file updated incrementally) and can select the files by acquisition date range and channel.
+    - CSV_Object(timebase=...) : the channels of one acquisition share the 'times' array of the first
+      channel, only the value column is parsed ('acquisition' module : Acquisition of N channels with
+      an alignment check of the header fields).
+    - Multi event detection ('event_detection' in config.ini) : every low / high transition of the raw
+      and filtred values (detection.find_events(), hysteresis between the thresholds) is stored in
+      'events' / 'events_filtred' (structured arrays) and shown in the console, the 'Charts' sheet
+      and the figures with the Delta time lines. Delta / DeltaFiltred are unchanged.
+    - Automatic thresholds ('auto_threshold' in config.ini, 'thresholds' module) : the thresholds are
+      set between the low / high signal levels (histogram modes) by calculate_delta_time(), printed
+      with the Delta time info and stored in the cache with the Delta results.
+    - The Excel data is split on several sheets ('Data', 'Data (2)', ...) when a record is longer
+      than an Excel worksheet (EXCEL_MAX_ROWS). Added generate_columnar_export() : columnar binary
+      file of the processed data + Delta results ('export' module : npz, Parquet or HDF5).
+    - Added calculate_spectrum() ('spectral_analysis' in config.ini, 'spectrum' module) : Welch PSD of
+      the raw and filtred values (sample_interval of the header, window / segment / overlap options),
+      the dominant frequencies are printed with the Delta time info and written in the 'Charts' sheet
+      (combined) or a 'Spectrum' sheet.
+    - plot_show() opens the interactive viewer ('viewer' module) : min/max level of detail pyramid of
+      the raw / filtred values, the level matching the visible range is drawn on each zoom / pan,
+      with the Delta time and events markers.
+    - Compressed / archived captures ('archives' module) : '.csv.gz' files and zip members
+      ('bundle.zip/X_Ch1.csv') are read as streams by load_csv_data(), read_csv_header() and the
+      streaming mode, and listed (Ch1 / Ch2 pairs in the same archive) by list_file_names().
+      file_name is the name of the CSV file ('X_Ch1.csv'), directory the directory of the archive.
+
 v1.1:
     - Multiple changes to enhence console display info
 
@@ -58,44 +130,90 @@ v1.0:
 '''
 
 
-import os, csv, xlsxwriter
-import matplotlib.pyplot as plt
-from datetime import datetime
-import statistics, progressbar
+import os, csv, fnmatch, functools, sqlite3
+import numpy as np
 from colorama import Fore, Back, Style, init
 init(autoreset=True)
-from prettytable import PrettyTable
-import configparser
+from api import settings, filters, detection, thresholds, cache, streaming, sidecar, decimation, instrumentation, catalog, archives, export, spectrum
+# matplotlib (figures), xlsxwriter (excel) and prettytable (console tables) are imported by the
+# functions using them : a run without figures / Excel file does not load them
+
+PROGRESS_ROWS = 16384  # Excel rows written between two progress updates
+EXCEL_MAX_ROWS = 1048576    # rows of an Excel worksheet (header included) : longer records use several data sheets
+EVENTS_PRINT_MAX = 10   # events printed in the console for each series (all of them are in the Excel file)
+EVENTS_FIRST_ROW = 56   # 'Charts' sheet : events table below the 2 charts (then the dominant frequencies table)
 
 # CSV CLASS : ################################################################################
 
+def _measured_stage(name:str):
+    ''' Decorator : the method is measured as stage 'name' of self.instrumentation '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.stage(name, self._count_samples):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class Delta():
-    delta_time = None
-    idx_start = None
-    time_start = None
-    value_start = None
-    idx_end = None
-    time_end = None
-    value_end = None
-        
+    __slots__ = ('delta_time', 'idx_start', 'time_start', 'value_start', 'idx_end', 'time_end', 'value_end')
+
+    def __init__(self):
+        self.delta_time = None
+        self.idx_start = None
+        self.time_start = None
+        self.value_start = None
+        self.idx_end = None
+        self.time_end = None
+        self.value_end = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def update(self, values:dict):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
 class CSV_Object():
-    def __init__(self, file_path, delimiter:str=',', calibration_value:float=1, combined_flag:bool=False):
+    def __init__(self, file_path, delimiter:str=',', calibration_value:float=1, combined_flag:bool=False, config=None, timebase=None):
         self.file_path = file_path
-        self.file_name = os.path.basename(self.file_path)
-        self.directory = os.path.dirname(self.file_path)
+        self.file_name = archives.get_csv_name(self.file_path)     # 'X_Ch1.csv' for 'X_Ch1.csv.gz' / 'bundle.zip/X_Ch1.csv' too
+        self.directory = archives.get_directory(self.file_path)
         self.processed_dir = None
         self.delimiter = delimiter
         self.calibration_value = calibration_value
-        self.data = []      # List of 'dict' type elements --> data = [{'time':time, 'value':value}, ...]
-        self.times = []     # List of 'float' type elements
-        self.values = []    # List of 'float' type elements
+        self.dtype = 'float64'  # numpy dtype of the samples : 'float64' or 'float32'
+        self.times = np.empty(0)    # numpy array of 'dtype' elements
+        self.values = np.empty(0)   # numpy array of 'dtype' elements
         self.combined_flag = combined_flag
+        self.timebase = timebase    # 'times' of another channel of the same acquisition : the time column is not parsed
 
         self.N = None
-        self.values_filtred = []  # used to store the filtred values
+        self.filter_type = 'sma'    # 'sma', 'ema', 'median' or 'savgol'
+        self.filter_exact = False   # exact SMA : same results as v1.1 (statistics.mean)
+        self.savgol_polyorder = 2
+        self.values_filtred = np.empty(0)  # used to store the filtred values
         self.threshold_low = None
         self.threshold_high = None
+        self.auto_threshold = False     # thresholds estimated from the signal levels ('auto_threshold' in config.ini)
+        self.auto_threshold_low = 10    # % between the low and the high signal levels
+        self.auto_threshold_high = 90
+        self.early_exit_scan = True     # scan the signal by chunks from each end (stop at the first match)
         self.delta_time = None
+        self.event_detection = False    # detect every transition ('event_detection' in config.ini)
+        self.events = np.empty(0, dtype=detection.EVENT_DTYPE)            # transitions of the raw values
+        self.events_filtred = np.empty(0, dtype=detection.EVENT_DTYPE)    # transitions of the filtred values
+        self.spectral_analysis = False  # PSD + dominant frequencies ('spectral_analysis' in config.ini)
+        self.spectrum_window = 'hann'
+        self.spectrum_segment = 4096    # samples per Welch segment
+        self.spectrum_overlap = 50      # % of overlap between two segments
+        self.spectrum_peaks = 5         # dominant frequencies reported
+        self.spectrum_frequencies = np.empty(0)     # Hz
+        self.psd = np.empty(0)          # power spectral density of the raw values (unit² / Hz)
+        self.psd_filtred = np.empty(0)  # power spectral density of the filtred values
+        self.peaks = np.empty(0, dtype=spectrum.PEAK_DTYPE)           # dominant frequencies of the raw values
+        self.peaks_filtred = np.empty(0, dtype=spectrum.PEAK_DTYPE)   # dominant frequencies of the filtred values
 
         self.aquisition_date = None
         self.channel_number = None
@@ -110,62 +228,108 @@ class CSV_Object():
         self.Delta = Delta()
         self.DeltaFiltred = Delta()
 
+        self.streaming = False      # streaming mode : read the CSV file by chunks ('streaming' in config.ini)
+        self.chunk_rows = 1000000
+        self.decimation_points = 20000
+        self.excel_chart_points = 20000     # rows of the decimated 'Chart Data' sheet (0 : charts use all the rows)
+        self.plot_decimation = True         # draw only the samples visible at the image resolution
+        self.columnar_format = 'none'       # columnar export : 'npz', 'parquet', 'hdf5' or 'none' ('export' module)
+
+        self.sidecar_dir = None     # binary sidecar files directory, enabled with 'sidecar' in config.ini
+
+        self.cache = None           # cache.ResultCache, enabled with 'cache' in config.ini
+        self._content_hash = None
+        self._cached_filter = None  # filter type of 'values_filtred' restored from the cache
+
+        self.instrumentation = instrumentation.Instrumentation(enabled=False)   # per stage measurements
+        self.progress_interval = 0.5
+
         self.extract_info_from_file_name()
-        self.read_default_parameters_from_ini()
-        self.load_csv_data()
-        self.calibrate_data()
+        self.apply_config(config if config is not None else settings.get_config())
+        if self.streaming:
+            self.read_csv_header()  # the data is read by apply_filter()
+            return
+
+        with self.instrumentation.stage('parse', self._count_samples):
+            from_cache = self._load_data_from_cache()
+            if not from_cache and not self._load_data_from_sidecar():
+                self.load_csv_data()
+                self._write_sidecar()
+            if self.timebase is not None:
+                self.times = self.timebase
+        if not from_cache:
+            with self.instrumentation.stage('calibrate', self._count_samples):
+                self.calibrate_data()
 
     def extract_info_from_file_name(self):
-        # Extract Aquisition Date :
-        aquisition_date_str = self.file_name[:8]
-        self.aquisition_date = datetime.strptime(aquisition_date_str, '%Y%m%d')
-
-        # Extract Channel Number :
-        self.channel_number = int(self.file_name[-5:-4])
+        # Extract Aquisition Date + Channel Number (same parsing as the acquisitions catalog) :
+        self.aquisition_date, self.channel_number = catalog.parse_file_name(self.file_name)
 
 
     def read_default_parameters_from_ini(self):
-        config = configparser.ConfigParser()
-        src_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        ini_path = os.path.join(src_dir_path, 'config.ini')
-        config.read(ini_path)
-        
-        self.N = int(config['DEFAULT'].get('N'))
-        self.processed_dir = config['DEFAULT'].get('processed_dir')
+        ''' Read config.ini again and apply its parameters (the objects use settings.get_config() by default) '''
+        self.apply_config(settings.load_config())
+
+    def apply_config(self, config):
+        ''' Set the parameters from a settings.Config object : no file read, no directory created '''
+        channel = config.get_channel(self.channel_number)
+
+        self.N = channel.N
+        self.dtype = config.dtype
+        self.filter_type = config.filter_type
+        self.filter_exact = config.filter_exact
+        self.savgol_polyorder = config.savgol_polyorder
+        self.early_exit_scan = config.early_exit_scan
+        self.event_detection = config.event_detection
+        self.auto_threshold = config.auto_threshold
+        self.auto_threshold_low = config.auto_threshold_low
+        self.auto_threshold_high = config.auto_threshold_high
+        self.spectral_analysis = config.spectral_analysis
+        self.spectrum_window = config.spectrum_window
+        self.spectrum_segment = config.spectrum_segment
+        self.spectrum_overlap = config.spectrum_overlap
+        self.spectrum_peaks = config.spectrum_peaks
+
+        self.streaming = config.streaming
+        self.chunk_rows = config.chunk_rows
+        self.decimation_points = config.decimation_points
+        self.excel_chart_points = config.excel_chart_points
+        self.plot_decimation = config.plot_decimation
+        self.columnar_format = config.columnar_format
+
+        self.instrumentation = instrumentation.Instrumentation(config.instrumentation, config.instrumentation_memory)
+        self.progress_interval = config.progress_interval
+
+        if config.cache and not self.streaming:
+            self.cache = cache.ResultCache(os.path.join(self.directory, config.cache_dir), max_size_mb=config.cache_max_size_mb)
+
+        # The cache already holds the parsed data : no sidecar with the cache, and no uncompressed copy of a compressed capture
+        if config.sidecar and self.cache is None and not archives.is_compressed(self.file_path):
+            self.sidecar_dir = os.path.join(self.directory, config.sidecar_dir)
         
+        # The processed dir is created with the first generated file (see _create_processed_dir)
         if self.combined_flag:
-            self.processed_dir = os.path.join(self.processed_dir, self.file_name[:-8])
+            self.processed_dir = os.path.join(config.processed_dir, self.file_name[:-8])
         else:
-            self.processed_dir = os.path.join(self.processed_dir, self.file_name[:-4])
-        
-        # Create processed dir :
+            self.processed_dir = os.path.join(config.processed_dir, self.file_name[:-4])
+
+        self.calibration_value = channel.calibration_value
+        self.threshold_low = channel.threshold_low
+        self.threshold_high = channel.threshold_high
+
+    def _create_processed_dir(self):
         create_dir(self.directory, dir_name=self.processed_dir)
 
-        if self.channel_number == 1:
-            self.calibration_value = float(config['DEFAULT'].get('calibration_value_ch1'))
-            self.threshold_low = float(config['DEFAULT'].get('threshold_low_ch1'))
-            self.threshold_high = float(config['DEFAULT'].get('threshold_high_ch1'))
-        else:
-            self.calibration_value = float(config['DEFAULT'].get('calibration_value_ch2'))
-            self.threshold_low = float(config['DEFAULT'].get('threshold_low_ch2'))
-            self.threshold_high = float(config['DEFAULT'].get('threshold_high_ch2'))
+    def _count_samples(self):
+        ''' Samples processed by a stage (instrumentation) : the record length (header), else the loaded samples '''
+        return self.record_length or len(self.values)
 
-    def load_csv_data(self):
-        with open(self.file_path, newline = '') as csvfile:
+    def read_csv_header(self):
+        with archives.open_text(self.file_path) as csvfile:
             csv_reader = csv.reader(csvfile, delimiter = self.delimiter)
 
             # Get File Info :
             for i, row in enumerate(csv_reader):
-                time    = float(row[3])
-                value   = float(row[4])
-
-                self.data.append({
-                                'time':time,
-                                'value':value
-                            })
-                self.times.append(time)
-                self.values.append(value)
-
                 if i == 0:
                     try:
                         self.record_length = int(row[1])     # Points
@@ -202,65 +366,155 @@ class CSV_Object():
                         self.horizontal_offset = float(row[1])   # s
                     except Exception as e:
                         print(f"{Fore.RED}Could not convert 'horizontal_offset' !\nError Message : {e}")
+                    break
+
+    def load_csv_data(self):
+        self.read_csv_header()
 
-                if i == 6:
-                    break  
+        if self.timebase is not None:   # shared times (acquisition.Acquisition) : only the value column is parsed
+            with archives.open_csv_source(self.file_path) as source:
+                self.values = np.loadtxt(source, delimiter=self.delimiter, usecols=4, dtype=self.dtype, ndmin=1)
+            self.times = self.timebase
+            return
 
-            # Extract Data :        
-            for i, row in enumerate(csv_reader):
-                time    = float(row[3])
-                value   = float(row[4])
-                self.data.append({
-                                'time':time,
-                                'value':value
-                            })
-                
-                self.times.append(time)
-                self.values.append(value)
+        # Extract Data : columns 3 (time) and 4 (value) of every row, header rows included
+        # ('.csv.gz' files and zip members are decompressed while parsed, see the 'archives' module)
+        with archives.open_csv_source(self.file_path) as source:
+            data = np.loadtxt(source, delimiter=self.delimiter, usecols=(3, 4), dtype=self.dtype, ndmin=2)
+        self.times = np.ascontiguousarray(data[:, 0])
+        self.values = np.ascontiguousarray(data[:, 1])
 
     def calibrate_data(self):
-        for i in range(len(self.values)):
-            self.values[i] = self.values[i] * self.calibration_value
+        if self.values.flags.writeable:
+            self.values *= self.calibration_value
+        elif self.calibration_value != 1:   # memory mapped sidecar (read-only)
+            self.values = np.multiply(self.values, self.calibration_value)
+
+    # Sidecar :   ----------------------------------------------
+
+    def _load_data_from_sidecar(self):
+        if self.sidecar_dir is None:
+            return False
+        entry = sidecar.open_sidecar(sidecar.get_sidecar_path(self.file_path, self.sidecar_dir), self.file_path, dtype=self.dtype)
+        if entry is None:
+            return False
+
+        self.times, self.values, header = entry
+        for name, value in header.items():
+            setattr(self, name, value)
+        return True
+
+    def _write_sidecar(self):
+        if self.sidecar_dir is None:
+            return
+        sidecar_path = sidecar.get_sidecar_path(self.file_path, self.sidecar_dir)
+        try:
+            sidecar.write_sidecar(sidecar_path, self.file_path, self.times, self.values, self._get_header())
+        except OSError as e:
+            print(f"{Fore.RED}Could not create the sidecar file !\nFile path : {sidecar_path}\nError Message : {e}")
+
+    def _get_header(self):
+        return {
+            'record_length' : self.record_length,
+            'sample_interval' : self.sample_interval,
+            'trigger_point' : self.trigger_point,
+            'trigger_time' : self.trigger_time,
+            'horizontal_offset' : self.horizontal_offset,
+        }
+
+    # Cache :   ------------------------------------------------
+
+    def _get_data_cache_key(self, filter_type:str):
+        if self._content_hash is None:
+            self._content_hash = self.cache.content_hash(self.file_path)
+        return self.cache.make_key('data', self._content_hash, self.delimiter, self.dtype, self.calibration_value,
+                                   filter_type, self.N, self.filter_exact, self.savgol_polyorder)
+
+    def _get_delta_cache_key(self):
+        if self.auto_threshold:     # the estimated thresholds are stored in the entry
+            threshold_parameters = ('auto', self.auto_threshold_low, self.auto_threshold_high)
+        else:
+            threshold_parameters = (self.threshold_low, self.threshold_high)
+        return self.cache.make_key('delta', self._get_data_cache_key(self.filter_type), self.channel_number, *threshold_parameters)
+
+    def _load_data_from_cache(self):
+        if self.cache is None:
+            return False
+        entry = self.cache.load_data(self._get_data_cache_key(self.filter_type))
+        if entry is None:
+            return False
+
+        self.times, self.values, self.values_filtred, header = entry
+        for name, value in header.items():
+            setattr(self, name, value)
+        self._cached_filter = self.filter_type
+        return True
+
+    def _get_output_cache_key(self, *parameters):
+        ''' Key of a generated file : Delta results + the parameters changing the file contents,
+        parameters : the options of the file itself (format, dpi, labels ...)
+        '''
+        spectrum_parameters = ((self.spectrum_window, self.spectrum_segment, self.spectrum_overlap, self.spectrum_peaks)
+                               if self.spectral_analysis and not self.streaming else None)     # 'Spectrum' tables
+        return self.cache.make_key('output', self._get_delta_cache_key(), self.event_detection, spectrum_parameters,
+                                   self.excel_chart_points, self.plot_decimation, *parameters)
+
+    def _is_output_up_to_date(self, output_path, *parameters):
+        return self.cache is not None and self.cache.is_output_up_to_date(self._get_output_cache_key(*parameters), output_path)
 
+    def _record_output(self, output_path, *parameters):
+        if self.cache is not None:
+            self.cache.record_output(self._get_output_cache_key(*parameters), output_path)
+
+    @_measured_stage('excel')
     def generate_excel(self):
         print('\nCreating Excel Sheet ...', end=' ')
         excel_file_name = os.path.splitext(self.file_name)[0] + '.xlsx'
         excel_file_path = os.path.join(self.directory, self.processed_dir, excel_file_name)
 
+        if self._is_output_up_to_date(excel_file_path, 'xlsx'):
+            print(f'{Fore.GREEN}OK (up to date)')
+            return
+        self._create_processed_dir()
+
+        import xlsxwriter
         try:
-            workbook = xlsxwriter.Workbook(excel_file_path)
-            worksheet = workbook.add_worksheet()
+            # constant_memory : each row is flushed to the file when the next one is started
+            workbook = xlsxwriter.Workbook(excel_file_path, {'constant_memory': True})
+            worksheets = _add_data_sheets(workbook, len(self.times))    # several sheets above EXCEL_MAX_ROWS
 
-            # Excel header :
+            # Excel cell formats (the data cells use the format of their column) :
             cell_format = workbook.add_format({'bold': True, 'font_color': 'white', 'align':'center', 'bg_color':'#000033'})
-
-            worksheet.write(0, 0, 'Time (s)', cell_format)
+            cell_format_time = workbook.add_format({'num_format' : '0.000000', 'align':'center'})
             if self.channel_number == 1:
-                worksheet.write(0, 1, 'Tension (V)', cell_format)
-                worksheet.write(0, 2, 'Tension (V) Filtred', cell_format)
+                header = ('Time (s)', 'Tension (V)', 'Tension (V) Filtred')
                 cell_num_format = workbook.add_format({'num_format' : '0.00', 'align':'center'})
-
             else:
-                worksheet.write(0, 1, 'Current (A)', cell_format)
-                worksheet.write(0, 2, 'Current (A) Filtred', cell_format)
+                header = ('Time (s)', 'Current (A)', 'Current (A) Filtred')
                 cell_num_format = workbook.add_format({'num_format' : '0.00000000000', 'align':'center'})
-            
-            # Insert data to Excel file :
-            row = 1
-            # Insert data to Excel file :
-            cell_format_time = workbook.add_format({'num_format' : '0.000000', 'align':'center'})
-        
-            for i in range(self.record_length):
-                worksheet.write_number(row, 0, self.times[i], cell_format_time)
-                worksheet.write_number(row, 1, self.values[i], cell_num_format)
-                worksheet.write_number(row, 2, self.values_filtred[i], cell_num_format)
-                row +=1
-
-            worksheet.set_column(0, 0, 15)
-            worksheet.set_column(1, 1, 20)
-            worksheet.set_column(2, 2, 22)
-            worksheet.autofilter(0, 0, self.record_length, 2)
+
+            for worksheet in worksheets:
+                worksheet.set_column(0, 0, 15, cell_format_time)
+                worksheet.set_column(1, 1, 20, cell_num_format)
+                worksheet.set_column(2, 2, 22, cell_num_format)
+
+                # Excel header :
+                worksheet.write_row(0, 0, header, cell_format)
+
+            # Insert data to Excel file (rows in order) :
+            progress = instrumentation.Progress('Creating Excel Sheet', len(self.times), self.progress_interval)
+            _write_data_sheets(worksheets, self.times, self.values, self.values_filtred, progress=progress)
+
+            # Dominant frequencies ('spectral_analysis') :
+            if len(self.peaks):
+                worksheet_spectrum = workbook.add_worksheet('Spectrum')
+                worksheet_spectrum.set_column(0, 2, 22)
+                cell_format_frequency = workbook.add_format({'num_format' : '0.00', 'align':'center'})
+                cell_format_psd = workbook.add_format({'num_format' : '0.000E+00', 'align':'center'})
+                _write_spectrum_to_sheet(worksheet_spectrum, (self,), 0, cell_format, cell_format_frequency, cell_format_psd)
             workbook.close()    # Close the file
+            self._record_output(excel_file_path, 'xlsx')
+            progress.finish()
             
             print(f'{Fore.GREEN}OK')
             print(f"Excel file created with success : {excel_file_name}")
@@ -269,20 +523,29 @@ class CSV_Object():
             print(f"{Fore.RED}Could not create Excel file !! \nFile path : {excel_file_path}\nError Message : {e}")
 
             
+    @_measured_stage('plot')
     def create_plot_data(self, x_label:str='Time (s)', y_label:str='', filtred:bool=False,
                          title:str='', file_name:str='', dpi:int=300, add_vline:bool=True,
                          grid:bool=True, black_bg:bool=True):
         
-        x_axis_data = self.times
-        if filtred:
-            y_axis_data = self.values_filtred
-            Delta = self.DeltaFiltred
+        if file_name == '':
+            image_file = os.path.splitext(self.file_name)[0] + '.png'
         else:
-            y_axis_data = self.values
-            Delta = self.Delta
+            image_file = file_name
+        
+        image_path = os.path.join(self.directory, self.processed_dir, image_file)
+        output_parameters = ('png', x_label, y_label, filtred, title, dpi, add_vline, grid, black_bg)
 
+        if self._is_output_up_to_date(image_path, *output_parameters):
+            print(f"Figure 'png' file is up to date : '{image_file}'")
+            return
+        self._create_processed_dir()
 
+        import matplotlib.pyplot as plt
         w, h = plt.figaspect(0.5)
+        x_axis_data, y_axis_data, Delta = self._get_plot_series(filtred, int(w * dpi))
+        events = self.get_events(filtred)
+
         fig = plt.figure(figsize=(w, h))
         
         if title == '':
@@ -322,95 +585,240 @@ class CSV_Object():
 
             h_pos = float(Delta.time_end + Delta.time_start)/2 - 0.02
             ax.text(h_pos, delta_v_pos, rf'$Δt = {Delta.delta_time}$ ms', fontsize=12, color=text_color) 
+
+            if len(events) > 1:
+                self._add_events_lines(ax, events)
         
         if grid:
             ax.grid()
         
-        if file_name == '':
-            image_file = os.path.splitext(self.file_name)[0] + '.png'
-        else:
-            image_file = file_name
-        
-        image_path = os.path.join(self.directory, self.processed_dir, image_file)
-        
         try:
             plt.savefig(image_path, dpi=dpi)
             print(f"Figure 'png' file created with success : '{image_file}'")
             plt.close()
+            self._record_output(image_path, *output_parameters)
         except Exception as e:
             print(f"{Fore.RED}\nCould not create Figure 'png' file !! \nPNG path : {image_path}\nError Message : {e}")
 
 
 
-    def plot_show(self):
+    @_measured_stage('plot')
+    def create_figures(self, dpi:int=300, grid:bool=True, black_bg:bool=True):
+        ''' Create the 4 figures of the channel (raw / filtred, with and without the Delta time lines)
+        with one figure and 2 full renders (see figures.FigureRenderer)
+        '''
+        from api import figures
+        renderer = figures.FigureRenderer(self, dpi=dpi, grid=grid, black_bg=black_bg)
+        renderer.render(False, f'{self.file_name[:-4]}_line=false.png', f'{self.file_name[:-4]}_line=true.png')
+        renderer.render(True, f'{self.file_name[:-4]}_line=false_filtred_{self.filter_label}.png',
+                        f'{self.file_name[:-4]}_line=true_filtred_{self.filter_label}.png')
+
+
+    def _get_plot_series(self, filtred:bool, pixels:int):
+        ''' Return (times, values, Delta) of the raw or filtred data to draw on an image 'pixels' wide '''
+        x_axis_data = self.times
+        if filtred:
+            y_axis_data = self.values_filtred
+            Delta = self.DeltaFiltred
+        else:
+            y_axis_data = self.values
+            Delta = self.Delta
+
+        # Keep the first / min / max / last samples of each pixel column of the image
+        if self.plot_decimation:
+            indexes = decimation.pixel_indexes(y_axis_data, pixels)
+            if indexes is not None:
+                x_axis_data = x_axis_data[indexes]
+                y_axis_data = y_axis_data[indexes]
+
+        return x_axis_data, y_axis_data, Delta
+
+
+    def get_events(self, filtred:bool=False):
+        ''' Events (detection.EVENT_DTYPE array) of the raw or filtred values '''
+        return self.events_filtred if filtred else self.events
+
+    def _add_events_lines(self, ax, events):
+        ''' Add the Start (solid) / End (dashed) lines of every event to ax, return the 2 line collections '''
+        from matplotlib.collections import LineCollection
+        transform = ax.get_xaxis_transform()    # x : data, y : axes fraction (0 to 1)
+        segments = np.zeros((len(events), 2, 2))
+        segments[:, 0, 1], segments[:, 1, 1] = 0, 1
+        collections = []
+        for column, linestyle in (('time_start', 'solid'), ('time_end', 'dashed')):
+            segments[:, :, 0] = events[column][:, None]
+            collection = LineCollection(segments.copy(), colors='orange', linewidths=0.6, linestyles=linestyle, transform=transform)
+            collections.append(ax.add_collection(collection, autolim=False))
+        return collections
+
+    def plot_show(self, interactive:bool=True):
+        ''' Show the raw / filtred values with the Delta time markers in the interactive viewer : each zoom / pan
+        only draws the visible range at the screen resolution (min/max pyramid, see the 'viewer' module).
+        :param interactive: False : only show the current pyplot figures (v1.1)
+        '''
+        import matplotlib.pyplot as plt
+        if interactive:
+            from api import viewer
+            viewer.InteractiveViewer(self)
         plt.show()
 
 
 
     def apply_moving_average(self):
-        self.values_filtred = []
-        n = int(self.N/2)
-        self.values_filtred [:n-1] = self.values[:n-1]
-        print('')
-        bar = progressbar.ProgressBar(maxval=self.record_length-self.N+1, widgets=[progressbar.Bar('=', f'Filtering Data (N={self.N}) : [', ']'), ' ', progressbar.Percentage()], term_width=100)
-        bar.start()
-        idx = 0
-        for i in range(n, self.record_length - n + 1):
-            mean_value = statistics.mean(self.values[i-n:i+n+1])
-            self.values_filtred.append(mean_value)
-            bar.update(idx)
-            idx += 1
-        bar.finish()
-        self.values_filtred[self.record_length-n:self.record_length] = self.values[self.record_length-n:]
-    
+        self.apply_filter(filter_type='sma')
+
+    def apply_filter(self, filter_type:str=None):
+        if filter_type is None:
+            filter_type = self.filter_type
+        else:
+            self.filter_type = filter_type
+
+        if self.streaming:
+            if self.auto_threshold:
+                print(f"{Fore.RED}\n'auto_threshold' is not available in streaming mode : the config.ini thresholds are used !")
+                self.auto_threshold = False
+            label = f'Streaming Data : Filtering ({filter_type.upper()}, N={self.N}) + Delta Time'
+            print(f'\n{label} ...', end=' ')
+            progress = instrumentation.Progress(label, self.record_length or 0, self.progress_interval)
+            with self.instrumentation.stage('stream', self._count_samples):
+                streaming.process_stream(self, filter_type, progress=progress)
+            progress.finish()
+            print(f'{Fore.GREEN}OK')
+            return
+
+        print(f'\nFiltering Data ({filter_type.upper()}, N={self.N}) ...', end=' ')
+        if filter_type == self._cached_filter:
+            print(f'{Fore.GREEN}OK (cache)')
+            return
+
+        with self.instrumentation.stage('filter', self._count_samples):
+            self.values_filtred = filters.apply_filter(self.values, self.N, filter_type=filter_type,
+                                                       exact=self.filter_exact, polyorder=self.savgol_polyorder)
+        print(f'{Fore.GREEN}OK')
+
+        if self.cache is not None:
+            self.cache.store_data(self._get_data_cache_key(filter_type), self.times, self.values,
+                                  self.values_filtred, self._get_header())
+
+    @property
+    def filter_label(self):
+        ''' Filter description used in the generated file names : 'N=51' (SMA) or 'ema_N=51' '''
+        if self.filter_type == 'sma':
+            return f'N={self.N}'
+        return f'{self.filter_type}_N={self.N}'
+
 
 
     def _extract_indexes(self, values):
-        time_start_idx = None
-        time_end_idx = None
+        # Start : last value crossing the first threshold, End : first value crossing the second one
+        # (same indexes as the v1.1 forward / reversed loops, End is shifted by 1)
+        chunk_size = detection.DEFAULT_CHUNK_SIZE if self.early_exit_scan else 0
 
         if self.channel_number == 1:
-            for i, value in enumerate(values):
-                if float(value) < self.threshold_low :
-                    time_start_idx = i
+            time_start_idx = detection.find_last(values, self.threshold_low, above=False, chunk_size=chunk_size)
+            first_end_idx = detection.find_first(values, self.threshold_high, above=True, chunk_size=chunk_size)
+        else:
+            time_start_idx = detection.find_last(values, self.threshold_high, above=True, chunk_size=chunk_size)
+            first_end_idx = detection.find_first(values, self.threshold_low, above=False, chunk_size=chunk_size)
 
-            for i, value in enumerate(values[::-1]):
-                if float(value) > self.threshold_high :
-                    time_end_idx = self.record_length - i
+        time_end_idx = None
+        if first_end_idx is not None:
+            time_end_idx = self.record_length - len(values) + first_end_idx + 1
 
-        else:
-            for i, value in enumerate(values):
-                if float(value) > self.threshold_high :
-                    time_start_idx = i
-            
-            for i, value in enumerate(values[::-1]):
-                if float(value) < self.threshold_low :
-                    time_end_idx = self.record_length - i
-        
         return [time_start_idx, time_end_idx]
 
     def calculate_delta_time(self):
+        if self.streaming:  # already computed online by apply_filter()
+            return
+        with self.instrumentation.stage('delta', self._count_samples):
+            self._calculate_delta_time()
+
+    def _calculate_delta_time(self):
+        if self.cache is not None:
+            entry = self.cache.load_delta(self._get_delta_cache_key())
+            if entry is not None and (entry['thresholds'] is not None or not self.auto_threshold):
+                if entry['thresholds'] is not None:
+                    self.threshold_low, self.threshold_high = entry['thresholds']
+                self.Delta.update(entry['delta'])
+                self.DeltaFiltred.update(entry['delta_filtred'])
+                if not self.event_detection:
+                    return
+                if entry['events'] is not None:
+                    self.events = np.array([tuple(event) for event in entry['events']['raw']], dtype=detection.EVENT_DTYPE)
+                    self.events_filtred = np.array([tuple(event) for event in entry['events']['filtred']], dtype=detection.EVENT_DTYPE)
+                    return
+
+        if self.auto_threshold:
+            self.set_auto_thresholds()
+
         # RAW DATA
         time_start_idx, time_end_idx = self._extract_indexes(self.values)   # Detect Start/End of signal variation
-        delta_time = round( abs(self.times[time_end_idx] - self.times[time_start_idx]) * 1000, 2)
-        self.Delta.delta_time = delta_time
-        self.Delta.idx_start = time_start_idx
-        self.Delta.idx_end = time_end_idx
-        self.Delta.time_start = self.times[time_start_idx]
-        self.Delta.time_end = self.times[time_end_idx]
-        self.Delta.value_start = self.values[time_start_idx]
-        self.Delta.value_end = self.values[time_end_idx]
+        self._set_delta(self.Delta, time_start_idx, time_end_idx)
 
         # FILTRED DATA
         time_start_idx_filtred, time_end_idx_filtred = self._extract_indexes(self.values_filtred)   # Detect Start/End of signal variation
-        delta_time_filtred = round( abs(self.times[time_end_idx_filtred] - self.times[time_start_idx_filtred]) * 1000, 2)
-        self.DeltaFiltred.delta_time = delta_time_filtred
-        self.DeltaFiltred.idx_start = time_start_idx_filtred
-        self.DeltaFiltred.idx_end = time_end_idx_filtred
-        self.DeltaFiltred.time_start = self.times[time_start_idx_filtred]
-        self.DeltaFiltred.time_end = self.times[time_end_idx_filtred]
-        self.DeltaFiltred.value_start = self.values[time_start_idx_filtred]
-        self.DeltaFiltred.value_end = self.values[time_end_idx_filtred]
+        self._set_delta(self.DeltaFiltred, time_start_idx_filtred, time_end_idx_filtred)
+
+        # EVENTS : every transition of the raw and filtred data (one vectorized pass each)
+        events = None
+        if self.event_detection:
+            self.events = detection.find_events(self.times, self.values, self.values, self.threshold_low, self.threshold_high)
+            self.events_filtred = detection.find_events(self.times, self.values_filtred, self.values, self.threshold_low, self.threshold_high)
+            events = {'raw': self.events.tolist(), 'filtred': self.events_filtred.tolist()}
+
+        if self.cache is not None:
+            auto_thresholds = [self.threshold_low, self.threshold_high] if self.auto_threshold else None
+            self.cache.store_delta(self._get_delta_cache_key(), self.Delta.as_dict(), self.DeltaFiltred.as_dict(), events, auto_thresholds)
+
+    def set_auto_thresholds(self):
+        ''' Set threshold_low / threshold_high from the state levels of the filtred values (raw values if not
+        filtred yet), see thresholds.estimate_thresholds(). The config.ini thresholds are kept if it fails.
+        '''
+        values = self.values_filtred if len(self.values_filtred) else self.values
+        try:
+            self.threshold_low, self.threshold_high = thresholds.estimate_thresholds(values, self.auto_threshold_low, self.auto_threshold_high)
+        except ValueError as e:
+            print(f"{Fore.RED}Could not estimate the thresholds, the config.ini thresholds are used !\nError Message : {e}")
+
+    def calculate_spectrum(self):
+        ''' Welch PSD of the raw and filtred values + their dominant frequencies ('spectral_analysis' in config.ini),
+        the sampling frequency is 1 / sample_interval (CSV header), see the 'spectrum' module.
+        '''
+        if not self.spectral_analysis:
+            return
+        if self.streaming:
+            print(f"{Fore.RED}\n'spectral_analysis' is not available in streaming mode (decimated data) !")
+            return
+
+        with self.instrumentation.stage('spectrum', self._count_samples):
+            sample_interval = self.sample_interval
+            if not sample_interval or sample_interval <= 0:     # header field not read : mean interval of the timebase
+                sample_interval = float(self.times[-1] - self.times[0]) / (len(self.times) - 1) if len(self.times) > 1 else None
+
+            series = (self.values, self.values_filtred) if len(self.values_filtred) else (self.values,)
+            try:
+                self.spectrum_frequencies, psd = spectrum.welch_psd(np.vstack(series), sample_interval, self.spectrum_segment,
+                                                                    self.spectrum_overlap, self.spectrum_window)
+            except ValueError as e:
+                print(f"{Fore.RED}Could not calculate the spectrum !\nError Message : {e}")
+                return
+
+            self.psd = psd[0]
+            self.peaks = spectrum.dominant_frequencies(self.spectrum_frequencies, self.psd, self.spectrum_peaks)
+            if len(psd) > 1:
+                self.psd_filtred = psd[1]
+                self.peaks_filtred = spectrum.dominant_frequencies(self.spectrum_frequencies, self.psd_filtred, self.spectrum_peaks)
+
+    def _set_delta(self, delta, time_start_idx, time_end_idx):
+        time_start = float(self.times[time_start_idx])
+        time_end = float(self.times[time_end_idx])
+        delta.delta_time = round( abs(time_end - time_start) * 1000, 2)
+        delta.idx_start = time_start_idx
+        delta.idx_end = time_end_idx
+        delta.time_start = time_start
+        delta.time_end = time_end
+        delta.value_start = float(self.values[time_start_idx])
+        delta.value_end = float(self.values[time_end_idx])
 
 
 
@@ -461,44 +869,100 @@ Please select an option : ''')
             print(f"{Fore.RED}Please input a correct value !!!")
 
 
+def list_file_names(directory:str, extension:str='csv', combined:bool=False, date_from=None, date_to=None, channel:int=None):
+    ''' Sorted list of the files to process, (file_name_ch1, file_name_ch2) tuples if combined.
+    With 'catalog' in config.ini the list comes from the acquisitions catalog (one directory listing
+    per call, the headers are only read again for the new or changed files).
+    :param date_from, date_to: acquisition dates range (datetime, both included)
+    :param channel: only the files of this channel (not combined)
+    '''
+    config = settings.get_config()
+    file_names = None
+    if config.catalog and extension == 'csv':   # the catalog lists the captures ('.csv', '.csv.gz', zip members)
+        file_names = _list_file_names_from_catalog(directory, config.catalog_file, combined, date_from, date_to, channel)
+
+    if file_names is None:
+        file_names = _scan_file_names(directory, extension, combined)
+        if date_from is not None or date_to is not None or channel is not None:
+            file_names = [f for f in file_names if _match_file_name(f[0] if combined else f, date_from, date_to, channel)]
+
+    if not combined:
+        return file_names
+
+    file_names_combined = []
+    for file_name, file_name_ch2 in file_names:
+        if file_name_ch2 is not None:
+            file_names_combined.append((file_name, file_name_ch2))  # append the list with a tuple (file_name_ch1, file_name_ch2)
+        else:
+            print(f"{Fore.RED}This File '{file_name}' has No 'Ch2' file !! ")
+    return file_names_combined
+
+
+def _list_file_names_from_catalog(directory:str, catalog_file:str, combined:bool, date_from, date_to, channel:int):
+    ''' Files list from the acquisitions catalog, None if the catalog can not be used '''
+    try:
+        acquisitions = catalog.AcquisitionCatalog(directory, catalog_file)
+        try:
+            acquisitions.update()
+            return acquisitions.list_file_names(combined=combined, date_from=date_from, date_to=date_to, channel=channel)
+        finally:
+            acquisitions.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"{Fore.RED}Could not use the acquisitions catalog, the directory is scanned !\nError Message : {e}")
+        return None
+
+
+def _scan_file_names(directory:str, extension:str, combined:bool):
+    ''' Sorted files list from the directory, (file_name_ch1, file_name_ch2 or None) tuples if combined.
+    For 'csv' : '.csv' / '.csv.gz' files and the members of the zip archives ('bundle.zip/X_Ch1.csv').
+    '''
+    if extension == 'csv':
+        file_names = [name for name, _ in archives.list_captures(directory)]
+    else:
+        file_names = sorted(f for f in os.listdir(os.path.join(directory)) if f.endswith('.' + extension))
+
+    if not combined:
+        return file_names
+
+    # Ch1 / Ch2 files of an acquisition : same name + 'Ch1' / 'Ch2', in the same directory / archive
+    names = {archives.strip_extension(file_name): file_name for file_name in file_names}
+    return [(file_name, names.get(archives.strip_extension(file_name)[:-1] + '2'))
+            for file_name in file_names if archives.strip_extension(file_name)[-3:] == 'Ch1']
+
+
+def _match_file_name(file_name:str, date_from, date_to, channel:int):
+    try:
+        aquisition_date, channel_number = catalog.parse_file_name(file_name)
+    except ValueError:
+        return False
+    return ((date_from is None or aquisition_date >= date_from) and (date_to is None or aquisition_date <= date_to)
+            and (channel is None or channel_number == channel))
+
+
+def get_display_name(file_name):
+    ''' Name displayed in the files list : file name, or acquisition name for a (ch1, ch2) tuple '''
+    if isinstance(file_name, tuple):
+        return archives.strip_extension(file_name[0])[:-4]
+    return file_name
+
+
+def print_file_names_list(directory:str, file_names:list):
+    print(f"\n\n{'-'*47}   Files List   {'-'*47}\n")
+    print(f"Directory : {directory}\n")
+    for i, file_name in enumerate(file_names):
+        print(f"index : [{i}] --- File Name : {get_display_name(file_name)}")
+
+
 def get_file_names_list(directory:str, extension:str='csv', combined:bool=False):
-    file_names = [f for f in os.listdir(os.path.join(directory)) if f.endswith('.' + extension)]
-    file_names.sort()
+    file_names = list_file_names(directory, extension=extension, combined=combined)
     
     while True:
         # print all files in the folder :
-        print(f"\n\n{'-'*47}   Files List   {'-'*47}\n")
-        print(f"Directory : {directory}\n")
+        print_file_names_list(directory, file_names)
+        file_names_list = _select_files_function(file_names)
         
-        if combined:
-            file_names_combined = []
-            for file_name in file_names:
-                if file_name [-7:] == 'Ch1.csv':
-                    file_name_ch2 = file_name[:-7] + 'Ch2.csv'
-                    # check if file_name_ch2 exists :
-                    ret_val = os.path.isfile(os.path.join(directory, file_name_ch2))
-                    if ret_val:
-                        file_names_combined.append((file_name, file_name_ch2))  # append the list with a tuple (file_name_ch1, file_name_ch2)
-                    else:
-                        print(f"{Fore.RED}This File '{file_name}' has No 'Ch2' file !! ")
-            
-            for i, file_name in enumerate(file_names_combined):
-                print(f"index : [{i}] --- File Name : {file_name[0][:-8]}")
-            
-            file_names_list = _select_files_function(file_names_combined)
-            
-            if file_names_list:
-                return file_names_list
-
-        else:
-
-            for i, file_name in enumerate(file_names):
-                print(f"index : [{i}] --- File Name : {file_name}")
-            
-            file_names_list = _select_files_function(file_names)
-            
-            if file_names_list:
-                return file_names_list
+        if file_names_list:
+            return file_names_list
 
 
 def _select_files_function(file_names):
@@ -511,11 +975,29 @@ All File : just input 'all' or 'a'
 
 input index(es) : ''')
 
+    return select_files(str_input, file_names)
+
+
+def select_files(str_input:str, file_names:list):
+    ''' Files selected by str_input : 'all', one index, '1,2,3', '4:9' or a glob pattern ('2020072*')
+    matched against the displayed file names. Return an empty list (or None) if nothing is selected.
+    '''
+    str_input = str_input.strip()
 
     if str_input.lower() in ['all', 'a']:
-        print("All files are selected.")
+        if file_names:
+            print("All files are selected.")
         return file_names
     
+    elif any(c in str_input for c in '*?['):
+        file_names_list = [f for f in file_names if fnmatch.fnmatch(get_display_name(f), str_input)]
+        print(f"\n\n{'-'*45}   Selected Files   {'-'*45}\n")
+        for file_name in file_names_list:
+            print(f"index : [{file_names.index(file_name)}] --- File Name : {get_display_name(file_name)}")
+        if not file_names_list:
+            print(f"{Fore.RED}No file is matching the pattern '{str_input}' !")
+        return file_names_list
+
     else:
         if str_input.isnumeric():
             if int(str_input) < len(file_names):
@@ -584,53 +1066,127 @@ def _get_multiple_opt2(str_input, file_names):
 
 
 
-def _write_header_cell_sheet_data(worksheet, cell_format_header):
-    worksheet.write(0, 0, 'Time', cell_format_header)
-    worksheet.write(0, 1, 'Tension (V)', cell_format_header)
-    worksheet.write(0, 2, 'Tension (V) Filtered', cell_format_header)
-    worksheet.write(0, 3, 'Current (A)', cell_format_header)
-    worksheet.write(0, 4, 'Current (A) Filtered', cell_format_header)
-    
-    worksheet.set_column(0, 0, 15)
-    worksheet.set_column(1, 1, 15)
-    worksheet.set_column(2, 2, 22)
-    worksheet.set_column(3, 3, 20)
-    worksheet.set_column(4, 4, 22)
+def _write_rows(worksheet, first_row:int, *columns, progress=None, progress_offset:int=0):
+    ''' Write the columns (same length) row by row, from first_row : the rows are written in
+    order as needed by the 'constant_memory' mode, the cells use the format of their column.
+    The columns are converted by slices of PROGRESS_ROWS rows (no python copy of a whole sheet).
+    :param progress: instrumentation.Progress updated every PROGRESS_ROWS rows
+    :param progress_offset: rows written before this call (previous data sheets)
+    '''
+    rows = len(columns[0]) if columns else 0
+    for start in range(0, rows, PROGRESS_ROWS):
+        stop = min(start + PROGRESS_ROWS, rows)
+        block = [np.asarray(column[start:stop]).tolist() for column in columns]  # python floats : faster than numpy scalars
+        for row, data in enumerate(zip(*block), first_row + start):
+            worksheet.write_row(row, 0, data)
+        if progress is not None:
+            progress.update(progress_offset + stop)
+
+def _add_data_sheets(workbook, rows:int, sheet_name:str=None):
+    ''' Add the data sheets of a record of 'rows' rows : one sheet for EXCEL_MAX_ROWS - 1 rows (+ header).
+    Names : sheet_name, '<sheet_name> (2)', ... (Excel default names 'Sheet1', 'Sheet2', ... if None)
+    '''
+    sheets = max(1, -(-rows // (EXCEL_MAX_ROWS - 1)))
+    if sheet_name is None:
+        return [workbook.add_worksheet() for _ in range(sheets)]
+    return [workbook.add_worksheet(sheet_name if i == 0 else f'{sheet_name} ({i + 1})') for i in range(sheets)]
+
+def _write_data_sheets(worksheets:list, *columns, progress=None):
+    ''' Write the columns on the data sheets (EXCEL_MAX_ROWS - 1 rows per sheet, below the header row) '''
+    sheet_rows = EXCEL_MAX_ROWS - 1
+    for i, worksheet in enumerate(worksheets):
+        start = i * sheet_rows
+        shard = [column[start:start + sheet_rows] for column in columns]
+        _write_rows(worksheet, 1, *shard, progress=progress, progress_offset=start)
+        worksheet.autofilter(0, 0, len(shard[0]), len(columns) - 1)
+
+def _write_header_cell_sheet_data(worksheet, cell_format_header, cell_format_time, cell_format_voltage, cell_format_current):
+    worksheet.set_column(0, 0, 15, cell_format_time)
+    worksheet.set_column(1, 1, 15, cell_format_voltage)
+    worksheet.set_column(2, 2, 22, cell_format_voltage)
+    worksheet.set_column(3, 3, 20, cell_format_current)
+    worksheet.set_column(4, 4, 22, cell_format_current)
+
+    worksheet.write_row(0, 0, ('Time', 'Tension (V)', 'Tension (V) Filtered', 'Current (A)', 'Current (A) Filtered'), cell_format_header)
 
 def _write_header_cell_sheet_charts(worksheet_charts, cell_format_header):
-    worksheet_charts.write(0, 1, 'Δt (ms)', cell_format_header)
-    worksheet_charts.write(0, 2, 'Time start (ms)', cell_format_header)
-    worksheet_charts.write(0, 3, 'Time start Index', cell_format_header)
-    worksheet_charts.write(0, 4, 'Time End (ms)', cell_format_header)
-    worksheet_charts.write(0, 5, 'Time End Index', cell_format_header)
-    worksheet_charts.write(1, 0, 'Tension (Raw)', cell_format_header)
-    worksheet_charts.write(2, 0, 'Tension (Filtred)', cell_format_header)
-    worksheet_charts.write(3, 0, 'Current (Raw)', cell_format_header)
-    worksheet_charts.write(4, 0, 'Current (Filtred)', cell_format_header)
-
     worksheet_charts.set_column("$A1:$F1", 15)
+    worksheet_charts.write_row(0, 1, ('Δt (ms)', 'Time start (ms)', 'Time start Index', 'Time End (ms)', 'Time End Index'), cell_format_header)
+
+def _write_delta_time_info_to_sheet_charts(worksheet_charts, obj, row:int, cell_format_header, cell_format_voltage, cell_format_time):
+    # Each row is written at once (label + values) : the rows must be written in order in 'constant_memory' mode
+    name = 'Tension' if obj.channel_number == 1 else 'Current'
+    for delta_row, (label, delta) in enumerate(((f'{name} (Raw)', obj.Delta), (f'{name} (Filtred)', obj.DeltaFiltred)), row):
+        worksheet_charts.write(delta_row, 0, label, cell_format_header)
+        worksheet_charts.write_number(delta_row, 1, delta.delta_time, cell_format_voltage)   # cell voltage has 2 decimal digits 
+        worksheet_charts.write_number(delta_row, 2, delta.time_start, cell_format_time)
+        worksheet_charts.write_number(delta_row, 3, delta.idx_start)
+        worksheet_charts.write_number(delta_row, 4, delta.time_end, cell_format_time)
+        worksheet_charts.write_number(delta_row, 5, delta.idx_end)
+
+def _write_events_to_sheet_charts(worksheet_charts, objs, row:int, cell_format_header, cell_format_voltage, cell_format_time):
+    # Same columns as the Delta time rows + the direction, one row per event (rows in order)
+    worksheet_charts.write_row(row, 0, ('Event', 'Δt (ms)', 'Time start (ms)', 'Time start Index', 'Time End (ms)', 'Time End Index', 'Direction'), cell_format_header)
+    for obj in objs:
+        name = 'Tension' if obj.channel_number == 1 else 'Current'
+        for label, events in ((f'{name} (Raw)', obj.events), (f'{name} (Filtred)', obj.events_filtred)):
+            for i, (direction, idx_start, time_start, _, idx_end, time_end, _, delta_time) in enumerate(events.tolist(), 1):
+                row += 1
+                worksheet_charts.write(row, 0, f'{label} #{i}', cell_format_header)
+                worksheet_charts.write_number(row, 1, delta_time, cell_format_voltage)
+                worksheet_charts.write_number(row, 2, time_start, cell_format_time)
+                worksheet_charts.write_number(row, 3, idx_start)
+                worksheet_charts.write_number(row, 4, time_end, cell_format_time)
+                worksheet_charts.write_number(row, 5, idx_end)
+                worksheet_charts.write(row, 6, 'rising' if direction > 0 else 'falling')
+    return row
+
+def _write_spectrum_to_sheet(worksheet, objs, row:int, cell_format_header, cell_format_frequency, cell_format_psd):
+    # Dominant frequencies of each series, one row per frequency (rows in order)
+    worksheet.write_row(row, 0, ('Dominant Frequency', 'Frequency (Hz)', 'PSD (unit²/Hz)'), cell_format_header)
+    for obj in objs:
+        name = 'Tension' if obj.channel_number == 1 else 'Current'
+        for label, peaks in ((f'{name} (Raw)', obj.peaks), (f'{name} (Filtred)', obj.peaks_filtred)):
+            for i, (frequency, psd) in enumerate(peaks.tolist(), 1):
+                row += 1
+                worksheet.write(row, 0, f'{label} #{i}', cell_format_header)
+                worksheet.write_number(row, 1, frequency, cell_format_frequency)
+                worksheet.write_number(row, 2, psd, cell_format_psd)
+    return row
+
+def _write_chart_data_sheet(workbook, obj_ch1, obj_ch2, cell_formats:tuple):
+    ''' Write the decimated 'Chart Data' sheet used by the charts (min/max of each block of the raw
+    and filtred values of both channels). Return (sheet name, number of data rows).
+    '''
+    series = (obj_ch1.values, obj_ch1.values_filtred, obj_ch2.values, obj_ch2.values_filtred)
+    indexes = decimation.minmax_indexes(series, min(obj_ch1.excel_chart_points, EXCEL_MAX_ROWS // 2))
+    if indexes is None:     # short record / no decimation : the charts use the Data sheet (first sheet only)
+        return 'Data', min(len(obj_ch1.times), EXCEL_MAX_ROWS - 1)
 
-def _write_delta_time_info_to_sheet_charts(worksheet_charts, obj, row:int, cell_format_voltage, cell_format_time):
-    worksheet_charts.write_number(row, 1, obj.Delta.delta_time, cell_format_voltage)   # cell voltage has 2 decimal digits 
-    worksheet_charts.write_number(row, 2, obj.Delta.time_start, cell_format_time)
-    worksheet_charts.write_number(row, 3, obj.Delta.idx_start)
-    worksheet_charts.write_number(row, 4, obj.Delta.time_end, cell_format_time)
-    worksheet_charts.write_number(row, 5, obj.Delta.idx_end)
-
-    worksheet_charts.write_number(row+1, 1, obj.DeltaFiltred.delta_time, cell_format_voltage)   # cell voltage has 2 decimal digits 
-    worksheet_charts.write_number(row+1, 2, obj.DeltaFiltred.time_start, cell_format_time)
-    worksheet_charts.write_number(row+1, 3, obj.DeltaFiltred.idx_start)
-    worksheet_charts.write_number(row+1, 4, obj.DeltaFiltred.time_end, cell_format_time)
-    worksheet_charts.write_number(row+1, 5, obj.DeltaFiltred.idx_end)
+    worksheet = workbook.add_worksheet('Chart Data')
+    _write_header_cell_sheet_data(worksheet, *cell_formats)
+    _write_rows(worksheet, 1, obj_ch1.times[indexes], *(values[indexes] for values in series))
+    return 'Chart Data', len(indexes)
 
 def generate_excel_combined(obj_ch1, obj_ch2):
     print('\nCreating Combined Excel Sheet :\n')
     excel_file_name = obj_ch1.file_name[:-8] + '.xlsx'
     excel_file_path = os.path.join(obj_ch1.directory, obj_ch1.processed_dir, excel_file_name)
-    
 
-    workbook = xlsxwriter.Workbook(excel_file_path)
-    worksheet = workbook.add_worksheet('Data')
+    if obj_ch1._is_output_up_to_date(excel_file_path, 'xlsx combined') and obj_ch2._is_output_up_to_date(excel_file_path, 'xlsx combined'):
+        print(f"Excel file is up to date : {excel_file_name}")
+        return
+    obj_ch1._create_processed_dir()
+
+    # measured as the 'excel' stage of Ch1 (one file for both channels)
+    with obj_ch1.instrumentation.stage('excel', obj_ch1._count_samples):
+        _write_excel_combined(obj_ch1, obj_ch2, excel_file_path, excel_file_name)
+
+def _write_excel_combined(obj_ch1, obj_ch2, excel_file_path, excel_file_name):
+    import xlsxwriter
+    # constant_memory : each row is flushed to the file when the next one is started
+    workbook = xlsxwriter.Workbook(excel_file_path, {'constant_memory': True})
+    worksheets = _add_data_sheets(workbook, len(obj_ch1.times), 'Data')    # 'Data', 'Data (2)', ... above EXCEL_MAX_ROWS
     worksheet_charts = workbook.add_worksheet('Charts')
 
     # Excel cell format :
@@ -638,43 +1194,83 @@ def generate_excel_combined(obj_ch1, obj_ch2):
     cell_format_time = workbook.add_format({'num_format' : '0.000000', 'align':'center'})
     cell_format_voltage = workbook.add_format({'num_format' : '0.00', 'align':'center'})
     cell_format_current = workbook.add_format({'num_format' : '0.00000000000', 'align':'center'})
+    cell_formats = (cell_format_header, cell_format_time, cell_format_voltage, cell_format_current)
 
-    _write_header_cell_sheet_data(worksheet, cell_format_header)
+    for worksheet in worksheets:
+        _write_header_cell_sheet_data(worksheet, *cell_formats)
     _write_header_cell_sheet_charts(worksheet_charts, cell_format_header)
     
     # Insert data to Worksheet Data :
     print('inserting Data ...',end=' ')
-    for i in range(obj_ch1.record_length):
-        worksheet.write_number(i+1, 0, obj_ch1.times[i], cell_format_time)
-        worksheet.write_number(i+1, 1, obj_ch1.values[i], cell_format_voltage)
-        worksheet.write_number(i+1, 2, obj_ch1.values_filtred[i], cell_format_voltage)
-        worksheet.write_number(i+1, 3, obj_ch2.values[i], cell_format_current)
-        worksheet.write_number(i+1, 4, obj_ch2.values_filtred[i], cell_format_current)
-
+    progress = instrumentation.Progress('inserting Data', len(obj_ch1.times), obj_ch1.progress_interval)
+    _write_data_sheets(worksheets, obj_ch1.times, obj_ch1.values, obj_ch1.values_filtred, obj_ch2.values, obj_ch2.values_filtred, progress=progress)
+    progress.finish()
     print(f'{Fore.GREEN}OK')
-    worksheet.autofilter(0, 0, obj_ch1.record_length, 4)
 
     # Insert data and charts to Worksheet Charts :
-    _write_delta_time_info_to_sheet_charts(worksheet_charts, obj_ch1, 1, cell_format_voltage, cell_format_time)
-    _write_delta_time_info_to_sheet_charts(worksheet_charts, obj_ch2, 3, cell_format_voltage, cell_format_time)
+    _write_delta_time_info_to_sheet_charts(worksheet_charts, obj_ch1, 1, cell_format_header, cell_format_voltage, cell_format_time)
+    _write_delta_time_info_to_sheet_charts(worksheet_charts, obj_ch2, 3, cell_format_header, cell_format_voltage, cell_format_time)
 
     # Add Chart :
     print('inserting Charts ...',end=' ')
-    chart_raw = add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred=False)
+    sheet_name, rows = _write_chart_data_sheet(workbook, obj_ch1, obj_ch2, cell_formats)
+    chart_raw = add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred=False, sheet_name=sheet_name, rows=rows)
     worksheet_charts.insert_chart('B7', chart_raw)
 
-    chart_filtred = add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred=True)
+    chart_filtred = add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred=True, sheet_name=sheet_name, rows=rows)
     worksheet_charts.insert_chart('B32', chart_filtred)
     print(f'{Fore.GREEN}OK')
+
+    # Events table (all the transitions of both channels), then the dominant frequencies :
+    row = EVENTS_FIRST_ROW
+    if obj_ch1.event_detection or obj_ch2.event_detection:
+        row = _write_events_to_sheet_charts(worksheet_charts, (obj_ch1, obj_ch2), row, cell_format_header, cell_format_voltage, cell_format_time) + 2
+    if len(obj_ch1.peaks) or len(obj_ch2.peaks):
+        cell_format_psd = workbook.add_format({'num_format' : '0.000E+00', 'align':'center'})
+        _write_spectrum_to_sheet(worksheet_charts, (obj_ch1, obj_ch2), row, cell_format_header, cell_format_voltage, cell_format_psd)
     print('Closing Excel File ...',end=' ')
     workbook.close()    # Close the file
+    obj_ch1._record_output(excel_file_path, 'xlsx combined')
+    obj_ch2._record_output(excel_file_path, 'xlsx combined')
     print(f'{Fore.GREEN}OK')
     print(f"Excel file created with success : {excel_file_name}")
 
 
 
-def add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred:bool=False, width:int=0, height:int=450):
+def generate_columnar_export(objs:list):
+    ''' Columnar binary file of one capture ('columnar_format' in config.ini, see the 'export' module) :
+    timebase + raw / filtred values of objs (1 channel, or Ch1 + Ch2 in the combined mode) + Delta results
+    '''
+    obj = objs[0]
+    extension = export.EXPORT_FORMATS[obj.columnar_format]
+    export_file_name = (obj.file_name[:-8] if obj.combined_flag else os.path.splitext(obj.file_name)[0]) + extension
+    export_file_path = os.path.join(obj.directory, obj.processed_dir, export_file_name)
+
+    print(f'\nCreating {obj.columnar_format} File ...', end=' ')
+    if all(o._is_output_up_to_date(export_file_path, obj.columnar_format) for o in objs):
+        print(f'{Fore.GREEN}OK (up to date)')
+        return
+    obj._create_processed_dir()
+
+    # measured as the 'export' stage of the first channel (one file for all the channels)
+    with obj.instrumentation.stage('export', obj._count_samples):
+        try:
+            export.write_export(objs, export_file_path, obj.columnar_format)
+        except Exception as e:
+            print(f"{Fore.RED}Could not create {obj.columnar_format} file !! \nFile path : {export_file_path}\nError Message : {e}")
+            return
+    for o in objs:
+        o._record_output(export_file_path, obj.columnar_format)
+    print(f'{Fore.GREEN}OK')
+    print(f"{obj.columnar_format} file created with success : {export_file_name}")
+
+
+def add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred:bool=False, width:int=0, height:int=450, sheet_name:str='Data', rows:int=0):
     excel_file_name = obj_ch1.file_name[:-8] + '.xlsx'
+    if rows == 0:
+        rows = len(obj_ch1.times)
+    sheet = f"'{sheet_name}'"
+    last_row = rows + 1   # row 1 is the header
 
      # Create Tension + Current chart :
     chart = workbook.add_chart({'type' : 'line'})
@@ -698,18 +1294,18 @@ def add_chart_to_workbook(workbook, obj_ch1, obj_ch2, filtred:bool=False, width:
             width = 860
     
     chart.add_series({
-        'name': f'=Data!${v_col}$1',
-        'categories': f'=Data!$A$1:$A${obj_ch1.record_length}',
-        'values': f'=Data!${v_col}$1:${v_col}${obj_ch1.record_length}',
+        'name': f'={sheet}!${v_col}$1',
+        'categories': f'={sheet}!$A$2:$A${last_row}',
+        'values': f'={sheet}!${v_col}$2:${v_col}${last_row}',
         'line': {'color': 'yellow'},
         'name_font': {'color':'white'},
         'num_font': {'color':'white'}
         })
 
     chart_current.add_series({
-        'name': f'=Data!${c_col}$1',
-        'categories': f'=Data!$A$1:$A${obj_ch1.record_length}',
-        'values': f'=Data!${c_col}$1:${c_col}${obj_ch1.record_length}',
+        'name': f'={sheet}!${c_col}$1',
+        'categories': f'={sheet}!$A$2:$A${last_row}',
+        'values': f'={sheet}!${c_col}$2:${c_col}${last_row}',
         'y2_axis': True,
         'line': {'color': 'cyan'},
         'name_font': {'color':'white'},
@@ -753,6 +1349,7 @@ def print_dict_PrettyTable(dict:dict, orientation:str='vertical', header:bool=Tr
     :param header : flag to print or not the table header.
     :param padding_width : padding between columns of the table.
     '''
+    from prettytable import PrettyTable
     table = PrettyTable(header=header, padding_width=padding_width)
 
     if orientation == 'v' or orientation == 'vertical':
@@ -774,11 +1371,30 @@ def print_dict_PrettyTable(dict:dict, orientation:str='vertical', header:bool=Tr
 
     
 
-def print_processing_info(obj):
+def _get_channel_name(obj):
     if obj.channel_number == 1:
-        channel_name = 'Tension (V)'
+        return 'Tension (V)'
     else:
-        channel_name = 'Current (A)'
+        return 'Current (A)'
+
+
+def get_delta_summary(obj):
+    ''' Picklable summary of the Delta time results (returned by the batch workers) '''
+    return {
+        'file_name' : obj.file_name,
+        'channel' : _get_channel_name(obj),
+        'delta_time' : obj.Delta.delta_time,
+        'delta_time_filtred' : obj.DeltaFiltred.delta_time,
+        'record_length' : obj.record_length,
+        'threshold_low' : obj.threshold_low,
+        'threshold_high' : obj.threshold_high,
+        'dominant_frequency' : float(obj.peaks['frequency'][0]) if len(obj.peaks) else None,
+        'stages' : obj.instrumentation.as_dict(),
+    }
+
+
+def print_processing_info(obj):
+    channel_name = _get_channel_name(obj)
 
     info_to_print = {
         'Channel' : channel_name,
@@ -792,5 +1408,62 @@ def print_processing_info(obj):
         'Time start Filtred (ms)' : f'{obj.DeltaFiltred.time_start:.6f}',
         'Time End Filtred (ms)' : f'{obj.DeltaFiltred.time_end:.6f}',
     }
+    if obj.auto_threshold:
+        info_to_print['  '] = ''
+        info_to_print[f'Threshold low (auto {obj.auto_threshold_low:g} %)'] = f'{obj.threshold_low:.6g}'
+        info_to_print[f'Threshold high (auto {obj.auto_threshold_high:g} %)'] = f'{obj.threshold_high:.6g}'
     print("\nDelta Time Info :")
     print_dict_PrettyTable(info_to_print, orientation='h', header=False)
+    print_events_info(obj)
+    print_spectrum_info(obj)
+
+
+def print_events_info(obj):
+    ''' Events of the raw and filtred values ('event_detection'), EVENTS_PRINT_MAX rows at most each '''
+    if not obj.event_detection:
+        return
+    from prettytable import PrettyTable
+    for label, events in (('Raw', obj.events), ('Filtred', obj.events_filtred)):
+        print(f"\nEvents {label} : {len(events)}")
+        if not len(events):
+            continue
+        table = PrettyTable(['#', 'Direction', 'Δt (ms)', 'Time start (ms)', 'Time End (ms)'])
+        for i, (direction, _, time_start, _, _, time_end, _, delta_time) in enumerate(events[:EVENTS_PRINT_MAX].tolist(), 1):
+            table.add_row([i, 'rising' if direction > 0 else 'falling', f'{delta_time:.2f}', f'{time_start * 1000:.3f}', f'{time_end * 1000:.3f}'])
+        print(table)
+        if len(events) > EVENTS_PRINT_MAX:
+            print(f"... {len(events) - EVENTS_PRINT_MAX} more events (see the Excel file)")
+
+
+def print_spectrum_info(obj):
+    ''' Dominant frequencies of the raw and filtred values ('spectral_analysis') '''
+    if not len(obj.peaks):
+        return
+    from prettytable import PrettyTable
+    resolution = obj.spectrum_frequencies[1] if len(obj.spectrum_frequencies) > 1 else 0
+    print(f"\nDominant Frequencies (Welch PSD, {obj.spectrum_window} window, resolution {resolution:.4g} Hz) :")
+    table = PrettyTable(['#', 'Raw (Hz)', 'PSD Raw', 'Filtred (Hz)', 'PSD Filtred'])
+    for i in range(max(len(obj.peaks), len(obj.peaks_filtred))):
+        row = [i + 1]
+        for peaks in (obj.peaks, obj.peaks_filtred):
+            row += [f"{peaks['frequency'][i]:.2f}", f"{peaks['psd'][i]:.3e}"] if i < len(peaks) else ['', '']
+        table.add_row(row)
+    print(table)
+
+
+def print_stage_info(obj):
+    ''' Wall time, CPU time, samples/s and peak memory of each measured stage ('instrumentation') '''
+    stages = obj.instrumentation.as_dict()
+    if not stages:
+        return
+
+    info_to_print = {}
+    for name, measure in stages.items():
+        text = f"{measure['wall_time_s']:.3f} s (CPU {measure['cpu_time_s']:.3f} s)"
+        if measure['samples_per_s'] is not None:
+            text += f" | {measure['samples_per_s']:.3g} samples/s"
+        if measure['peak_memory_mb'] is not None:
+            text += f" | peak {measure['peak_memory_mb']:.1f} MB"
+        info_to_print[name] = text
+    print(f"\nStages Info ({_get_channel_name(obj)}) :")
+    print_dict_PrettyTable(info_to_print, orientation='h', header=False, key_allign='l', value_allign='l')
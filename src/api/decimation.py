@@ -0,0 +1,70 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Decimation of long signals before they are drawn (Excel charts, figures).
+                    The record is cut into blocks and the samples holding the min and the max of
+                    each block are kept, so the spikes and the edges are preserved.
+
+Functions       :
+    - minmax_indexes(series_list:list, points:int)
+    - pixel_indexes(values, pixels:int)
+        - _split_blocks(length:int, blocks:int)
+        - _reshape_blocks(values, block_size:int, blocks:int)
+
+'''
+
+import math
+import numpy as np
+
+
+def minmax_indexes(series_list:list, points:int):
+    ''' Sorted indexes of the samples to keep : min and max of each block for every series of
+    series_list (same length), plus the first and the last sample. The indexes are shared by all
+    the series, so they can be written with the same time column.
+    Return None if the series have less than 'points' samples (nothing to decimate).
+    '''
+    length = len(series_list[0])
+    if points <= 0 or length <= points:
+        return None
+
+    block_size, offsets = _split_blocks(length, max(points // (2 * len(series_list)), 1))
+
+    indexes = [np.array([0, length - 1])]
+    for values in series_list:
+        blocks = _reshape_blocks(values, block_size, len(offsets))
+        indexes.append(offsets + np.argmin(blocks, axis=1))
+        indexes.append(offsets + np.argmax(blocks, axis=1))
+
+    return np.unique(np.minimum(np.concatenate(indexes), length - 1))
+
+
+def pixel_indexes(values, pixels:int):
+    ''' Sorted indexes of the samples to draw for a figure 'pixels' wide : the first, min, max and
+    last samples of each pixel column (M4 aggregation). The decimated line covers the same pixels
+    as the full one (same spikes, same edges), the drawing cost depends on the image width only.
+    Return None if there are less than 4 samples per pixel column (nothing to decimate).
+    '''
+    length = len(values)
+    if pixels <= 0 or length <= 4 * pixels:
+        return None
+
+    block_size, offsets = _split_blocks(length, pixels)
+    blocks = _reshape_blocks(values, block_size, len(offsets))
+    indexes = (offsets, offsets + block_size - 1,
+               offsets + np.argmin(blocks, axis=1), offsets + np.argmax(blocks, axis=1))
+
+    return np.unique(np.minimum(np.concatenate(indexes), length - 1))
+
+
+def _split_blocks(length:int, blocks:int):
+    ''' Return (block_size, offsets of the blocks) to cut 'length' samples into 'blocks' blocks at most '''
+    block_size = math.ceil(length / blocks)
+    return block_size, np.arange(math.ceil(length / block_size)) * block_size
+
+
+def _reshape_blocks(values, block_size:int, blocks:int):
+    ''' (blocks, block_size) view of values, the last block is padded with the last value '''
+    values = np.asarray(values)
+    return np.pad(values, (0, blocks * block_size - len(values)), mode='edge').reshape(blocks, block_size)
@@ -0,0 +1,173 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Vectorized threshold crossing detection used by CSV_Object._extract_indexes().
+                    The signal is compared to the threshold with numpy (no python loop, no float()
+                    per element and no reversed copy of the signal).
+
+                    With 'chunk_size' > 0 the scan starts from one end of the signal and stops at
+                    the first chunk containing a match (early exit) : the cost depends on the
+                    distance between the edge and the end of the record, not on the record length.
+
+                    Multi event detection : find_events() returns every transition between the low
+                    level (below threshold_low) and the high level (above threshold_high) as a
+                    structured array (EVENT_DTYPE), with hysteresis : the samples between the two
+                    thresholds keep the previous level, so the noise around one threshold does not
+                    create events. Each event uses the Delta convention : Start = last sample of the
+                    previous level, End = sample after the first sample of the new level.
+
+Functions       :
+    - find_first(values, threshold:float, above:bool, chunk_size:int=0)
+    - find_last(values, threshold:float, above:bool, chunk_size:int=0)
+        - _compare(values, threshold, above)
+    - find_events(times, values, reported_values, threshold_low:float, threshold_high:float, chunk_size:int=EVENTS_CHUNK_SIZE)
+
+Class           :
+    - TransitionDetector(threshold_low:float, threshold_high:float)
+        - push(position:int, times, values, reported_values)
+        - finish()
+
+'''
+
+import numpy as np
+
+
+DEFAULT_CHUNK_SIZE = 65536
+EVENTS_CHUNK_SIZE = 1 << 20     # samples per find_events() pass : bounded memory (levels + indexes)
+
+# direction : 1 rising (low -> high), -1 falling (high -> low). Times in s, delta_time in ms (2 decimals)
+EVENT_DTYPE = np.dtype([('direction', 'i1'), ('idx_start', 'i8'), ('time_start', 'f8'), ('value_start', 'f8'),
+                        ('idx_end', 'i8'), ('time_end', 'f8'), ('value_end', 'f8'), ('delta_time', 'f8')])
+
+
+def _compare(values, threshold, above):
+    if above:
+        return values > threshold
+    return values < threshold
+
+
+def find_first(values, threshold:float, above:bool, chunk_size:int=0):
+    ''' Index of the first value above (or below) threshold, None if there is no such value.
+    :param chunk_size: scan by chunks from the start of the signal and stop at the first match.
+                       0 : one vectorized pass on the whole signal.
+    '''
+    values = np.asarray(values)
+    if chunk_size <= 0:
+        chunk_size = max(len(values), 1)
+
+    for start in range(0, len(values), chunk_size):
+        mask = _compare(values[start:start + chunk_size], threshold, above)
+        if mask.any():
+            return start + int(np.argmax(mask))
+    return None
+
+
+def find_last(values, threshold:float, above:bool, chunk_size:int=0):
+    ''' Index of the last value above (or below) threshold, None if there is no such value.
+    :param chunk_size: scan by chunks from the end of the signal and stop at the first match.
+                       0 : one vectorized pass on the whole signal.
+    '''
+    values = np.asarray(values)
+    if chunk_size <= 0:
+        chunk_size = max(len(values), 1)
+
+    for stop in range(len(values), 0, -chunk_size):
+        start = max(stop - chunk_size, 0)
+        mask = _compare(values[start:stop], threshold, above)
+        if mask.any():
+            return stop - 1 - int(np.argmax(mask[::-1]))    # reversed view of the chunk mask only
+    return None
+
+
+class TransitionDetector():
+    ''' Every low / high level transition of a signal pushed chunk by chunk (see find_events()).
+    Only the last sample out of the thresholds band is carried over from one chunk to the next.
+    '''
+    def __init__(self, threshold_low:float, threshold_high:float):
+        self.threshold_low = threshold_low
+        self.threshold_high = threshold_high
+        self._last = None       # (level, index, time, value) of the last sample out of the band
+        self._pending = None    # event waiting for its End sample (first sample of the next chunk)
+        self._events = []       # EVENT_DTYPE arrays
+
+    def push(self, position:int, times, values, reported_values):
+        ''' :param position: index of values[0] in the record
+        :param reported_values: values stored in value_start / value_end (raw values)
+        '''
+        length = len(values)
+        if length == 0:
+            return
+        if self._pending is not None:
+            self._set_end(self._pending, 0, position, times[0], reported_values[0])
+            self._add(self._pending)
+            self._pending = None
+
+        levels = np.zeros(length, dtype=np.int8)
+        levels[values > self.threshold_high] = 1
+        levels[values < self.threshold_low] = -1
+        indexes = np.flatnonzero(levels)
+        if len(indexes) == 0:
+            return
+        levels = levels[indexes]
+
+        # transition k : from indexes[k] (last sample of a level) to indexes[k + 1] (first sample of the next level)
+        changes = np.flatnonzero(levels[1:] != levels[:-1])
+        starts, firsts = indexes[changes], indexes[changes + 1]
+        directions = levels[changes + 1]
+        carried = self._last is not None and self._last[0] != levels[0]     # the previous level ends in an earlier chunk
+
+        events = np.empty(len(changes) + carried, dtype=EVENT_DTYPE)
+        new_events = events[1:] if carried else events
+        new_events['idx_start'] = position + starts
+        new_events['time_start'] = times[starts]
+        new_events['value_start'] = reported_values[starts]
+        if carried:
+            _, events['idx_start'][0], events['time_start'][0], events['value_start'][0] = self._last
+            firsts = np.concatenate(([indexes[0]], firsts))
+            directions = np.concatenate(([levels[0]], directions))
+        events['direction'] = directions
+
+        ends = firsts + 1
+        complete = ends < length
+        self._set_end(events, complete, position + ends[complete], times[ends[complete]], reported_values[ends[complete]])
+        if len(events) and not complete[-1]:
+            # End sample in the next chunk, the first sample of the new level is kept if there is no next chunk
+            self._pending = events[-1:].copy()
+            self._set_end(self._pending, 0, position + firsts[-1], times[firsts[-1]], reported_values[firsts[-1]])
+            events = events[:-1]
+        self._add(events)
+
+        last = indexes[-1]
+        self._last = (levels[-1], position + last, times[last], reported_values[last])
+
+    def finish(self):
+        ''' Return the events (EVENT_DTYPE array) in time order '''
+        if self._pending is not None:
+            self._add(self._pending)
+            self._pending = None
+        if not self._events:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        return np.concatenate(self._events)
+
+    @staticmethod
+    def _set_end(events, selection, idx_end, time_end, value_end):
+        events['idx_end'][selection] = idx_end
+        events['time_end'][selection] = time_end
+        events['value_end'][selection] = value_end
+
+    def _add(self, events):
+        if len(events):
+            events['delta_time'] = np.round(np.abs(events['time_end'] - events['time_start']) * 1000, 2)
+            self._events.append(events)
+
+
+def find_events(times, values, reported_values, threshold_low:float, threshold_high:float, chunk_size:int=EVENTS_CHUNK_SIZE):
+    ''' Every low / high level transition of values (EVENT_DTYPE array), chunk_size samples at a time '''
+    detector = TransitionDetector(threshold_low, threshold_high)
+    chunk_size = max(chunk_size, 1)
+    for start in range(0, len(values), chunk_size):
+        stop = start + chunk_size
+        detector.push(start, times[start:stop], values[start:stop], reported_values[start:stop])
+    return detector.finish()
@@ -0,0 +1,117 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Columnar binary export of the processed data ('columnar_format' in config.ini) :
+                    one file per capture (both channels in the combined mode) holding the timebase,
+                    the raw and the filtred values of each channel and the Delta / DeltaFiltred
+                    results (+ dominant frequencies), for the downstream tools (no Excel row limit, no text parsing).
+
+                    Formats :
+                        - 'npz'     : numpy archive (no extra package), one array per column,
+                                      'results' : JSON text, 'events_*' : structured arrays
+                        - 'parquet' : Apache Parquet table (pyarrow), the results are stored
+                                      as JSON in the file metadata (key 'results')
+                        - 'hdf5'    : HDF5 file (h5py), one dataset per column, the results
+                                      as JSON in the 'results' attribute, 'events_*' datasets
+                    pyarrow / h5py are only imported when their format is used.
+
+                    Columns : same names as the Excel 'Data' sheet ('Time (s)', 'Tension (V)',
+                    'Tension (V) Filtred', 'Current (A)', 'Current (A) Filtred').
+                    In streaming mode the data is the decimated data of the CSV_Object.
+
+Functions       :
+    - get_columns(objs:list)
+    - get_results(objs:list)
+    - write_export(objs:list, file_path, export_format:str='npz')
+
+'''
+
+import json
+import numpy as np
+
+
+EXPORT_FORMATS = {      # format : file extension
+    'npz' : '.npz',
+    'parquet' : '.parquet',
+    'hdf5' : '.h5',
+}
+
+CHANNEL_NAMES = {1 : 'Tension (V)', 2 : 'Current (A)'}
+
+
+def get_columns(objs:list):
+    ''' {column name : numpy array} : shared timebase, then raw / filtred values of each channel '''
+    columns = {'Time (s)' : np.asarray(objs[0].times)}
+    for obj in objs:
+        name = CHANNEL_NAMES.get(obj.channel_number, f'Channel {obj.channel_number}')
+        columns[name] = np.asarray(obj.values)
+        columns[f'{name} Filtred'] = np.asarray(obj.values_filtred)
+    return columns
+
+
+def get_results(objs:list):
+    ''' JSON compatible Delta / DeltaFiltred results and parameters of each channel '''
+    results = {}
+    for obj in objs:
+        results[f'ch{obj.channel_number}'] = {
+            'file_name' : obj.file_name,
+            'record_length' : obj.record_length,
+            'sample_interval' : obj.sample_interval,
+            'trigger_point' : obj.trigger_point,
+            'trigger_time' : obj.trigger_time,
+            'horizontal_offset' : obj.horizontal_offset,
+            'filter' : obj.filter_label,
+            'threshold_low' : obj.threshold_low,
+            'threshold_high' : obj.threshold_high,
+            'streaming' : obj.streaming,
+            'delta' : obj.Delta.as_dict(),
+            'delta_filtred' : obj.DeltaFiltred.as_dict(),
+            'events' : len(obj.events),
+            'events_filtred' : len(obj.events_filtred),
+            'dominant_frequencies' : obj.peaks.tolist(),            # [(frequency (Hz), psd)]
+            'dominant_frequencies_filtred' : obj.peaks_filtred.tolist(),
+        }
+    return results
+
+
+def _get_events(objs:list):
+    ''' {'events_ch<n>' / 'events_filtred_ch<n>' : structured array} (event detection only) '''
+    events = {}
+    for obj in objs:
+        if obj.event_detection:
+            events[f'events_ch{obj.channel_number}'] = obj.events
+            events[f'events_filtred_ch{obj.channel_number}'] = obj.events_filtred
+    return events
+
+
+def _to_json(results:dict):
+    return json.dumps(results, default=float)    # numpy scalars
+
+
+def write_export(objs:list, file_path, export_format:str='npz'):
+    ''' Write the columns, the results and the events of objs (CSV_Object of one capture) to file_path '''
+    columns, results, events = get_columns(objs), get_results(objs), _get_events(objs)
+
+    if export_format == 'npz':
+        with open(file_path, 'wb') as f:
+            np.savez(f, **columns, results=np.array(_to_json(results)), **events)
+
+    elif export_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table(columns)
+        results['events_list'] = {name: array.tolist() for name, array in events.items()}
+        table = table.replace_schema_metadata({'results': _to_json(results)})
+        pq.write_table(table, file_path)
+
+    elif export_format == 'hdf5':
+        import h5py
+        with h5py.File(file_path, 'w') as f:
+            for name, array in list(columns.items()) + list(events.items()):
+                f.create_dataset(name, data=array)
+            f.attrs['results'] = _to_json(results)
+
+    else:
+        raise ValueError(f"Unknown export format '{export_format}' ! Available formats : {', '.join(EXPORT_FORMATS)}")
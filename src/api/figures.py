@@ -0,0 +1,132 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Figures engine used by CSV_Object.create_figures().
+                    The 4 'png' files of a channel (raw / filtred, with and without the Delta time
+                    lines) are drawn with one figure, one line and one Agg canvas (no pyplot state).
+
+                    For each series (raw, filtred) the figure is rendered once without the title and
+                    the Delta time annotations, then for each 'png' file only the title (+ the
+                    annotations) is drawn on top of the rendered image before saving it :
+                    2 full renders per channel instead of 4.
+
+Class           :
+    - FigureRenderer(obj, dpi:int=300, grid:bool=True, black_bg:bool=True, x_label:str='Time (s)')
+        - render(filtred:bool, file_name:str, file_name_vline:str)
+        - _set_annotations(Delta, events)
+        - _save(image_path, image_file, options:tuple)
+
+'''
+
+import os
+import numpy as np
+import matplotlib.image as mpimg
+from matplotlib.figure import Figure, figaspect
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from colorama import Fore
+
+
+class FigureRenderer():
+    def __init__(self, obj, dpi:int=300, grid:bool=True, black_bg:bool=True, x_label:str='Time (s)'):
+        self.obj = obj
+        self.dpi = dpi
+        self.options = ('png', dpi, grid, black_bg, x_label)    # options of the files (output cache key)
+
+        w, h = figaspect(0.5)
+        self.figure = Figure(figsize=(w, h), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.title = self.figure.suptitle('', fontsize=14, fontweight='bold')
+
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_xlabel(x_label)
+        if obj.channel_number == 1:
+            color = 'yellow'
+            self.ax.set_ylabel('Tension (V)')
+        else:
+            color = 'cyan'
+            self.ax.set_ylabel('Current (A)')
+
+        self.line, = self.ax.plot([], [], linewidth=1, color=color)
+
+        if black_bg:
+            self.ax.set_facecolor((0,0,0))
+            self.text_color = 'white'
+        else:
+            self.text_color = 'black'
+
+        if grid:
+            self.ax.grid()
+
+        self.annotations = []
+
+
+    def render(self, filtred:bool, file_name:str, file_name_vline:str):
+        ''' Save the figure of the raw (or filtred) values without (file_name) and with (file_name_vline)
+        the Delta time annotations. Each file title is its file name, the up to date files are skipped.
+        '''
+        images = []
+        for image_file, add_vline in ((file_name, False), (file_name_vline, True)):
+            image_path = os.path.join(self.obj.directory, self.obj.processed_dir, image_file)
+            if self.obj._is_output_up_to_date(image_path, *self.options, filtred, add_vline):
+                print(f"Figure 'png' file is up to date : '{image_file}'")
+            else:
+                images.append((image_file, image_path, add_vline))
+
+        if not images:
+            return
+        self.obj._create_processed_dir()
+
+        times, values, Delta = self.obj._get_plot_series(filtred, int(self.figure.get_figwidth() * self.dpi))
+        self.line.set_data(times, values)
+        self._set_annotations(Delta, self.obj.get_events(filtred))
+        self.ax.relim(visible_only=True)    # the hidden annotations do not change the axes limits
+        self.ax.autoscale_view()
+
+        # Full render without the title and the annotations :
+        self.title.set_visible(False)
+        self.canvas.draw()
+        background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+        for image_file, image_path, add_vline in images:
+            self.canvas.restore_region(background)
+            self.title.set_text(image_file)
+            self.title.set_visible(True)
+            self.figure.draw_artist(self.title)
+            if add_vline:
+                for artist in self.annotations:
+                    artist.set_visible(True)
+                    self.ax.draw_artist(artist)
+                    artist.set_visible(False)
+            self._save(image_path, image_file, (*self.options, filtred, add_vline))
+
+
+    def _set_annotations(self, Delta, events):
+        ''' Replace the Delta time lines + texts and the events lines (hidden, only drawn on top of the rendered image) '''
+        for artist in self.annotations:
+            artist.remove()
+
+        time_v_pos = self.obj.threshold_low
+        delta_v_pos = self.obj.threshold_high
+        h_pos = float(Delta.time_end + Delta.time_start)/2 - 0.02
+        self.annotations = [
+            self.ax.axvline(x=Delta.time_start, linewidth=2),
+            self.ax.text(Delta.time_start + 0.003, time_v_pos, f'Time Start\n{round(Delta.time_start * 1000, 2)} ms', color=self.text_color),
+            self.ax.axvline(x=Delta.time_end, linewidth=2),
+            self.ax.text(Delta.time_end + 0.003, time_v_pos, f'Time End\n{round(Delta.time_end * 1000, 2)} ms', color=self.text_color),
+            self.ax.text(h_pos, delta_v_pos, rf'$Δt = {Delta.delta_time}$ ms', fontsize=12, color=self.text_color),
+            ]
+        if len(events) > 1:     # all the transitions : one line collection, whatever the number of events
+            self.annotations.extend(self.obj._add_events_lines(self.ax, events))
+        for artist in self.annotations:
+            artist.set_visible(False)
+
+
+    def _save(self, image_path, image_file, options:tuple):
+        try:
+            mpimg.imsave(image_path, np.asarray(self.canvas.buffer_rgba()), format='png', origin='upper', dpi=self.dpi)
+            print(f"Figure 'png' file created with success : '{image_file}'")
+            self.obj._record_output(image_path, *options)
+        except Exception as e:
+            print(f"{Fore.RED}\nCould not create Figure 'png' file !! \nPNG path : {image_path}\nError Message : {e}")
@@ -0,0 +1,156 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Filtering engine used by CSV_Object.apply_filter().
+                    Every filter takes a numpy array of values and the window size N
+                    and returns a new numpy array with the same length.
+
+                    Available filters (selected with 'filter_type' in config.ini) :
+                        - 'sma'    : Simple Moving Average (running sums, linear cost, independent of N)
+                        - 'ema'    : Exponential Moving Average (alpha = 2 / (N + 1))
+                        - 'median' : Moving Median
+                        - 'savgol' : Savitzky-Golay smoothing (polynomial order 'savgol_polyorder')
+
+                    The windowed filters keep the v1.1 edge handling : the first and the last
+                    samples (half window) are copied from the unfiltered data.
+
+Functions       :
+    - apply_filter(values, N, filter_type='sma', exact=False, polyorder=2)
+    - moving_average(values, N, exact=False)
+    - window_means(values, lo, hi, exact=False)
+        - _exact_window_means(values, lo, hi)
+    - exponential_moving_average(values, N)
+    - moving_median(values, N, chunk_size=65536)
+    - savitzky_golay(values, N, polyorder=2)
+        - _savgol_coefficients(N, polyorder)
+
+'''
+
+import itertools
+import numpy as np
+
+
+FILTER_TYPES = ('sma', 'ema', 'median', 'savgol')
+
+
+def apply_filter(values, N:int, filter_type:str='sma', exact:bool=False, polyorder:int=2):
+    if filter_type == 'sma':
+        return moving_average(values, N, exact=exact)
+    elif filter_type == 'ema':
+        return exponential_moving_average(values, N)
+    elif filter_type == 'median':
+        return moving_median(values, N)
+    elif filter_type == 'savgol':
+        return savitzky_golay(values, N, polyorder=polyorder)
+    else:
+        raise ValueError(f"Unknown filter type '{filter_type}' ! Available filters : {', '.join(FILTER_TYPES)}")
+
+
+def moving_average(values, N:int, exact:bool=False):
+    ''' Simple Moving Average computed from a cumulative sum : linear cost, independent of N.
+    The output layout is the one of v1.1 (statistics.mean loop) :
+        - values_filtred[:n-1] and values_filtred[-n:] are copied from the raw values (n = N // 2)
+        - values_filtred[j] = mean(values[j+1-n : j+n+2]) for j in [n-1, record_length-n-1]
+          (the last window is truncated by the end of the record)
+    :param exact: compute each mean with exact integer arithmetic, the result is bit-for-bit
+                  identical to statistics.mean() (slower, but still linear).
+    '''
+    values = np.asarray(values)
+    record_length = len(values)
+    n = int(N/2)
+    values_filtred = values.copy()
+    if record_length < 2*n + 1:
+        return values_filtred
+
+    lo = np.arange(0, record_length - 2*n + 1)
+    hi = np.minimum(lo + 2*n + 1, record_length)
+    means = window_means(values, lo, hi, exact=exact)
+
+    values_filtred[n-1:record_length-n] = means
+    values_filtred[record_length-n:] = values[record_length-n:]
+    return values_filtred
+
+
+def window_means(values, lo, hi, exact:bool=False):
+    ''' Mean of values[lo:hi] for each (lo, hi) window, computed from a cumulative sum '''
+    if exact:
+        return _exact_window_means(values, lo, hi)
+
+    # Remove the offset before summing to keep the cumulative sum small (better precision)
+    offset = values.mean(dtype=np.float64)
+    cumsum = np.concatenate(([0.0], np.cumsum(values - offset, dtype=np.float64)))
+    return (cumsum[hi] - cumsum[lo]) / (hi - lo) + offset
+
+
+def _exact_window_means(values, lo, hi):
+    ''' Correctly rounded mean of values[lo:hi] for each window (same result as statistics.mean()).
+    Each float is written as an integer scaled by a common power of 2, so the running sums
+    are exact (python int) and only the final division is rounded.
+    '''
+    mantissa, exponent = np.frexp(np.asarray(values, dtype=np.float64))
+    min_exponent = int(exponent.min())
+    integers = (mantissa * 2.0**53).astype(np.int64).astype(object)
+    scaled = np.left_shift(integers, (exponent - min_exponent).astype(object))
+
+    cumsum = np.empty(len(scaled) + 1, dtype=object)
+    cumsum[0] = 0
+    np.cumsum(scaled, out=cumsum[1:])
+    sums = cumsum[hi] - cumsum[lo]
+
+    # values = integers * 2**(min_exponent - 53)
+    scale = min_exponent - 53
+    counts = (hi - lo).astype(object)
+    if scale < 0:
+        means = sums / np.left_shift(counts, -scale)
+    else:
+        means = np.left_shift(sums, scale) / counts
+    return means.astype(np.float64)
+
+
+def exponential_moving_average(values, N:int):
+    values = np.asarray(values)
+    alpha = 2 / (N + 1)
+    ema = itertools.accumulate(values.tolist(), lambda previous, value: previous + alpha * (value - previous))
+    return np.fromiter(ema, dtype=values.dtype, count=len(values))
+
+
+def moving_median(values, N:int, chunk_size:int=65536):
+    values = np.asarray(values)
+    record_length = len(values)
+    n = int(N/2)
+    window = 2*n + 1
+    values_filtred = values.copy()
+    if record_length < window:
+        return values_filtred
+
+    # (record_length - 2n, window) view on the data, processed by chunks to bound memory
+    windows = np.lib.stride_tricks.as_strided(values, shape=(record_length - window + 1, window),
+                                              strides=(values.strides[0], values.strides[0]), writeable=False)
+    for start in range(0, len(windows), chunk_size):
+        chunk = windows[start:start + chunk_size]
+        values_filtred[n + start : n + start + len(chunk)] = np.median(chunk, axis=1)
+    return values_filtred
+
+
+def _savgol_coefficients(N:int, polyorder:int):
+    n = int(N/2)
+    if polyorder >= 2*n + 1:
+        raise ValueError(f"'savgol_polyorder' ({polyorder}) must be less than the window size ({2*n + 1}) !")
+    positions = np.arange(-n, n + 1, dtype=np.float64)
+    vandermonde = np.vander(positions, polyorder + 1, increasing=True)
+    return np.linalg.pinv(vandermonde)[0]   # smoothed value at the center of the window
+
+
+def savitzky_golay(values, N:int, polyorder:int=2):
+    values = np.asarray(values)
+    record_length = len(values)
+    n = int(N/2)
+    values_filtred = values.copy()
+    if record_length < 2*n + 1:
+        return values_filtred
+
+    coefficients = _savgol_coefficients(N, polyorder)
+    values_filtred[n:record_length-n] = np.convolve(values, coefficients[::-1], mode='valid')
+    return values_filtred
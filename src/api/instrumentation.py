@@ -0,0 +1,112 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Per stage measurements of a CSV_Object ('instrumentation' in config.ini) and
+                    progress display of the long stages.
+
+                    Stages : parse, calibrate, filter, delta, spectrum, plot, excel, export
+                    (streaming mode : 'stream' = parse + calibrate + filter + delta in one pass)
+                    For each stage : wall time, CPU time (of the thread running the stage : right with
+                    the pipeline threads too), samples/s and, with 'instrumentation_memory',
+                    the peak memory allocated during the stage (tracemalloc : slower, disabled by default).
+                    The tracemalloc peak is global to the process : the memory is not measured with the
+                    pipeline threads (disabled by batch.run_batch), only with the sequential processing.
+                    A stage run several times (e.g. plot) is summed.
+
+                    The progress is printed at most every 'progress_interval' seconds (not for every
+                    sample), only on a console (not in the worker processes : their output is captured).
+                    The label is the text already printed on the line ('<label> ... ').
+
+Classes         :
+    - Instrumentation(enabled:bool=True, trace_memory:bool=False)
+        - stage(name:str, samples_function=None)
+        - as_dict()
+    - Progress(label:str, total:int, interval:float=0.5)
+        - update(done:int)
+        - finish()
+
+'''
+
+import sys, time, tracemalloc, contextlib
+
+
+STAGES = ('parse', 'calibrate', 'stream', 'filter', 'delta', 'spectrum', 'plot', 'excel', 'export')
+
+
+class Instrumentation():
+    def __init__(self, enabled:bool=True, trace_memory:bool=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = {}    # name : [wall time (s), cpu time (s), samples, peak memory (bytes) or None]
+
+    @contextlib.contextmanager
+    def stage(self, name:str, samples_function=None):
+        ''' Measure the code of the 'with' block as stage 'name'.
+        :param samples_function: called at the end of the stage, returns the number of processed samples.
+        '''
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'):  # python >= 3.9, else peak since the start of tracemalloc
+                tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            peak = tracemalloc.get_traced_memory()[1] - memory_start if self.trace_memory else None
+            samples = samples_function() if samples_function is not None else 0
+
+            measure = self.stages.setdefault(name, [0.0, 0.0, samples, None])
+            measure[0] += wall
+            measure[1] += cpu
+            measure[2] = samples
+            if peak is not None:
+                measure[3] = max(measure[3] or 0, peak)
+
+    def as_dict(self):
+        ''' {stage : {'wall_time_s', 'cpu_time_s', 'samples', 'samples_per_s', 'peak_memory_mb'}} in the STAGES order '''
+        report = {}
+        for name in sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            wall, cpu, samples, peak = self.stages[name]
+            report[name] = {
+                'wall_time_s' : wall,
+                'cpu_time_s' : cpu,
+                'samples' : samples,
+                'samples_per_s' : samples / wall if wall > 0 and samples else None,
+                'peak_memory_mb' : peak / 1024**2 if peak is not None else None,
+            }
+        return report
+
+
+class Progress():
+    def __init__(self, label:str, total:int, interval:float=0.5):
+        self.label = label
+        self.total = max(total, 1)
+        self.interval = interval
+        self.enabled = interval > 0 and sys.stdout.isatty()
+        self._next_time = time.perf_counter() + interval     # nothing printed for the short stages
+        self._printed = False
+
+    def update(self, done:int):
+        ''' Cheap to call often : prints only if 'interval' seconds passed since the last print '''
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now < self._next_time:
+            return
+        self._next_time = now + self.interval
+        self._printed = True
+        print(f"\r{self.label} ... {min(done / self.total, 1):.0%}", end='', flush=True)
+
+    def finish(self):
+        ''' Remove the percentage (if printed) : the line is back to '<label> ... ' '''
+        if self._printed:
+            print(f"\r{self.label} ... {' ' * 5}\r{self.label} ...", end=' ', flush=True)
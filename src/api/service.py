@@ -0,0 +1,291 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Local analysis service (python main.py --serve) : a long running process for the
+                    test benches, each capture is analysed by a warm worker process and the Delta time
+                    results are returned as JSON (no interpreter start, no imports, no config.ini
+                    read per capture).
+
+                    - The configuration is read and validated once (main.py), sent once to each worker
+                      process (as batch.run_batch) and kept in memory ('POST /reload' reads it again).
+                    - The process pool is started with the service : each worker imports the modules
+                      loaded on demand (warm_up) before the first request.
+                    - The requests are handled by threads : 'workers' captures are analysed at the same
+                      time, the other requests wait for a free worker.
+
+                    Address : 'host:port' (HTTP over TCP, default 127.0.0.1:8765, local only) or the
+                    path of a Unix socket (HTTP over the socket, POSIX only : curl --unix-socket <path>).
+
+                    Requests :
+                        - POST /analyze : JSON body
+                            {"path" : "<capture>"}                  one channel file
+                            {"ch1" : "<capture>", "ch2" : "<capture>"}   Ch1 + Ch2 combined
+                            "output" : output profile (default 'delta' : JSON only, no file),
+                            "log" : true to get the console output of the analysis
+                          The captures are '.csv', '.csv.gz' files or zip members ('bundle.zip/X_Ch1.csv'),
+                          absolute paths or relative to the service working directory.
+                          Response : {"status", "title", "files" (data_analysis.get_delta_summary() of each
+                          channel), "elapsed_ms"} ; 400 : wrong request, 500 : the analysis failed ("error").
+                        - GET /status : configuration file, workers, output profiles, served requests
+                        - POST /reload : read the configuration file again and restart the workers
+
+Classes         :
+    - AnalysisService(process_functions:dict, outputs:tuple, config, workers:int=1, warm_up_modules:tuple=())
+        - start()
+        - reload(config)
+        - analyze(request:dict)
+        - get_status()
+        - close()
+
+Functions       :
+    - warm_up(modules:tuple)
+    - parse_address(address:str)
+    - create_server(service, address:str=DEFAULT_ADDRESS)
+    - serve(service, address:str=DEFAULT_ADDRESS, reload_config=None)
+
+'''
+
+import os, re, json, time, socket, signal, importlib, threading, traceback, socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from colorama import Fore, init
+from api import batch, archives, data_analysis
+init(autoreset=True)
+
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+MAX_REQUEST_SIZE = 1 << 20     # bytes of a request body
+
+_ANSI_CODES = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class RequestError(ValueError):
+    ''' Wrong request (HTTP 400) '''
+
+
+def warm_up(modules:tuple):
+    ''' Run in each worker process when the service starts : import the modules loaded on demand '''
+    for module_name in modules:
+        importlib.import_module(module_name)
+    return os.getpid()
+
+
+class AnalysisService():
+    def __init__(self, process_functions:dict, outputs:tuple, config, workers:int=1, warm_up_modules:tuple=()):
+        '''
+        :param process_functions: {'separate' : function(csv_directory, file_name, output),
+                                   'combined' : function(csv_directory, file_name_ch1, file_name_ch2, output)}
+                                  returning the list of data_analysis.get_delta_summary() (main.py)
+        :param outputs: output profiles accepted by the requests
+        '''
+        self.process_functions = process_functions
+        self.outputs = tuple(outputs)
+        self.config = config
+        self.workers = max(1, workers)
+        self.warm_up_modules = tuple(warm_up_modules)
+        self.executor = None
+        self.started = None
+        self.requests = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        ''' Start the worker processes and wait until each one has imported the processing modules '''
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=batch._init_worker, initargs=(self.config,))
+        # one task per worker (the processes are started on demand, no idle worker when they are submitted)
+        for future in [executor.submit(warm_up, self.warm_up_modules) for _ in range(self.workers)]:
+            future.result()
+        with self._lock:
+            previous, self.executor = self.executor, executor
+        if self.started is None:
+            self.started = time.time()
+        if previous is not None:
+            previous.shutdown(wait=True)    # the running analyses are finished by the old workers
+
+    def reload(self, config):
+        ''' Use a new configuration : new warm workers, the analyses in progress keep the previous one '''
+        self.config = config
+        self.start()
+
+    def _get_file(self, request:dict, key:str):
+        file_path = request.get(key)
+        if not isinstance(file_path, str) or not file_path:
+            raise RequestError(f"'{key}' must be the path of a capture")
+        file_path = os.path.abspath(file_path)
+        if not archives.is_capture_name(file_path):
+            raise RequestError(f"Not a capture file ('.csv', '.csv.gz') : {file_path}")
+        try:
+            archives.get_stat(file_path)    # file or zip member
+        except (OSError, KeyError):
+            raise RequestError(f"File not found : {file_path}") from None
+        return file_path
+
+    def _get_task(self, request:dict):
+        ''' (processing function, args, title) of a request '''
+        if not isinstance(request, dict):
+            raise RequestError('The request must be a JSON object')
+        output = request.get('output', 'delta')
+        if output not in self.outputs:
+            raise RequestError(f"Unknown output '{output}' ! Available outputs : {', '.join(self.outputs)}")
+
+        if 'ch1' in request or 'ch2' in request:
+            file_path_ch1, file_path_ch2 = self._get_file(request, 'ch1'), self._get_file(request, 'ch2')
+            title = data_analysis.get_display_name((archives.get_csv_name(file_path_ch1), archives.get_csv_name(file_path_ch2)))
+            return self.process_functions['combined'], ('', file_path_ch1, file_path_ch2, output), title
+        if 'path' in request:
+            file_path = self._get_file(request, 'path')
+            return self.process_functions['separate'], ('', file_path, output), archives.get_csv_name(file_path)
+        raise RequestError("Missing capture : 'path' (one channel) or 'ch1' + 'ch2' (combined)")
+
+    def analyze(self, request:dict):
+        ''' Analyse the capture(s) of the request in a worker process and return the JSON response (dict).
+        Raise RequestError for a wrong request.
+        '''
+        function, args, title = self._get_task(request)
+        start = time.perf_counter()
+        try:
+            with self._lock:    # not submitted to workers being replaced (reload)
+                future = self.executor.submit(batch._run_task, function, args, True)
+            result, error, output = future.result()
+        except BrokenProcessPool:   # a worker process crashed : new workers for the next requests
+            result, error, output = None, traceback.format_exc(), ''
+            self.start()
+
+        response = {'status': 'failed' if error else 'ok', 'title': title}
+        if error:
+            response['error'] = error
+        else:
+            response['files'] = result
+        response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        if request.get('log'):
+            response['log'] = _ANSI_CODES.sub('', output)
+
+        with self._lock:
+            self.requests += 1
+            self.failed += bool(error)
+        return response
+
+    def get_status(self):
+        return {
+            'config': self.config.ini_path,
+            'workers': self.workers,
+            'outputs': list(self.outputs),
+            'uptime_s': round(time.time() - self.started, 1) if self.started else 0,
+            'requests': self.requests,
+            'failed': self.failed,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'DataAnalysisAIT'
+
+    def _send_json(self, status:int, content:dict):
+        body = json.dumps(content, default=float).encode()     # numpy scalars
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_SIZE:
+            raise RequestError(f'Request too large ({length} bytes)')
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            raise RequestError(f'Wrong JSON : {e}') from None
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.server.service.get_status())
+        else:
+            self._send_json(404, {'status': 'failed', 'error': f'Unknown path : {self.path}'})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            if self.path == '/analyze':
+                response = service.analyze(self._read_json())
+                self._send_json(500 if response['status'] == 'failed' else 200, response)
+                print(f"{Fore.RED if response['status'] == 'failed' else Fore.GREEN}{response['status'].upper()}{Fore.RESET} "
+                      f"{response['title']} ({response['elapsed_ms']:.1f} ms)")
+            elif self.path == '/reload':
+                self._read_json()
+                self.server.reload_config()
+                self._send_json(200, dict({'status': 'ok'}, **service.get_status()))
+            else:
+                self._send_json(404, {'status': 'failed', 'error': f'Unknown path : {self.path}'})
+        except ValueError as e:     # RequestError, wrong configuration file (reload)
+            self._send_json(400, {'status': 'failed', 'error': str(e)})
+
+    def log_message(self, format, *args):
+        pass    # the analyses are printed by do_POST
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address) and not os.path.isfile(self.server_address):
+            os.remove(self.server_address)  # socket left by a previous service
+        super().server_bind()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def parse_address(address:str):
+    ''' ('tcp', (host, port)) for 'host:port' / ':port', ('unix', path) for a Unix socket path '''
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return 'tcp', (host or '127.0.0.1', int(port))
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError(f"Wrong address '{address}' (expected host:port, Unix sockets are not available)")
+    return 'unix', address
+
+
+def create_server(service, address:str=DEFAULT_ADDRESS):
+    ''' HTTP server of the service (not started) : threads handle the requests '''
+    family, server_address = parse_address(address)
+    server_class = ThreadingHTTPServer if family == 'tcp' else _ThreadingUnixHTTPServer
+    server = server_class(server_address, _RequestHandler)
+    server.service = service
+    server.reload_config = lambda: service.reload(service.config)
+    return server
+
+
+def _stop_service(signum, frame):
+    raise KeyboardInterrupt     # SIGTERM (service manager) : same stop as Ctrl+C
+
+
+def serve(service, address:str=DEFAULT_ADDRESS, reload_config=None):
+    ''' Start the workers and handle the requests until Ctrl+C / SIGTERM.
+    :param reload_config: function returning the configuration read again ('POST /reload')
+    '''
+    server = create_server(service, address)     # address in use : OSError before the workers are started
+    if reload_config is not None:
+        server.reload_config = lambda: service.reload(reload_config())
+    signal.signal(signal.SIGTERM, _stop_service)
+    try:
+        print(f"\nStarting {service.workers} worker(s) ...")
+        start = time.perf_counter()
+        service.start()
+        print(f"{Fore.GREEN}Workers ready ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        print(f"Analysis service listening on {address} (Ctrl+C to stop) ...\n")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping the analysis service ...")
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,249 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Run configuration : 'config.ini' is read and validated once per run, the
+                    CSV_Object instances get their parameters from the Config object (no file read,
+                    no directory creation when an object is created).
+
+                    Parameters :
+                        - SETTINGS : global parameters ('key' : (type, default), default None : required).
+                          The shipped config.ini holds the same values (checked by benchmarks.regression)
+                        - CHANNEL_SETTINGS : per channel parameters, written '<key>_ch<channel number>'
+                          in config.ini. 'N_ch<n>' is optional (default : N)
+
+                    The command line overrides ('--set key=value') are applied before the validation.
+                    The Config object is sent to the worker processes (see batch.run_batch).
+
+Classes         :
+    - ChannelProfile(channel_number:int, N:int, calibration_value:float, threshold_low:float, threshold_high:float)
+    - Config()
+        - get_channel(channel_number:int)
+        - get_workers()
+
+Functions       :
+    - get_ini_path()
+    - load_config(ini_path=None, overrides:dict=None)
+        - _convert(key:str, value:str, value_type)
+        - _validate(config)
+    - parse_overrides(items:list)
+    - get_config()
+    - set_config(config)
+
+'''
+
+import os, re, configparser
+from api import filters, export, spectrum
+
+
+SETTINGS = {
+    'N' : (int, None),
+    'filter_type' : (str, 'sma'),
+    'savgol_polyorder' : (int, 2),
+    'filter_exact' : (bool, True),
+    'early_exit_scan' : (bool, True),
+    'event_detection' : (bool, False),
+    'auto_threshold' : (bool, False),
+    'auto_threshold_low' : (float, 10),
+    'auto_threshold_high' : (float, 90),
+    'spectral_analysis' : (bool, False),
+    'spectrum_window' : (str, 'hann'),
+    'spectrum_segment' : (int, 4096),
+    'spectrum_overlap' : (float, 50),
+    'spectrum_peaks' : (int, 5),
+    'cache' : (bool, False),
+    'cache_dir' : (str, 'Processed Data/.cache'),
+    'cache_max_size_mb' : (float, 2048),
+    'sidecar' : (bool, False),
+    'sidecar_dir' : (str, 'Processed Data/.sidecar'),
+    'streaming' : (bool, False),
+    'chunk_rows' : (int, 1000000),
+    'decimation_points' : (int, 20000),
+    'excel_chart_points' : (int, 20000),
+    'plot_decimation' : (bool, True),
+    'columnar_format' : (str, 'none'),
+    'dtype' : (str, 'float64'),
+    'workers' : (int, 1),
+    'pipeline' : (bool, False),
+    'catalog' : (bool, False),
+    'catalog_file' : (str, 'Processed Data/.catalog.sqlite'),
+    'instrumentation' : (bool, True),
+    'instrumentation_memory' : (bool, False),
+    'progress_interval' : (float, 0.5),
+    'processed_dir' : (str, None),
+}
+
+CHANNEL_SETTINGS = {
+    'N' : int,
+    'calibration_value' : float,
+    'threshold_low' : float,
+    'threshold_high' : float,
+}
+
+DTYPES = ('float32', 'float64')
+
+_CHANNEL_KEY = re.compile(r'^(?P<key>\w+?)_ch(?P<channel>\d+)$')
+
+_config = None  # Config of the current process, see get_config()
+
+
+class ChannelProfile():
+    __slots__ = ('channel_number', 'N', 'calibration_value', 'threshold_low', 'threshold_high')
+
+    def __init__(self, channel_number:int, N:int, calibration_value:float, threshold_low:float, threshold_high:float):
+        self.channel_number = channel_number
+        self.N = N
+        self.calibration_value = calibration_value
+        self.threshold_low = threshold_low
+        self.threshold_high = threshold_high
+
+
+class Config():
+    __slots__ = ('ini_path', 'channels') + tuple(SETTINGS)
+
+    def __init__(self):
+        self.ini_path = None
+        self.channels = {}  # channel number : ChannelProfile
+        for key, (_, default) in SETTINGS.items():
+            setattr(self, key, default)
+
+    def get_channel(self, channel_number:int):
+        try:
+            return self.channels[channel_number]
+        except KeyError:
+            raise ValueError(f"No parameters for channel {channel_number} in '{self.ini_path}' "
+                             f"(calibration_value_ch{channel_number}, threshold_low_ch{channel_number}, threshold_high_ch{channel_number}) !")
+
+    def get_workers(self):
+        ''' Number of worker processes (0 : all CPU cores) '''
+        if self.workers <= 0:
+            return os.cpu_count() or 1
+        return self.workers
+
+
+def get_ini_path():
+    src_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(src_dir_path, 'config.ini')
+
+
+def load_config(ini_path=None, overrides:dict=None):
+    ''' Read, convert and validate the parameters of ini_path (default : config.ini) + overrides.
+    Raise ValueError with the wrong parameter in the message.
+    '''
+    if ini_path is None:
+        ini_path = get_ini_path()
+
+    parser = configparser.ConfigParser()
+    if not parser.read(ini_path):
+        raise ValueError(f"Config file not found : '{ini_path}'")
+
+    values = dict(parser['DEFAULT'])
+    for key, value in (overrides or {}).items():
+        values[key.lower()] = value     # configparser keys are lower case
+
+    config = Config()
+    config.ini_path = ini_path
+    setting_keys = {key.lower(): key for key in SETTINGS}
+    channel_keys = {key.lower(): key for key in CHANNEL_SETTINGS}
+    channel_values = {}
+
+    for name, value in values.items():
+        match = _CHANNEL_KEY.match(name)
+        if name in setting_keys:
+            key = setting_keys[name]
+            setattr(config, key, _convert(name, value, SETTINGS[key][0]))
+        elif match and match.group('key') in channel_keys:
+            key = channel_keys[match.group('key')]
+            channel = channel_values.setdefault(int(match.group('channel')), {})
+            channel[key] = _convert(name, value, CHANNEL_SETTINGS[key])
+        else:
+            raise ValueError(f"Unknown parameter '{name}'")
+
+    for key in SETTINGS:
+        if getattr(config, key) is None:
+            raise ValueError(f"Missing parameter '{key}'")
+
+    config.filter_type = config.filter_type.lower()
+    config.columnar_format = config.columnar_format.lower()
+    config.spectrum_window = config.spectrum_window.lower()
+    for channel_number, channel in sorted(channel_values.items()):
+        for key in ('calibration_value', 'threshold_low', 'threshold_high'):
+            if key not in channel:
+                raise ValueError(f"Missing parameter '{key}_ch{channel_number}'")
+        config.channels[channel_number] = ChannelProfile(channel_number, channel.get('N', config.N), channel['calibration_value'],
+                                                         channel['threshold_low'], channel['threshold_high'])
+
+    _validate(config)
+    return config
+
+
+def _convert(key:str, value:str, value_type):
+    try:
+        if value_type is bool:
+            return configparser.ConfigParser.BOOLEAN_STATES[value.strip().lower()]
+        return value_type(value)
+    except (KeyError, ValueError):
+        expected = "'yes' or 'no'" if value_type is bool else f"'{value_type.__name__}'"
+        raise ValueError(f"Wrong value for '{key}' : '{value}' (expected {expected})") from None
+
+
+def _validate(config):
+    for name, N in [('N', config.N)] + [(f'N_ch{n}', channel.N) for n, channel in config.channels.items()]:
+        if N < 3 or N % 2 == 0:
+            raise ValueError(f"'{name}' must be an odd number >= 3 (got {N})")
+        if config.filter_type == 'savgol' and not 0 <= config.savgol_polyorder < N:
+            raise ValueError(f"'savgol_polyorder' must be less than '{name}' ({N})")
+
+    if config.filter_type not in filters.FILTER_TYPES:
+        raise ValueError(f"Unknown filter type '{config.filter_type}' ! Available filters : {', '.join(filters.FILTER_TYPES)}")
+    if config.columnar_format != 'none' and config.columnar_format not in export.EXPORT_FORMATS:
+        raise ValueError(f"'columnar_format' must be one of : none, {', '.join(export.EXPORT_FORMATS)} (got '{config.columnar_format}')")
+    if config.dtype not in DTYPES:
+        raise ValueError(f"'dtype' must be one of : {', '.join(DTYPES)} (got '{config.dtype}')")
+
+    if config.spectrum_window not in spectrum.WINDOW_TYPES:
+        raise ValueError(f"Unknown spectrum window '{config.spectrum_window}' ! Available windows : {', '.join(spectrum.WINDOW_TYPES)}")
+    if not 0 <= config.spectrum_overlap < 100:
+        raise ValueError(f"'spectrum_overlap' must be a percent >= 0 and < 100 (got {config.spectrum_overlap})")
+
+    for key, minimum in (('chunk_rows', 1), ('decimation_points', 2), ('excel_chart_points', 0), ('workers', 0),
+                         ('spectrum_segment', 8), ('spectrum_peaks', 1)):
+        if getattr(config, key) < minimum:
+            raise ValueError(f"'{key}' must be >= {minimum} (got {getattr(config, key)})")
+    if not 0 <= config.auto_threshold_low < config.auto_threshold_high <= 100:
+        raise ValueError(f"'auto_threshold_low' ({config.auto_threshold_low}) and 'auto_threshold_high' ({config.auto_threshold_high}) "
+                         "must be percents with auto_threshold_low < auto_threshold_high")
+    if config.progress_interval < 0:
+        raise ValueError(f"'progress_interval' must be >= 0 (got {config.progress_interval})")
+    if config.cache_max_size_mb <= 0:
+        raise ValueError(f"'cache_max_size_mb' must be > 0 (got {config.cache_max_size_mb})")
+
+    for n, channel in config.channels.items():
+        if channel.threshold_low >= channel.threshold_high:
+            raise ValueError(f"'threshold_low_ch{n}' ({channel.threshold_low}) must be less than 'threshold_high_ch{n}' ({channel.threshold_high})")
+
+
+def parse_overrides(items:list):
+    ''' ['key=value', ...] (command line '--set') to a dict '''
+    overrides = {}
+    for item in items or []:
+        key, separator, value = item.partition('=')
+        if not separator or not key.strip():
+            raise ValueError(f"Wrong override '{item}' (expected key=value)")
+        overrides[key.strip()] = value.strip()
+    return overrides
+
+
+def get_config():
+    ''' Config of the current process : config.ini is only read the first time '''
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+
+def set_config(config):
+    ''' Use config in the current process (command line overrides, worker processes) '''
+    global _config
+    _config = config
@@ -0,0 +1,105 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Binary columnar sidecar file of a CSV capture ('sidecar' in config.ini).
+                    Each CSV file is converted once, the next runs open the sidecar with a memory
+                    mapping (zero-copy) instead of parsing the text file again : the samples are
+                    read from the page cache, not copied into the process memory.
+
+                    File layout ('.ait' file in 'sidecar_dir') :
+                        - magic (8 bytes) + JSON header length (uint64, little endian)
+                        - JSON header : record_length, sample_interval, trigger_point, trigger_time,
+                          horizontal_offset, dtype, count, columns offsets, size + mtime of the CSV file
+                        - 'time' column then 'value' column (raw values, not calibrated),
+                          each one aligned on 64 bytes
+
+                    A sidecar is not used (and is written again) if the CSV file size / mtime or the
+                    dtype changed. The sidecar files are an alternative to the cache (not used when the
+                    cache is enabled) and are only written for the plain CSV files : a '.csv.gz' file or
+                    a zip member is never copied uncompressed to the disk.
+
+Functions       :
+    - get_sidecar_path(file_path, sidecar_dir:str)
+    - write_sidecar(sidecar_path, file_path, times, values, header:dict)
+    - open_sidecar(sidecar_path, file_path, dtype='float64')
+
+'''
+
+import os, json, struct, tempfile
+import numpy as np
+from api import archives
+
+
+MAGIC = b'AITSIDE1'
+ALIGNMENT = 64
+COLUMNS = ('time', 'value')
+
+
+def get_sidecar_path(file_path, sidecar_dir:str):
+    return os.path.join(sidecar_dir, archives.get_flat_name(file_path) + '.ait')
+
+
+def _align(position:int):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_sidecar(sidecar_path, file_path, times, values, header:dict):
+    ''' Write times / values (same dtype) and the CSV header fields to sidecar_path '''
+    stat = archives.get_stat(file_path)
+    times = np.ascontiguousarray(times)
+    values = np.ascontiguousarray(values, dtype=times.dtype)
+    info = dict(header, dtype=times.dtype.str, count=len(times), source_size=stat.st_size,
+                source_mtime_ns=stat.st_mtime_ns, offsets={})
+
+    # The offsets are written in the JSON header : reserve enough space for their digits
+    info_length = len(json.dumps(info)) + 64 * len(COLUMNS)
+    position = _align(len(MAGIC) + 8 + info_length)
+    for column, array in zip(COLUMNS, (times, values)):
+        info['offsets'][column] = position
+        position = _align(position + array.nbytes)
+    info_bytes = json.dumps(info).encode().ljust(info_length)
+
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', info_length) + info_bytes)
+            for column, array in zip(COLUMNS, (times, values)):
+                f.seek(info['offsets'][column])
+                array.tofile(f)
+        os.replace(tmp_path, sidecar_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def open_sidecar(sidecar_path, file_path, dtype='float64'):
+    ''' Return (times, values, header) with times / values read-only memory mapped arrays,
+    or None if the sidecar does not exist or is out of date.
+    '''
+    try:
+        with open(sidecar_path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            info_length, = struct.unpack('<Q', f.read(8))
+            info = json.loads(f.read(info_length))
+        stat = archives.get_stat(file_path)
+    except (OSError, ValueError, struct.error, KeyError):
+        return None
+
+    if (info['source_size'] != stat.st_size or info['source_mtime_ns'] != stat.st_mtime_ns
+            or np.dtype(info['dtype']) != np.dtype(dtype)):
+        return None
+
+    count = info['count']
+    if count == 0:
+        times = values = np.empty(0, dtype=dtype)
+    else:
+        times = np.memmap(sidecar_path, dtype=info['dtype'], mode='r', offset=info['offsets']['time'], shape=(count,))
+        values = np.memmap(sidecar_path, dtype=info['dtype'], mode='r', offset=info['offsets']['value'], shape=(count,))
+
+    header = {key: info[key] for key in ('record_length', 'sample_interval', 'trigger_point', 'trigger_time', 'horizontal_offset')}
+    return times, values, header
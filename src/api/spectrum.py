@@ -0,0 +1,100 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Spectral analysis used by CSV_Object.calculate_spectrum() ('spectrum' in config.ini) :
+                    power spectral density (Welch method) of the raw and filtred values, and their
+                    dominant frequencies (ripple, switching harmonics).
+
+                    Welch method : the signal is cut in segments of 'segment_length' samples
+                    ('overlap' % of overlap), each segment has its mean removed and is multiplied by
+                    the window, the one-sided periodograms (numpy rfft) of the segments are averaged.
+                    The segments are strided views of the signal (no copy), processed by blocks of
+                    SEGMENTS_PER_BLOCK segments (bounded memory), all the series in the same FFT call.
+                    Sampling frequency = 1 / sample_interval (CSV header).
+
+                    A record shorter than segment_length is analysed as one segment (periodogram).
+                    The frequency resolution is 1 / (segment_length * sample_interval).
+
+Functions       :
+    - get_window(window:str, length:int)
+    - welch_psd(series, sample_interval:float, segment_length:int=4096, overlap:float=50, window:str='hann')
+    - dominant_frequencies(frequencies, psd, count:int=5)
+
+'''
+
+import numpy as np
+
+
+WINDOW_TYPES = {
+    'hann' : np.hanning,
+    'hamming' : np.hamming,
+    'blackman' : np.blackman,
+    'rectangular' : np.ones,
+}
+
+SEGMENTS_PER_BLOCK = 256    # segments transformed by one rfft call
+
+PEAK_DTYPE = np.dtype([('frequency', 'f8'), ('psd', 'f8')])
+
+
+def get_window(window:str, length:int):
+    ''' Periodic window of 'length' samples (symmetric window of length + 1 without its last sample, as for an FFT) '''
+    try:
+        return WINDOW_TYPES[window](length + 1)[:-1]
+    except KeyError:
+        raise ValueError(f"Unknown window '{window}' ! Available windows : {', '.join(WINDOW_TYPES)}") from None
+
+
+def welch_psd(series, sample_interval:float, segment_length:int=4096, overlap:float=50, window:str='hann'):
+    ''' Return (frequencies (Hz), psd) : psd has one row per series (2D array of series, same length) in unit² / Hz.
+    :param overlap: overlap between two segments in % of segment_length (0 <= overlap < 100)
+    '''
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    samples = series.shape[1]
+    if samples < 2:
+        raise ValueError('Not enough samples for a spectrum !')
+    if not sample_interval or sample_interval <= 0:
+        raise ValueError(f"Wrong sample interval : {sample_interval}")
+
+    length = min(segment_length, samples)
+    step = max(1, int(round(length * (1 - overlap / 100))))
+    segments = 1 + (samples - length) // step
+    taper = get_window(window, length)
+
+    # Segments of each series : strided view (series, segment, sample), nothing copied
+    stride_series, stride_sample = series.strides
+    views = np.lib.stride_tricks.as_strided(series, shape=(series.shape[0], segments, length),
+                                            strides=(stride_series, step * stride_sample, stride_sample), writeable=False)
+
+    power = np.zeros((series.shape[0], length // 2 + 1))
+    for start in range(0, segments, SEGMENTS_PER_BLOCK):
+        block = views[:, start:start + SEGMENTS_PER_BLOCK]
+        block = (block - block.mean(axis=2, keepdims=True)) * taper    # constant detrend + window
+        power += (np.abs(np.fft.rfft(block, axis=2)) ** 2).sum(axis=1)
+
+    # One-sided density : the DC and Nyquist bins are not doubled
+    psd = power * sample_interval / (segments * np.sum(taper ** 2))
+    psd[:, 1:(length + 1) // 2] *= 2
+    frequencies = np.fft.rfftfreq(length, d=sample_interval)
+    return frequencies, psd
+
+
+def dominant_frequencies(frequencies, psd, count:int=5):
+    ''' The 'count' highest local maxima of psd (one series), DC excluded : structured array
+    (frequency, psd) sorted by decreasing psd
+    '''
+    psd = np.asarray(psd)
+    if len(psd) < 3:
+        return np.empty(0, dtype=PEAK_DTYPE)
+    # local maxima of bins 1 .. n-2, the last bin is a peak if above its neighbour
+    inner = np.flatnonzero((psd[1:-1] > psd[:-2]) & (psd[1:-1] >= psd[2:])) + 1
+    if psd[-1] > psd[-2]:
+        inner = np.append(inner, len(psd) - 1)
+    peaks = inner[np.argsort(psd[inner], kind='stable')[::-1][:count]]
+
+    result = np.empty(len(peaks), dtype=PEAK_DTYPE)
+    result['frequency'] = frequencies[peaks]
+    result['psd'] = psd[peaks]
+    return result
@@ -0,0 +1,315 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Streaming mode for the captures larger than the RAM ('streaming' in config.ini).
+                    The CSV file is read by chunks of 'chunk_rows' rows. The filter and the
+                    threshold crossing detection run online : only the filter window is carried
+                    over from one chunk to the next, the full signal is never held in memory.
+
+                    The Delta / DeltaFiltred results are the same as CSV_Object.calculate_delta_time()
+                    (the SMA filtred values are bit-for-bit identical with 'filter_exact').
+                    CSV_Object keeps a decimated copy of the data (min/max of each block of samples,
+                    'decimation_points' points at most) used for the figures and the Excel file.
+
+Functions       :
+    - iter_csv_chunks(file_path, delimiter:str=',', chunk_rows:int=1000000, dtype='float64')
+    - make_stream_filter(filter_type:str, N:int, exact:bool=False, polyorder:int=2)
+    - process_stream(obj, filter_type:str, progress=None)
+
+Classes         :
+    - StreamingMovingAverage(N, exact=False)
+    - StreamingExponentialMovingAverage(N)
+    - StreamingWindowFilter(function, N)
+    - StreamingEdgeDetector(channel_number, threshold_low, threshold_high)
+    - StreamingDecimator(block_size)
+
+'''
+
+import itertools, math
+import numpy as np
+from api import filters, detection, archives
+
+
+def iter_csv_chunks(file_path, delimiter:str=',', chunk_rows:int=1000000, dtype='float64'):
+    ''' Yield (times, values) numpy arrays of chunk_rows rows at most (columns 3 and 4 of every row) '''
+    with archives.open_text(file_path) as csvfile:     # '.csv.gz' / zip members : decompressed while read
+        while True:
+            lines = list(itertools.islice(csvfile, chunk_rows))
+            if not lines:
+                break
+            data = np.loadtxt(lines, delimiter=delimiter, usecols=(3, 4), dtype=dtype, ndmin=2)
+            yield np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1])
+
+
+# FILTERS :   ################################################################################
+# push(values) returns the filtred values of the next samples (in order) as soon as they are known,
+# finish() returns the filtred values of the remaining samples at the end of the record.
+
+class StreamingMovingAverage():
+    ''' Online version of filters.moving_average() : same output layout (v1.1) '''
+    def __init__(self, N:int, exact:bool=False):
+        self.n = int(N/2)
+        self.exact = exact
+        self._buffer = np.empty(0)
+        self._buffer_start = 0      # index of self._buffer[0] in the record
+        self._next = 0              # index of the next filtred value
+
+    def push(self, values):
+        n = self.n
+        self._buffer = np.concatenate((self._buffer, values)) if len(self._buffer) else np.asarray(values)
+        received = self._buffer_start + len(self._buffer)
+        outputs = []
+
+        # Head : copied from the raw values
+        head_end = min(n - 1, received)
+        if self._next < head_end:
+            outputs.append(self._buffer[self._next - self._buffer_start : head_end - self._buffer_start])
+            self._next = head_end
+
+        # Complete windows : values[j+1-n : j+n+2] received
+        last = received - n - 2
+        if self._next >= n - 1 and last >= self._next:
+            lo = np.arange(self._next + 1 - n, last + 2 - n)
+            outputs.append(filters.window_means(self._buffer, lo - self._buffer_start, lo - self._buffer_start + 2*n + 1,
+                                                exact=self.exact).astype(self._buffer.dtype))
+            self._next = last + 1
+
+        # Carry over the samples of the next windows only
+        keep_from = max(self._next + 1 - n, 0)
+        self._buffer = self._buffer[keep_from - self._buffer_start:].copy()
+        self._buffer_start = keep_from
+        return np.concatenate(outputs) if outputs else self._buffer[:0]
+
+    def finish(self):
+        n = self.n
+        record_length = self._buffer_start + len(self._buffer)
+        buffer = self._buffer
+        outputs = []
+        if record_length >= 2*n + 1 and self._next <= record_length - n - 1:
+            # Last window truncated by the end of the record
+            lo = np.arange(self._next + 1 - n, record_length - 2*n + 1)
+            hi = np.minimum(lo + 2*n + 1, record_length)
+            outputs.append(filters.window_means(buffer, lo - self._buffer_start, hi - self._buffer_start,
+                                                exact=self.exact).astype(buffer.dtype))
+            self._next = record_length - n
+        # Tail : copied from the raw values
+        outputs.append(buffer[self._next - self._buffer_start:])
+        self._next = record_length
+        return np.concatenate(outputs)
+
+
+class StreamingExponentialMovingAverage():
+    def __init__(self, N:int):
+        self.alpha = 2 / (N + 1)
+        self._previous = None
+
+    def push(self, values):
+        if len(values) == 0:
+            return values
+        alpha = self.alpha
+        values_list = values.tolist()
+        if self._previous is None:
+            ema = itertools.accumulate(values_list, lambda previous, value: previous + alpha * (value - previous))
+        else:
+            ema = itertools.islice(itertools.accumulate(values_list, lambda previous, value: previous + alpha * (value - previous),
+                                                        initial=self._previous), 1, None)
+        values_filtred = np.fromiter(ema, dtype=values.dtype, count=len(values))
+        self._previous = values_filtred[-1].item()
+        return values_filtred
+
+    def finish(self):
+        return np.empty(0)
+
+
+class StreamingWindowFilter():
+    ''' Online version of a centered window filter (filters.moving_median(), filters.savitzky_golay()) :
+    values_filtred[j] only depends on values[j-n : j+n+1], the first and last n values are copied '''
+    def __init__(self, function, N:int):
+        self.function = function
+        self.N = N
+        self.n = int(N/2)
+        self._buffer = np.empty(0)
+        self._buffer_start = 0
+        self._next = 0
+
+    def push(self, values):
+        n = self.n
+        self._buffer = np.concatenate((self._buffer, values)) if len(self._buffer) else np.asarray(values)
+        received = self._buffer_start + len(self._buffer)
+        outputs = []
+
+        head_end = min(n, received)
+        if self._next < head_end:
+            outputs.append(self._buffer[self._next - self._buffer_start : head_end - self._buffer_start])
+            self._next = head_end
+
+        last = received - n - 1     # values[last-n : last+n+1] received
+        if self._next >= n and last >= self._next:
+            segment = self._buffer[self._next - n - self._buffer_start : last + n + 1 - self._buffer_start]
+            outputs.append(self.function(segment, self.N)[n : len(segment) - n])
+            self._next = last + 1
+
+        keep_from = max(self._next - n, 0)
+        self._buffer = self._buffer[keep_from - self._buffer_start:].copy()
+        self._buffer_start = keep_from
+        return np.concatenate(outputs) if outputs else self._buffer[:0]
+
+    def finish(self):
+        # The complete windows were already computed : the tail is copied from the raw values
+        output = self._buffer[self._next - self._buffer_start:]
+        self._next = self._buffer_start + len(self._buffer)
+        return output
+
+
+def make_stream_filter(filter_type:str, N:int, exact:bool=False, polyorder:int=2):
+    if filter_type == 'sma':
+        return StreamingMovingAverage(N, exact=exact)
+    elif filter_type == 'ema':
+        return StreamingExponentialMovingAverage(N)
+    elif filter_type == 'median':
+        return StreamingWindowFilter(filters.moving_median, N)
+    elif filter_type == 'savgol':
+        return StreamingWindowFilter(lambda values, N: filters.savitzky_golay(values, N, polyorder=polyorder), N)
+    else:
+        raise ValueError(f"Unknown filter type '{filter_type}' ! Available filters : {', '.join(filters.FILTER_TYPES)}")
+
+
+# DELTA TIME :   #############################################################################
+
+class StreamingEdgeDetector():
+    ''' Online version of CSV_Object._extract_indexes() + CSV_Object._set_delta().
+    Start : last value crossing the first threshold, End : sample after the first value crossing the second one.
+    '''
+    def __init__(self, channel_number:int, threshold_low:float, threshold_high:float):
+        if channel_number == 1:
+            self.start_threshold, self.start_above = threshold_low, False
+            self.end_threshold, self.end_above = threshold_high, True
+        else:
+            self.start_threshold, self.start_above = threshold_high, True
+            self.end_threshold, self.end_above = threshold_low, False
+
+        self.start = None           # (index, time, value)
+        self.end = None             # (index, time, value)
+        self._end_idx = None
+
+    def push(self, position:int, times, values, reported_values):
+        ''' :param position: index of values[0] in the record
+        :param reported_values: values stored in Delta.value_start / value_end (raw values)
+        '''
+        i = detection.find_last(values, self.start_threshold, above=self.start_above)
+        if i is not None:
+            self.start = (position + i, float(times[i]), float(reported_values[i]))
+
+        if self._end_idx is None:
+            i = detection.find_first(values, self.end_threshold, above=self.end_above)
+            if i is not None:
+                self._end_idx = position + i + 1
+
+        if self.end is None and self._end_idx is not None and self._end_idx < position + len(values):
+            i = self._end_idx - position
+            self.end = (self._end_idx, float(times[i]), float(reported_values[i]))
+
+    def set_delta(self, delta):
+        if self.start is None or self.end is None:
+            raise ValueError('Could not detect the signal variation (start/end) with the thresholds !')
+        delta.idx_start, delta.time_start, delta.value_start = self.start
+        delta.idx_end, delta.time_end, delta.value_end = self.end
+        delta.delta_time = round( abs(delta.time_end - delta.time_start) * 1000, 2)
+
+
+# DECIMATION :   #############################################################################
+
+class StreamingDecimator():
+    ''' Keep the min and the max raw value of each block of block_size samples (in time order).
+    The filtred values are taken at the same samples. '''
+    def __init__(self, block_size:int):
+        self.block_size = max(int(block_size), 1)
+        self._carry = None
+        self._chunks = []
+
+    def push(self, times, values, values_filtred):
+        if self.block_size == 1:
+            self._chunks.append((times.copy(), values.copy(), values_filtred.copy()))
+            return
+        if self._carry is not None:
+            times, values, values_filtred = (np.concatenate((c, a)) for c, a in zip(self._carry, (times, values, values_filtred)))
+
+        blocks = len(values) // self.block_size
+        end = blocks * self.block_size
+        if blocks:
+            self._reduce(*(a[:end].reshape(blocks, self.block_size) for a in (times, values, values_filtred)))
+        self._carry = (times[end:].copy(), values[end:].copy(), values_filtred[end:].copy())
+
+    def finish(self):
+        ''' Return the decimated (times, values, values_filtred) '''
+        if self._carry is not None and len(self._carry[0]):
+            self._reduce(*(a.reshape(1, -1) for a in self._carry))
+            self._carry = None
+        if not self._chunks:
+            return np.empty(0), np.empty(0), np.empty(0)
+        return tuple(np.concatenate([chunk[k] for chunk in self._chunks]) for k in range(3))
+
+    def _reduce(self, times, values, values_filtred):
+        idx_min = np.argmin(values, axis=1)
+        idx_max = np.argmax(values, axis=1)
+        first = np.minimum(idx_min, idx_max)
+        second = np.maximum(idx_min, idx_max)
+        rows = np.arange(len(values))
+        self._chunks.append(tuple(np.column_stack((a[rows, first], a[rows, second])).ravel()
+                                  for a in (times, values, values_filtred)))
+
+
+# PROCESSING :   #############################################################################
+
+def process_stream(obj, filter_type:str, progress=None):
+    ''' Filter + Delta time of a CSV_Object in one pass over the file (obj.chunk_rows rows at a time),
+    the header fields are already read by the CSV_Object constructor.
+    Fill obj.Delta, obj.DeltaFiltred (+ obj.events, obj.events_filtred with 'event_detection') and the
+    decimated obj.times, obj.values, obj.values_filtred.
+    :param progress: instrumentation.Progress updated after each chunk (samples read)
+    '''
+    stream_filter = make_stream_filter(filter_type, obj.N, exact=obj.filter_exact, polyorder=obj.savgol_polyorder)
+    detector = StreamingEdgeDetector(obj.channel_number, obj.threshold_low, obj.threshold_high)
+    detector_filtred = StreamingEdgeDetector(obj.channel_number, obj.threshold_low, obj.threshold_high)
+    transitions = transitions_filtred = None
+    if obj.event_detection:
+        transitions = detection.TransitionDetector(obj.threshold_low, obj.threshold_high)
+        transitions_filtred = detection.TransitionDetector(obj.threshold_low, obj.threshold_high)
+    decimator = StreamingDecimator(math.ceil((obj.record_length or 1) / max(obj.decimation_points // 2, 1)))
+
+    # raw samples waiting for their filtred value (the filter output is late by half a window)
+    pending_times = np.empty(0, dtype=obj.dtype)
+    pending_values = np.empty(0, dtype=obj.dtype)
+    position = 0
+
+    def consume(values_filtred):
+        nonlocal pending_times, pending_values, position
+        count = len(values_filtred)
+        if count == 0:
+            return
+        times, values = pending_times[:count], pending_values[:count]
+        detector.push(position, times, values, values)
+        detector_filtred.push(position, times, values_filtred, values)
+        if transitions is not None:
+            transitions.push(position, times, values, values)
+            transitions_filtred.push(position, times, values_filtred, values)
+        decimator.push(times, values, values_filtred)
+        pending_times, pending_values = pending_times[count:], pending_values[count:]
+        position += count
+
+    for times, values in iter_csv_chunks(obj.file_path, delimiter=obj.delimiter, chunk_rows=obj.chunk_rows, dtype=obj.dtype):
+        values *= obj.calibration_value
+        pending_times = np.concatenate((pending_times, times))
+        pending_values = np.concatenate((pending_values, values))
+        consume(stream_filter.push(values))
+        if progress is not None:
+            progress.update(position)
+    consume(stream_filter.finish())
+
+    detector.set_delta(obj.Delta)
+    detector_filtred.set_delta(obj.DeltaFiltred)
+    if transitions is not None:
+        obj.events, obj.events_filtred = transitions.finish(), transitions_filtred.finish()
+    obj.times, obj.values, obj.values_filtred = decimator.finish()
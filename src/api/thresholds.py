@@ -0,0 +1,49 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Automatic thresholds used by CSV_Object.calculate_delta_time() ('auto_threshold'
+                    in config.ini) instead of the threshold_low_ch<n> / threshold_high_ch<n> values.
+
+                    The low and high state levels of the signal are the modes of the lower and upper
+                    halves of its histogram (state levels by histogram, as IEEE 181 for pulse
+                    waveforms) : one vectorized pass (min / max + numpy histogram on uniform bins).
+                    The thresholds are the reference levels between them :
+                        threshold = low level + percent / 100 * (high level - low level)
+                    (10 % / 90 % by default, as a rise / fall time measurement).
+
+Functions       :
+    - estimate_state_levels(values, bins:int=HISTOGRAM_BINS)
+    - estimate_thresholds(values, low_percent:float=10, high_percent:float=90, bins:int=HISTOGRAM_BINS)
+
+'''
+
+import numpy as np
+
+
+HISTOGRAM_BINS = 1000
+
+
+def estimate_state_levels(values, bins:int=HISTOGRAM_BINS):
+    ''' (low level, high level) of a 2 levels signal. Raise ValueError for a constant signal. '''
+    values = np.asarray(values)
+    if len(values) == 0:
+        raise ValueError('No samples to estimate the signal levels !')
+    minimum, maximum = float(values.min()), float(values.max())
+    if not maximum > minimum:
+        raise ValueError(f'Constant signal ({minimum}) : the signal levels can not be estimated !')
+
+    counts, edges = np.histogram(values, bins=bins, range=(minimum, maximum))
+    centers = (edges[:-1] + edges[1:]) / 2
+    half = bins // 2
+    low_level = centers[int(np.argmax(counts[:half]))]
+    high_level = centers[half + int(np.argmax(counts[half:]))]
+    return float(low_level), float(high_level)
+
+
+def estimate_thresholds(values, low_percent:float=10, high_percent:float=90, bins:int=HISTOGRAM_BINS):
+    ''' (threshold_low, threshold_high) at low_percent / high_percent between the state levels '''
+    low_level, high_level = estimate_state_levels(values, bins=bins)
+    amplitude = high_level - low_level
+    return low_level + amplitude * low_percent / 100, low_level + amplitude * high_percent / 100
@@ -0,0 +1,166 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Interactive viewer of a CSV_Object (CSV_Object.plot_show(), '--output view') for
+                    the long records : each zoom / pan only draws the samples of the visible range
+                    at the screen resolution, the raw and filtred values with their Delta time markers.
+
+                    Level of detail pyramid (MinMaxPyramid), built once per series :
+                        - level 0 : the record itself (not copied)
+                        - level k : indexes of the min and the max sample of each block of
+                          PYRAMID_FACTOR**k samples (level k is computed from level k - 1)
+                    The indexes are shared with the time column (no time copy per level) and
+                    the levels take about 2 / (PYRAMID_FACTOR - 1) of the record length.
+
+                    On each 'xlim_changed' event the visible samples are found with a binary
+                    search on the times, and the finest level with at most POINTS_PER_PIXEL points
+                    per pixel column of the axes is drawn : the spikes and the edges stay visible at
+                    every zoom level and the full resolution samples are drawn when zoomed in.
+
+Classes         :
+    - MinMaxPyramid(values, factor:int=PYRAMID_FACTOR, min_points:int=PYRAMID_MIN_POINTS)
+        - get_indexes(start:int, stop:int, max_points:int)
+    - InteractiveViewer(obj, black_bg:bool=True)
+        - update(ax=None)
+        - show()
+
+'''
+
+import numpy as np
+from api import decimation
+
+
+PYRAMID_FACTOR = 4          # samples of a block = PYRAMID_FACTOR x samples of a block of the previous level
+PYRAMID_MIN_POINTS = 4096   # the coarsest level has at most this number of points
+POINTS_PER_PIXEL = 4        # points drawn per pixel column at most (min + max of 2 blocks)
+
+
+class MinMaxPyramid():
+    def __init__(self, values, factor:int=PYRAMID_FACTOR, min_points:int=PYRAMID_MIN_POINTS):
+        self.values = values
+        self.length = len(values)
+        self.factor = factor
+        self.levels = []    # level k (k >= 1) : sorted indexes of the min / max samples of the blocks of factor**k samples
+
+        indexes = None
+        while (self.length if indexes is None else len(indexes)) > min_points:
+            indexes = self._next_level(indexes)
+            self.levels.append(indexes)
+
+    def _next_level(self, indexes):
+        ''' Min / max indexes of the blocks of the next level : blocks of 'factor' samples (level 1)
+        or of 'factor' min / max pairs of the previous level
+        '''
+        values = np.asarray(self.values)
+        if indexes is None:
+            blocks = -(-self.length // self.factor)
+            candidates = np.arange(blocks * self.factor).reshape(blocks, self.factor)
+            candidates = np.minimum(candidates, self.length - 1)     # last block padded with the last sample
+            candidate_values = decimation._reshape_blocks(values, self.factor, blocks)
+        else:
+            size = 2 * self.factor
+            blocks = -(-len(indexes) // size)
+            candidates = np.pad(indexes, (0, blocks * size - len(indexes)), mode='edge').reshape(blocks, size)
+            candidate_values = values[candidates]
+
+        rows = np.arange(blocks)
+        minimum = candidates[rows, np.argmin(candidate_values, axis=1)]
+        maximum = candidates[rows, np.argmax(candidate_values, axis=1)]
+        # the min and the max of a block in the time order : the level stays sorted
+        level = np.empty(2 * blocks, dtype=np.intp)
+        level[0::2] = np.minimum(minimum, maximum)
+        level[1::2] = np.maximum(minimum, maximum)
+        return level
+
+    def get_indexes(self, start:int, stop:int, max_points:int):
+        ''' Return (indexes, block size) of the samples to draw for the visible samples [start, stop) :
+        the samples themselves (slice, block size 1) if there are max_points at most, else the finest level
+        with max_points points at most (+ one point on each side, the line goes to the borders of the axes)
+        '''
+        if stop - start <= max_points or not self.levels:
+            return slice(max(start - 1, 0), min(stop + 1, self.length)), 1
+        for k, level in enumerate(self.levels, 1):
+            first, last = np.searchsorted(level, (start, stop))
+            if last - first <= max_points:
+                return level[max(first - 1, 0):last + 1], self.factor ** k
+        return self.levels[-1], self.factor ** len(self.levels)
+
+
+class InteractiveViewer():
+    def __init__(self, obj, black_bg:bool=True):
+        import matplotlib.pyplot as plt
+        from matplotlib.figure import figaspect
+
+        self.obj = obj
+        self.times = np.asarray(obj.times)
+        series = [('Raw', obj.values, obj.Delta, obj.events)]
+        if len(obj.values_filtred):
+            series.append((f'Filtred ({obj.filter_label})', obj.values_filtred, obj.DeltaFiltred, obj.events_filtred))
+
+        self.figure, axes = plt.subplots(len(series), 1, sharex=True, squeeze=False, figsize=figaspect(0.5))
+        self.figure.suptitle(obj.file_name, fontsize=14, fontweight='bold')
+        self.axes = list(axes[:, 0])
+        color = 'yellow' if obj.channel_number == 1 else 'cyan'
+        name = 'Tension (V)' if obj.channel_number == 1 else 'Current (A)'
+        text_color = 'white' if black_bg else 'black'
+
+        self.series = []    # (ax, line, level text, values, pyramid)
+        self.markers = []   # (x, Delta time text) : only drawn in the visible range (far away texts overflow the renderer)
+        for ax, (label, values, Delta, events) in zip(self.axes, series):
+            pyramid = MinMaxPyramid(values)
+            line, = ax.plot([], [], linewidth=1, color=color)
+            if black_bg:
+                ax.set_facecolor((0,0,0))
+            ax.grid()
+            ax.set_ylabel(f'{name}\n{label}')
+            self._add_delta_markers(ax, Delta, events, text_color)
+
+            minimum, maximum = float(np.min(values)), float(np.max(values))
+            margin = (maximum - minimum) * 0.05 or 1
+            ax.set_ylim(minimum - margin, maximum + margin)
+            level_text = ax.text(0.01, 0.01, '', transform=ax.transAxes, fontsize=8, color=text_color)
+            self.series.append((ax, line, level_text, values, pyramid))
+
+        self.axes[-1].set_xlabel('Time (s)')
+        self.axes[0].set_xlim(float(self.times[0]), float(self.times[-1]))
+        self.update()
+        for ax in self.axes:    # the shared axes only notify the axes zoomed / panned by the user
+            ax.callbacks.connect('xlim_changed', self.update)
+
+    def _add_delta_markers(self, ax, Delta, events, text_color):
+        ''' Delta time lines + texts (x : data, y : axes fraction, visible at every zoom level) and the events lines '''
+        if Delta.time_start is None:
+            return
+        transform = ax.get_xaxis_transform()
+        for position, label in ((Delta.time_start, 'Time Start'), (Delta.time_end, 'Time End')):
+            ax.axvline(x=position, linewidth=2)
+            text = ax.text(position, 0.97, f' {label}\n {round(position * 1000, 2)} ms', transform=transform, va='top', color=text_color)
+            self.markers.append((position, text))
+        middle = (Delta.time_start + Delta.time_end) / 2
+        text = ax.text(middle, 0.5, rf'$Δt = {Delta.delta_time}$ ms', transform=transform, ha='center', fontsize=12, color=text_color)
+        self.markers.append((middle, text))
+        if len(events) > 1:
+            self.obj._add_events_lines(ax, events)
+
+    def update(self, ax=None):
+        ''' Draw the level of detail matching the visible time range (called on each zoom / pan) '''
+        first, last = self.axes[0].get_xlim()
+        start, stop = np.searchsorted(self.times, (first, last))
+        for ax, line, level_text, values, pyramid in self.series:
+            max_points = POINTS_PER_PIXEL * max(int(ax.bbox.width), 1)
+            indexes, block_size = pyramid.get_indexes(int(start), int(stop), max_points)
+            x_data = self.times[indexes]
+            line.set_data(x_data, np.asarray(values)[indexes])
+            if block_size == 1:
+                level_text.set_text(f'full resolution : {len(x_data)} samples')
+            else:
+                level_text.set_text(f'min / max of {block_size} samples : {len(x_data)} points')
+        for position, text in self.markers:
+            text.set_visible(first <= position <= last)
+        self.figure.canvas.draw_idle()
+
+    def show(self):
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -0,0 +1,102 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Synthetic 'Oscilator' captures used by the benchmarks.
+                    Writes a Ch1 (Tension) + Ch2 (Current) pair of CSV files in the layout of the real
+                    files : 5 columns, the first 6 rows hold the header fields in columns 0-2
+                    (Record Length, Sample Interval, Trigger Point, Trigger Time, Source, Horizontal Offset),
+                    columns 3-4 hold time + value on every row.
+
+                    Signal (with the default config.ini thresholds and calibration) :
+                        - Ch1 : ~0 V, ramp up to 35 V between 30% and 70% of the record, then 35 V
+                        - Ch2 : 0.8 (x10 = 8 A) down to 0 on the same period
+                        + gaussian noise and a few spikes on both channels
+
+                    Usage (from 'src') : python -m benchmarks.captures <directory> <record_length> [<pairs>]
+
+Functions       :
+    - generate_capture_pair(directory, record_length:int, index:int=1, seed:int=0, overwrite:bool=False)
+        - get_capture_names(record_length:int, index:int=1)
+        - _write_capture(file_path, times, values, header:list, value_format:str)
+        - _make_signals(record_length:int, seed:int=0)
+
+'''
+
+import os, sys
+import numpy as np
+
+
+SAMPLE_INTERVAL = 1e-05     # s
+TRIGGER_RATIO = 0.7         # trigger point position in the record
+CHUNK_ROWS = 500000         # rows formatted at a time
+
+
+def get_capture_names(record_length:int, index:int=1):
+    ''' (Ch1 file name, Ch2 file name), the record length is part of the name (several sizes in one directory) '''
+    name = f'20200729__BENCH_{record_length}_8A_35V_OP{index}Wfm'
+    return name + '_Ch1.csv', name + '_Ch2.csv'
+
+
+def _make_signals(record_length:int, seed:int=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(record_length) / record_length
+
+    tension = np.clip((x - 0.3) / 0.4, 0, 1) * 35.0 + rng.normal(0, 0.6, record_length)
+    current = np.clip((0.7 - x) / 0.4, 0, 1) * 0.8 + rng.normal(0, 0.01, record_length)
+
+    # A few small spikes (1 / 10000 samples), below the distance between the levels and the thresholds
+    for values, amplitude in ((tension, 1.5), (current, 0.02)):
+        spikes = rng.integers(0, record_length, size=max(record_length // 10000, 1))
+        values[spikes] += rng.choice((-amplitude, amplitude), size=len(spikes))
+
+    return tension, current
+
+
+def _write_capture(file_path, times, values, header:list, value_format:str):
+    with open(file_path, 'w', newline='') as f:
+        for start in range(0, len(times), CHUNK_ROWS):
+            rows = zip(times[start:start + CHUNK_ROWS].tolist(), values[start:start + CHUNK_ROWS].tolist())
+            lines = [f'{t:.6f},{v:{value_format}}\n' for t, v in rows]
+            for i in range(start, min(len(header), start + len(lines))):  # header fields in columns 0-2
+                lines[i - start] = f'{header[i]},{lines[i - start]}'
+            for i in range(max(len(header), start) - start, len(lines)):
+                lines[i] = ',,,' + lines[i]
+            f.writelines(lines)
+
+
+def generate_capture_pair(directory, record_length:int, index:int=1, seed:int=0, overwrite:bool=False):
+    ''' Write the Ch1 + Ch2 files of a capture of 'record_length' samples in directory (kept if they
+    already exist, unless overwrite) and return their paths.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, file_name) for file_name in get_capture_names(record_length, index)]
+    if not overwrite and all(os.path.isfile(path) for path in paths):
+        return paths
+
+    trigger_point = int(record_length * TRIGGER_RATIO)
+    horizontal_offset = -trigger_point * SAMPLE_INTERVAL
+    times = horizontal_offset + np.arange(record_length) * SAMPLE_INTERVAL
+    tension, current = _make_signals(record_length, seed=seed + index)
+
+    for path, values, source, value_format in ((paths[0], tension, 'CH1', '.2f'), (paths[1], current, 'CH2', '.4f')):
+        header = [
+            f'Record Length,{record_length},Points',
+            f'Sample Interval,{SAMPLE_INTERVAL:.6e},s',
+            f'Trigger Point,{trigger_point},Samples',
+            f'Trigger Time,{0:.6e},s',
+            f'Source,{source},',
+            f'Horizontal Offset,{horizontal_offset:.6e},s',
+        ]
+        _write_capture(path, times, values, header, value_format)
+    return paths
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage : python -m benchmarks.captures <directory> <record_length> [<pairs>]")
+        sys.exit(2)
+    for index in range(1, (int(sys.argv[3]) if len(sys.argv) > 3 else 1) + 1):
+        for path in generate_capture_pair(sys.argv[1], int(sys.argv[2]), index=index, overwrite=True):
+            print(path)
@@ -0,0 +1,267 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Regression checks of the numerical engines against reference implementations,
+                    run on synthetic signals (benchmarks.captures) + random data. To be run after any
+                    change of the filters / streaming / spectrum code (exit status 1 if a check fails).
+
+                    Filters ('filters' module) :
+                        - sma exact  : bit-for-bit identical to the v1.1 loop (statistics.mean)
+                        - sma        : same values as the v1.1 loop (floating point tolerance)
+                        - ema        : identical to the recursive definition (one sample at a time)
+                        - median     : identical to numpy.median of each window
+                        - savgol     : same values as the dot product of each window with the
+                                       coefficients, polynomials of order <= polyorder kept
+                    Streaming ('streaming' module) :
+                        - each filter pushed by chunks of random sizes (smaller and larger than N)
+                          is bit-for-bit identical to the in-memory filter (sma without filter_exact :
+                          floating point tolerance, the running sums depend on the chunks)
+                    Spectrum ('spectrum' module, no reference package needed) :
+                        - Parseval : rectangular window without overlap, the integral of the PSD is
+                          the mean power of the detrended segments
+                        - sines of known amplitude / frequency (+ DC offset), every window : integral
+                          of the PSD = A² / 2, dominant frequencies in the order of the amplitudes, at
+                          the sine frequency (exact on a bin, within half a bin otherwise)
+                    Configuration ('settings' module) :
+                        - the shipped config.ini holds the defaults of settings.SETTINGS (a missing
+                          parameter gets the same value as the shipped file)
+
+                    Usage (from 'src') :
+                        python -m benchmarks.regression [--size 5000] [--seed 0]
+
+Functions       :
+    - reference_moving_average(values, N:int)
+    - run_checks(size:int=5000, seed:int=0)
+    - main(argv=None)
+
+'''
+
+import sys, argparse, statistics
+import numpy as np
+from api import filters, streaming, spectrum, settings
+from benchmarks import captures
+
+
+WINDOW_SIZES = (3, 5, 51, 101)
+SAVGOL_TOLERANCE = 1e-9     # relative to the signal amplitude
+SMA_TOLERANCE = 1e-9
+SPECTRUM_TOLERANCE = 1e-9   # relative error of the power (sines on a frequency bin, Parseval)
+SPECTRUM_LEAKAGE_TOLERANCE = 1e-3   # sines between two bins : power outside the computed bins
+SAMPLE_INTERVAL = 1e-05     # s (same as the captures)
+
+
+def reference_moving_average(values, N:int):
+    ''' CSV_Object.apply_moving_average() of v1.1 (without the progress bar) '''
+    values = list(values)
+    record_length = len(values)
+    values_filtred = []
+    n = int(N/2)
+    values_filtred[:n-1] = values[:n-1]
+    for i in range(n, record_length - n + 1):
+        values_filtred.append(statistics.mean(values[i-n:i+n+1]))
+    values_filtred[record_length-n:record_length] = values[record_length-n:]
+    return np.array(values_filtred, dtype=np.float64)
+
+
+def _reference_ema(values, N:int):
+    alpha = 2 / (N + 1)
+    values_filtred = np.empty(len(values))
+    previous = None
+    for i, value in enumerate(values.tolist()):
+        previous = value if previous is None else previous + alpha * (value - previous)
+        values_filtred[i] = previous
+    return values_filtred
+
+
+def _reference_window_filter(values, N:int, function):
+    n = int(N/2)
+    values_filtred = values.copy()
+    for j in range(n, len(values) - n):
+        values_filtred[j] = function(values[j-n:j+n+1])
+    return values_filtred
+
+
+def _get_signals(size:int, seed:int):
+    ''' (name, values) : the synthetic Tension / Current captures, random data with a large dynamic
+    range (exact sums), and the short records (shorter than / as long as the window) '''
+    tension, current = captures._make_signals(size, seed=seed)
+    rng = np.random.default_rng(seed)
+    wide = rng.normal(0, 1, size) * 10.0 ** rng.integers(-6, 6, size)
+    return [('tension', tension), ('current', current), ('wide range', wide),
+            ('short', tension[:60]), ('one window', tension[:51]), ('single', tension[:1])]
+
+
+def _assert_equal(actual, expected, label:str):
+    if len(actual) != len(expected) or not np.array_equal(actual, expected):
+        different = np.flatnonzero(actual != expected) if len(actual) == len(expected) else []
+        raise AssertionError(f"{label} : {len(different)} different values (lengths {len(actual)} / {len(expected)})")
+
+
+def _assert_close(actual, expected, tolerance:float, label:str):
+    scale = max(float(np.max(np.abs(expected))), 1e-300) if len(expected) else 1
+    error = float(np.max(np.abs(actual - expected))) / scale if len(expected) else 0
+    if len(actual) != len(expected) or error > tolerance:
+        raise AssertionError(f"{label} : relative error {error:.3g} > {tolerance:g}")
+    return error
+
+
+def _check_sma_exact(signals):
+    for name, values in signals:
+        for N in WINDOW_SIZES:
+            _assert_equal(filters.moving_average(values, N, exact=True), reference_moving_average(values, N), f'{name}, N={N}')
+    return 'identical to v1.1'
+
+
+def _check_sma(signals):
+    error = 0
+    for name, values in signals:
+        for N in WINDOW_SIZES:
+            error = max(error, _assert_close(filters.moving_average(values, N), reference_moving_average(values, N),
+                                             SMA_TOLERANCE, f'{name}, N={N}'))
+    return f'max relative error {error:.2g}'
+
+
+def _check_ema(signals):
+    for name, values in signals:
+        for N in WINDOW_SIZES:
+            _assert_equal(filters.exponential_moving_average(values, N), _reference_ema(values, N), f'{name}, N={N}')
+    return 'identical'
+
+
+def _check_median(signals):
+    for name, values in signals:
+        for N in WINDOW_SIZES:
+            _assert_equal(filters.moving_median(values, N, chunk_size=777), _reference_window_filter(values, N, np.median),
+                          f'{name}, N={N}')
+    return 'identical'
+
+
+def _check_savgol(signals):
+    error = 0
+    for polyorder in (0, 2, 3):
+        for name, values in signals:
+            for N in WINDOW_SIZES:
+                if polyorder >= N:
+                    continue
+                coefficients = filters._savgol_coefficients(N, polyorder)
+                reference = _reference_window_filter(values, N, lambda window: float(np.dot(window, coefficients)))
+                error = max(error, _assert_close(filters.savitzky_golay(values, N, polyorder), reference,
+                                                 SAVGOL_TOLERANCE, f'{name}, N={N}, polyorder={polyorder}'))
+        # a polynomial of order polyorder is not changed by the filter
+        x = np.linspace(-1, 1, 500)
+        polynomial = np.polyval(np.arange(1, polyorder + 2, dtype=np.float64), x)
+        error = max(error, _assert_close(filters.savitzky_golay(polynomial, 51, polyorder), polynomial,
+                                         SAVGOL_TOLERANCE, f'polynomial, polyorder={polyorder}'))
+    return f'max relative error {error:.2g}'
+
+
+def _check_streaming(signals, seed:int):
+    rng = np.random.default_rng(seed)
+    parameters = [('sma', True), ('sma', False), ('ema', False), ('median', False), ('savgol', False)]
+    for filter_type, exact in parameters:
+        for name, values in signals:
+            for N in WINDOW_SIZES:
+                expected = filters.apply_filter(values, N, filter_type, exact=exact)
+                stream_filter = streaming.make_stream_filter(filter_type, N, exact=exact)
+                outputs, start = [], 0
+                while start < len(values):
+                    stop = start + int(rng.choice((1, 2, N // 2 + 1, N, 3 * N, 1000)))
+                    outputs.append(stream_filter.push(values[start:stop]))
+                    start = stop
+                outputs.append(stream_filter.finish())
+                label = f"{filter_type}{' exact' if exact else ''}, {name}, N={N}"
+                if filter_type == 'sma' and not exact:
+                    _assert_close(np.concatenate(outputs), expected, SMA_TOLERANCE, label)
+                else:
+                    _assert_equal(np.concatenate(outputs), expected, label)
+    return 'identical to the in-memory filters (sma : tolerance)'
+
+
+def _check_parseval(seed:int, segment_length:int=1024, segments:int=8):
+    values = np.random.default_rng(seed).normal(0, 1, segment_length * segments)
+    frequencies, psd = spectrum.welch_psd(values, SAMPLE_INTERVAL, segment_length, overlap=0, window='rectangular')
+    power = psd[0].sum() * (frequencies[1] - frequencies[0])
+    expected = np.mean(np.var(values.reshape(segments, segment_length), axis=1))
+    _assert_close(np.array([power]), np.array([expected]), SPECTRUM_TOLERANCE, 'Parseval')
+    return f'relative error {abs(power / expected - 1):.2g}'
+
+
+def _check_sines(size:int, segment_length:int=1024):
+    times = np.arange(max(size, 8 * segment_length)) * SAMPLE_INTERVAL
+    resolution = 1 / (segment_length * SAMPLE_INTERVAL)
+    for window in spectrum.WINDOW_TYPES:
+        # (frequency, tolerance) : on the bin 50, then between two bins
+        for frequency, tolerance in ((50 * resolution, SPECTRUM_TOLERANCE), (123.4 * resolution, SPECTRUM_LEAKAGE_TOLERANCE)):
+            label = f'{window}, {frequency:.1f} Hz'
+            values = 2.0 * np.sin(2 * np.pi * frequency * times) + 0.5     # A = 2, DC offset removed
+            frequencies, psd = spectrum.welch_psd(values, SAMPLE_INTERVAL, segment_length, overlap=50, window=window)
+            power = psd[0].sum() * (frequencies[1] - frequencies[0])
+            _assert_close(np.array([power]), np.array([2.0 ** 2 / 2]), tolerance, f'{label}, power')
+            peak = spectrum.dominant_frequencies(frequencies, psd[0], 1)['frequency'][0]
+            if abs(peak - frequency) > (1e-6 if tolerance == SPECTRUM_TOLERANCE else resolution / 2):
+                raise AssertionError(f'{label} : dominant frequency {peak:.3f} Hz')
+
+        # two sines : the highest amplitude first
+        values = np.sin(2 * np.pi * 40 * resolution * times) + 3 * np.sin(2 * np.pi * 200 * resolution * times)
+        frequencies, psd = spectrum.welch_psd(values, SAMPLE_INTERVAL, segment_length, overlap=50, window=window)
+        peaks = spectrum.dominant_frequencies(frequencies, psd[0], 2)['frequency']
+        if not np.allclose(peaks, (200 * resolution, 40 * resolution)):
+            raise AssertionError(f'{window}, two sines : dominant frequencies {peaks}')
+    return f"A² / 2, frequencies OK ({', '.join(spectrum.WINDOW_TYPES)})"
+
+
+def _check_config_defaults():
+    config = settings.load_config()
+    different = [f'{key} = {getattr(config, key)!r} (default {default!r})'
+                 for key, (_, default) in settings.SETTINGS.items() if default is not None and getattr(config, key) != default]
+    if different:
+        raise AssertionError(f"config.ini : {', '.join(different)}")
+    return f'{len(settings.SETTINGS)} parameters'
+
+
+def run_checks(size:int=5000, seed:int=0):
+    ''' Run every check, return [(check, passed, detail)] '''
+    signals = _get_signals(size, seed)
+    checks = [
+        ('sma exact (v1.1)', lambda: _check_sma_exact(signals)),
+        ('sma', lambda: _check_sma(signals)),
+        ('ema', lambda: _check_ema(signals)),
+        ('median', lambda: _check_median(signals)),
+        ('savgol', lambda: _check_savgol(signals)),
+        ('streaming filters', lambda: _check_streaming(signals, seed)),
+        ('spectrum Parseval', lambda: _check_parseval(seed)),
+        ('spectrum sines', lambda: _check_sines(size)),
+        ('config.ini defaults', _check_config_defaults),
+    ]
+    results = []
+    for name, check in checks:
+        try:
+            results.append((name, True, check()))
+        except AssertionError as e:
+            results.append((name, False, str(e)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regression checks of the numerical engines against reference implementations")
+    parser.add_argument('--size', type=int, default=5000, help="samples of the synthetic signals. Default : 5000")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the signals. Default : 0")
+    args = parser.parse_args(argv)
+    if args.size < 200:
+        parser.error("--size must be >= 200")
+
+    from prettytable import PrettyTable
+    table = PrettyTable(['Check', 'Result', 'Detail'])
+    table.align['Check'] = 'l'
+    table.align['Detail'] = 'l'
+    results = run_checks(args.size, args.seed)
+    for name, passed, detail in results:
+        table.add_row([name, 'OK' if passed else 'FAILED', detail])
+    print(table)
+    return 0 if all(passed for _, passed, _ in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
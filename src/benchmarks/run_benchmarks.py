@@ -0,0 +1,271 @@
+'''
+---------------------------------------
+|   Author :  Mohamed El Amine OUIS   |
+---------------------------------------
+
+Description     :   Benchmark suite : times each processing stage on synthetic Ch1 + Ch2 captures
+                    (benchmarks.captures) of several record lengths, and writes the results to a JSON
+                    file to compare two versions (--compare).
+
+                    Stages (both channels, combined mode) :
+                        - load_csv_data           : Acquisition() : parse + calibrate (shared timebase)
+                        - apply_moving_average    : filter
+                        - calculate_delta_time    : Delta time (raw + filtred, _extract_indexes)
+                        - create_plot_data        : one figure per channel (raw, with Delta time lines)
+                        - create_figures          : the 4 figures per channel
+                        - generate_excel_combined : combined Excel file (skipped above the Excel row limit)
+
+                    Each stage time is the best of --repeat runs. The peak memory of each stage is
+                    measured in a separate run with tracemalloc (slower, not used for the times).
+                    The cache and the sidecar files are disabled (each run parses the CSV files).
+
+                    Usage (from 'src') :
+                        python -m benchmarks.run_benchmarks [--sizes 10k,100k,1M,10M] [--repeat 3]
+                                                            [--output results.json] [--compare old.json]
+
+Functions       :
+    - parse_sizes(sizes:str)
+    - run_stages(paths, config, stages:list, trace_memory:bool=False)
+    - run_benchmarks(sizes:list, stages:list, repeat:int=3, data_dir=None, overrides:dict=None, memory:bool=True)
+    - get_environment()
+    - print_results(results:list, previous:list=None)
+    - main(argv=None)
+
+'''
+
+import os, io, sys, json, time, argparse, platform, tempfile, tracemalloc, contextlib, subprocess
+from datetime import datetime
+from api import data_analysis, settings, batch, acquisition
+from benchmarks import captures
+
+
+STAGES = ('load_csv_data', 'apply_moving_average', 'calculate_delta_time', 'create_plot_data',
+          'create_figures', 'generate_excel_combined')
+DEFAULT_SIZES = '10k,100k,1M'
+ALL_SIZES = '10k,100k,1M,10M'
+EXCEL_MAX_ROWS = 1048575    # Excel row limit (without the header row)
+RESULTS_VERSION = 1
+
+# Parameters used by every run : each run parses the CSV files again
+BENCHMARK_OVERRIDES = {'cache': 'no', 'sidecar': 'no', 'streaming': 'no', 'processed_dir': 'Benchmark Output'}
+
+
+def parse_sizes(sizes:str):
+    ''' '10k,1M,2500' to [10000, 1000000, 2500] '''
+    multipliers = {'k': 1000, 'm': 1000000}
+    record_lengths = []
+    for size in sizes.split(','):
+        size = size.strip().lower()
+        if size[-1:] in multipliers:
+            record_lengths.append(int(float(size[:-1]) * multipliers[size[-1]]))
+        else:
+            record_lengths.append(int(size))
+    return record_lengths
+
+
+def _stage_load(context):
+    channels = acquisition.Acquisition(context['paths'], config=context['config'])
+    context[1], context[2] = channels.get_channel(1), channels.get_channel(2)
+
+def _stage_filter(context):
+    context[1].apply_moving_average()
+    context[2].apply_moving_average()
+
+def _stage_delta(context):
+    context[1].calculate_delta_time()
+    context[2].calculate_delta_time()
+
+def _stage_plot(context):
+    for obj in (context[1], context[2]):
+        file_name = f'{obj.file_name[:-4]}_line=true.png'
+        obj.create_plot_data(filtred=False, add_vline=True, file_name=file_name, title=file_name)
+
+def _stage_figures(context):
+    context[1].create_figures()
+    context[2].create_figures()
+
+def _stage_excel(context):
+    data_analysis.generate_excel_combined(context[1], context[2])
+
+STAGE_FUNCTIONS = {
+    'load_csv_data' : _stage_load,
+    'apply_moving_average' : _stage_filter,
+    'calculate_delta_time' : _stage_delta,
+    'create_plot_data' : _stage_plot,
+    'create_figures' : _stage_figures,
+    'generate_excel_combined' : _stage_excel,
+}
+
+
+def run_stages(paths, config, stages:list, trace_memory:bool=False):
+    ''' Run the stages in order on the (Ch1, Ch2) capture, return {stage : (wall time s, cpu time s, peak memory bytes)}.
+    The stages needing an earlier stage (load, filter, delta) run it first without measuring it.
+    '''
+    context = {'paths': paths, 'config': config}
+    measures = {}
+    required = STAGES[:STAGES.index('calculate_delta_time') + 1]
+    last = max(STAGES.index(stage) for stage in stages)
+
+    for stage in STAGES[:last + 1]:
+        if stage not in stages and stage not in required:
+            continue
+        if trace_memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):     # console output of the stage
+            STAGE_FUNCTIONS[stage](context)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] - memory_start if trace_memory else None
+        if stage in stages:
+            measures[stage] = (wall, cpu, peak)
+    return measures
+
+
+def run_benchmarks(sizes:list, stages:list, repeat:int=3, data_dir=None, overrides:dict=None, memory:bool=True):
+    ''' Return the list of results : one dict per (record length, stage) '''
+    if data_dir is None:
+        data_dir = os.path.join(tempfile.gettempdir(), 'ait_benchmarks')
+    config = settings.load_config(overrides=dict(BENCHMARK_OVERRIDES, **(overrides or {})))
+    batch.use_agg_backend()
+
+    results = []
+    for record_length in sizes:
+        print(f"\nRecord length : {record_length} samples")
+        print("Generating captures ...", end=' ', flush=True)
+        paths = captures.generate_capture_pair(data_dir, record_length)
+        print("OK")
+
+        size_stages = [stage for stage in stages if stage != 'generate_excel_combined' or record_length <= EXCEL_MAX_ROWS]
+        runs = []
+        for i in range(repeat):
+            print(f"Run {i+1}/{repeat} ...", end=' ', flush=True)
+            runs.append(run_stages(paths, config, size_stages))
+            print("OK")
+
+        peaks = {}
+        if memory:
+            print("Memory run ...", end=' ', flush=True)
+            tracemalloc.start()
+            try:
+                peaks = {stage: measure[2] for stage, measure in run_stages(paths, config, size_stages, trace_memory=True).items()}
+            finally:
+                tracemalloc.stop()
+            print("OK")
+
+        for stage in stages:
+            if stage not in size_stages:
+                results.append({'record_length': record_length, 'stage': stage, 'skipped': 'more rows than the Excel limit'})
+                continue
+            wall_times = [run[stage][0] for run in runs]
+            best = min(range(repeat), key=lambda i: wall_times[i])
+            results.append({
+                'record_length': record_length,
+                'stage': stage,
+                'wall_time_s': wall_times[best],
+                'cpu_time_s': runs[best][stage][1],
+                'wall_times_s': wall_times,
+                'samples_per_s': 2 * record_length / wall_times[best] if wall_times[best] > 0 else None,   # 2 channels
+                'peak_memory_mb': peaks[stage] / 1024**2 if stage in peaks else None,
+            })
+    return results
+
+
+def get_environment():
+    environment = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+    for module_name in ('numpy', 'matplotlib', 'xlsxwriter'):
+        try:
+            environment[module_name] = __import__(module_name).__version__
+        except ImportError:
+            environment[module_name] = None
+    try:
+        environment['git_commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                                   cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        environment['git_commit'] = None
+    return environment
+
+
+def print_results(results:list, previous:list=None):
+    ''' Results table, with the time ratio to the previous results (same record length + stage) if given '''
+    from prettytable import PrettyTable
+    previous_times = {(result['record_length'], result['stage']): result.get('wall_time_s') for result in previous or []}
+
+    columns = ['Record length', 'Stage', 'Wall (s)', 'CPU (s)', 'Samples/s', 'Peak memory (MB)']
+    if previous is not None:
+        columns += ['Previous (s)', 'Ratio']
+    table = PrettyTable(columns)
+    table.align['Stage'] = 'l'
+
+    for result in results:
+        if 'skipped' in result:
+            row = [result['record_length'], result['stage'], '-', '-', '-', '-']
+            if previous is not None:
+                row += ['-', '-']
+            table.add_row(row)
+            continue
+        peak = result['peak_memory_mb']
+        row = [result['record_length'], result['stage'], f"{result['wall_time_s']:.3f}", f"{result['cpu_time_s']:.3f}",
+               f"{result['samples_per_s']:.3g}", '-' if peak is None else f'{peak:.1f}']
+        if previous is not None:
+            previous_time = previous_times.get((result['record_length'], result['stage']))
+            if previous_time:
+                row += [f'{previous_time:.3f}', f"{result['wall_time_s'] / previous_time:.2f}"]
+            else:
+                row += ['-', '-']
+        table.add_row(row)
+    print(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the processing stages on synthetic captures")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"record lengths, 'k' / 'M' suffixes allowed, or 'all' ({ALL_SIZES}). Default : {DEFAULT_SIZES}")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"stages to measure. Default : {','.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per record length, the best time is kept. Default : 3")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run (peak memory)")
+    parser.add_argument('--data-dir', default=None, help="directory of the generated captures (kept between runs). Default : temp dir")
+    parser.add_argument('--output', default='benchmark_results.json', help="results file (JSON). Default : benchmark_results.json")
+    parser.add_argument('--compare', default=None, help="previous results file : print the time ratio of each stage")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="override a config.ini parameter")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',')]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown or args.repeat < 1:
+        parser.error(f"unknown stages : {', '.join(unknown)}" if unknown else "--repeat must be >= 1")
+    try:
+        sizes = parse_sizes(ALL_SIZES if args.sizes == 'all' else args.sizes)
+        overrides = settings.parse_overrides(args.set)
+        previous = None
+        if args.compare:
+            with open(args.compare) as f:
+                previous = json.load(f)['results']
+    except (ValueError, OSError, KeyError) as e:
+        parser.error(str(e))
+
+    results = run_benchmarks(sizes, stages, repeat=args.repeat, data_dir=args.data_dir, overrides=overrides, memory=not args.no_memory)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'environment': get_environment(),
+        'parameters': {'repeat': args.repeat, 'overrides': dict(BENCHMARK_OVERRIDES, **overrides)},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print()
+    print_results(results, previous)
+    print(f"\nResults saved : {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,35 @@ Actual Version  : 1.1
 
 Changelog:
 
+v1.2:
+    - Files (or Ch1/Ch2 pairs) are processed by the 'batch' executor : a process pool with
+      'workers' processes (config.ini), ordered console output, a failed file is reported
+      without stopping the batch and a summary table is printed at the end.
+    - Batch mode (no prompt) : python main.py -d <directory> [-c] [-s <selection>] [-w <workers>] [-o <output>]
+      The exit status is 0 if all files succeeded, 1 if a file failed and 2 for usage errors.
+    - The 4 figures of each channel are created with create_figures() (one figure, 2 full renders).
+    - config.ini is read and validated once per run (load_config()) and sent to the worker processes.
+      Options : --config <file> (other configuration file), --set key=value (override a parameter).
+    - matplotlib / xlsxwriter / prettytable are only imported by the stages using them (faster
+      start). --profile-import prints the startup time and the import time of these modules.
+    - Each file prints the time of its stages (parse, calibrate, filter, delta, plot, excel),
+      --report <file> saves them with the Delta times in a JSON file ('instrumentation' in config.ini).
+    - Combined mode : Ch1 + Ch2 are loaded as one acquisition.Acquisition (one shared timebase,
+      the channels alignment is checked).
+    - The files list comes from the acquisitions catalog ('catalog' in config.ini), --date-from,
+      --date-to and --channel select the acquisitions by date range / channel.
+    - With one worker the files go through a pipeline ('pipeline' in config.ini) : file k+1 is loaded
+      and the figures / Excel file of file k-1 are written while file k is computed. Each file is
+      processed by load_*(), compute_files() and write_files() (also used by the worker processes).
+    - compute_files() calls calculate_spectrum() after the Delta time ('spectral_analysis' in config.ini).
+    - write_files() also writes the columnar binary file of each capture ('columnar_format' in
+      config.ini), --output export only writes this file.
+    - --output view opens the interactive viewer of each file (CSV_Object.plot_show()) instead of
+      writing files : fast zoom / pan on long records with the Delta time markers.
+    - --serve [address] runs the local analysis service (api/service.py) : the configuration is read
+      once, warm worker processes analyse the captures sent by HTTP (TCP or Unix socket) and the
+      Delta time results are returned as JSON (no start / import / config.ini read per capture).
+
 v1.1:
     - Added 'config.ini' file to set all default parameters inside.
     - Enhenced Console Display.
@@ -45,9 +74,9 @@ v1.0:
             - Create new folder to save Excel + images
             - Start by creating two (2) CSV_Object instances to load the data from CSV file
             - For each instance ch1 and ch2 apply these methods/functions :
-                - apply_moving_average()
+                - apply_filter()
                 - calculate_delta_time() for both raw and filtred data
-                - create_plot_data() for both raw and filtred data
+                - create_figures() for both raw and filtred data
             - Generate combined exel file with graphs using this function :
                 - generate_excel_combined()
 
@@ -56,119 +85,314 @@ v1.0:
         - For each File :
             - Create new folder to save Excel + images
             - Start by creating a CSV_Object instance to load the data from CSV file
-            - apply_moving_average()
+            - apply_filter()
             - calculate_delta_time() for both raw and filtred data
-            - create_plot_data() for both raw and filtred data
+            - create_figures() for both raw and filtred data
             - Generate exel file with graphs using this method : generate_excel()
 
 '''
 
-import os, xlsxwriter, statistics, progressbar
+import time
+IMPORT_START = time.perf_counter()
+
+import os, sys, argparse, importlib
+from datetime import datetime
 from colorama import Fore, Back, Style, init
-from api import data_analysis
+from api import data_analysis, batch, settings, acquisition
 init(autoreset=True)
 
+IMPORT_TIME = time.perf_counter() - IMPORT_START    # main.py imports (--profile-import)
+
+
+# Combined mode channel banners :
+CHANNEL_TITLES = {1 : 'Channel 1 : Tension (V)', 2 : 'Channel 2 : Current (A)'}
+
+# Generated files for each output profile (--output) :
+OUTPUT_PROFILES = {
+    'full' : ('figures', 'excel', 'export'),
+    'excel' : ('excel', 'export'),
+    'figures' : ('figures',),
+    'export' : ('export',),
+    'view' : ('view',),     # interactive viewer, no file (one window at a time, main process)
+    'delta' : (),
+}
+
+# Exit status :
+EXIT_OK = 0
+EXIT_FAILED = 1         # at least one file failed
+EXIT_USAGE_ERROR = 2    # wrong directory / selection / configuration (same status as argparse errors)
+
+# Startup (main.py imports + config.ini) time budget in ms, checked by --profile-import
+STARTUP_BUDGET_MS = 250
+
+# Modules imported on demand by the processing stages (--profile-import) : (module, stage)
+DEFERRED_IMPORTS = (
+    ('prettytable', 'console tables'),
+    ('xlsxwriter', 'Excel files'),
+    ('api.figures', 'figures (matplotlib)'),
+    ('matplotlib.pyplot', 'create_plot_data()'),
+)
+
 
 ###    Functions    ############################################################################
 
-def combined_files_processing(csv_directory, file_names_list):
-    for i, file_compined in enumerate(file_names_list):
-        file_name_ch1 = file_compined[0]
-        file_name_ch2 = file_compined[1]
-        
-        print(f"{Fore.BLACK}{Back.WHITE}\n\n[{i+1}/{len(file_names_list)}] Processing File : {file_name_ch1[:-8]}\n")
-
-        obj_ch1 = data_analysis.CSV_Object(file_path=os.path.join(csv_directory, file_name_ch1), combined_flag=True)
-        obj_ch2 = data_analysis.CSV_Object(file_path=os.path.join(csv_directory, file_name_ch2), combined_flag=True)
-
-        # Channel 1 :   ------------------------------------------
-        print('\n' + '-'*100 + '\n')
-        print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
-        print(f'{Fore.BLACK}{Back.WHITE}|  Channel 1 : Tension (V)  |')
-        print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
-
-        obj_ch1.apply_moving_average()  # it will generate data into 'self.values_filtred' 
-        obj_ch1.calculate_delta_time()
-
-        # Create plot images :
-        # RAW
-        print("\nCreating Figures...")
-        file_name=f'{obj_ch1.file_name[:-4]}_line=false.png'
-        obj_ch1.create_plot_data(filtred=False, add_vline=False, file_name=file_name, title=file_name)
-        
-        file_name=f'{obj_ch1.file_name[:-4]}_line=true.png'
-        obj_ch1.create_plot_data(filtred=False, add_vline=True, file_name=file_name, title=file_name)
-        
-        # FILTRED
-        file_name=f'{obj_ch1.file_name[:-4]}_line=false_filtred_N={obj_ch1.N}.png'
-        obj_ch1.create_plot_data(filtred=True, add_vline=False, file_name=file_name, title=file_name)
-
-        file_name=f'{obj_ch1.file_name[:-4]}_line=true_filtred_N={obj_ch1.N}.png'
-        obj_ch1.create_plot_data(filtred=True, add_vline=True, file_name=file_name, title=file_name)
-
-        data_analysis.print_processing_info(obj_ch1)
-
-        # Channel 2 :   ------------------------------------------
-        print('\n' + '-'*100 + '\n')
-        print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
-        print(f'{Fore.BLACK}{Back.WHITE}|  Channel 2 : Current (A)  |')
-        print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
-
-        obj_ch2.apply_moving_average()  # it will generate data into 'self.values_filtred' 
-        obj_ch2.calculate_delta_time()
-
-        # Create plot images :
-        # RAW
-        print("\nCreating Figures...")
-        file_name=f'{obj_ch2.file_name[:-4]}_line=false.png'
-        obj_ch2.create_plot_data(filtred=False, add_vline=False, file_name=file_name, title=file_name)
-
-        file_name=f'{obj_ch2.file_name[:-4]}_line=true.png'
-        obj_ch2.create_plot_data(filtred=False, add_vline=True, file_name=file_name, title=file_name)
-        
-        # FILTRED
-        file_name=f'{obj_ch2.file_name[:-4]}_line=false_filtred_N={obj_ch2.N}.png'
-        obj_ch2.create_plot_data(filtred=True, add_vline=False, file_name=file_name, title=file_name)
-
-        file_name=f'{obj_ch2.file_name[:-4]}_line=true_filtred_N={obj_ch2.N}.png'
-        obj_ch2.create_plot_data(filtred=True, add_vline=True, file_name=file_name, title=file_name)
-
-        data_analysis.print_processing_info(obj_ch2)
-
-        # Generate combine Excel File :
-        data_analysis.generate_excel_combined(obj_ch1, obj_ch2)
-
-
-def separate_files_processing(csv_directory, file_names_list):
-    for i, file_name in enumerate(file_names_list):
-        print(f"{Fore.BLACK}{Back.WHITE}\n\n[{i+1}/{len(file_names_list)}] Processing File : {file_name}\n")
-               
-        obj = data_analysis.CSV_Object(file_path=os.path.join(csv_directory, file_name))
-        
-        obj.apply_moving_average()  # it will generate data into 'self.values_filtred' 
-        obj.calculate_delta_time()
+def load_combined_files(csv_directory, file_name_ch1, file_name_ch2, output:str='full'):
+    # Ch1 + Ch2 share one timebase (the time column of Ch2 is not parsed) :
+    channels = acquisition.Acquisition([os.path.join(csv_directory, file_name_ch1), os.path.join(csv_directory, file_name_ch2)])
+    return [channels.get_channel(1), channels.get_channel(2)], output
 
-        # Create plot images :
-        # RAW
-        print("\nCreating Figures...")
-        file_name=f'{obj.file_name[:-4]}_line=false.png'
-        obj.create_plot_data(filtred=False, add_vline=False, file_name=file_name, title=file_name)
-        
-        file_name=f'{obj.file_name[:-4]}_line=true.png'
-        obj.create_plot_data(filtred=False, add_vline=True, file_name=file_name, title=file_name)
-        
-        # FILTRED 
-        file_name=f'{obj.file_name[:-4]}_line=false_filtred_N={obj.N}.png'
-        obj.create_plot_data(filtred=True, add_vline=False, file_name=file_name, title=file_name)
-        
-        file_name=f'{obj.file_name[:-4]}_line=true_filtred_N={obj.N}.png'
-        obj.create_plot_data(filtred=True, add_vline=True, file_name=file_name, title=file_name)
 
-        data_analysis.print_processing_info(obj)
-        obj.generate_excel()
+def load_separate_file(csv_directory, file_name, output:str='full'):
+    return [data_analysis.CSV_Object(file_path=os.path.join(csv_directory, file_name))], output
 
 
-def main():
+def compute_files(context):
+    objs, output = context
+    for obj in objs:
+        if obj.combined_flag:
+            print('\n' + '-'*100 + '\n')
+            print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
+            print(f'{Fore.BLACK}{Back.WHITE}|  {CHANNEL_TITLES[obj.channel_number]}  |')
+            print(f'{Fore.BLACK}{Back.WHITE}+---------------------------+')
+
+        obj.apply_filter()  # it will generate data into 'self.values_filtred' 
+        obj.calculate_delta_time()
+        obj.calculate_spectrum()    # 'spectral_analysis' in config.ini
+        data_analysis.print_processing_info(obj)
+    return context
+
+
+def write_files(context):
+    objs, output = context
+    if 'figures' in OUTPUT_PROFILES[output]:
+        # Create plot images (raw + filtred, with and without Delta time lines) :
+        for obj in objs:
+            print("\nCreating Figures...")
+            obj.create_figures()
+
+    if 'excel' in OUTPUT_PROFILES[output]:
+        if objs[0].combined_flag:
+            data_analysis.generate_excel_combined(*objs)    # Generate combine Excel File
+        else:
+            objs[0].generate_excel()
+
+    if 'export' in OUTPUT_PROFILES[output] and objs[0].columnar_format != 'none':
+        data_analysis.generate_columnar_export(objs)    # 'columnar_format' in config.ini
+
+    for obj in objs:
+        data_analysis.print_stage_info(obj)
+
+    if 'view' in OUTPUT_PROFILES[output]:
+        for obj in objs:
+            print(f"\nViewer : {obj.file_name} (close the window to continue) ...")
+            obj.plot_show()
+    return [data_analysis.get_delta_summary(obj) for obj in objs]
+
+
+def process_combined_files(csv_directory, file_name_ch1, file_name_ch2, output:str='full'):
+    return write_files(compute_files(load_combined_files(csv_directory, file_name_ch1, file_name_ch2, output)))
+
+
+def process_separate_file(csv_directory, file_name, output:str='full'):
+    return write_files(compute_files(load_separate_file(csv_directory, file_name, output)))
+
+
+def _get_pipeline_stages(load_function, output:str='full'):
+    ''' (load, compute, write) stages used by batch.run_pipeline() with one worker, None if disabled '''
+    if not settings.get_config().pipeline or output == 'view':     # the viewer windows are opened by the main thread
+        return None
+    return (load_function, compute_files, write_files)
+
+
+def combined_files_processing(csv_directory, file_names_list, workers:int=1, output:str='full'):
+    args_list = [(csv_directory, file_name_ch1, file_name_ch2, output) for file_name_ch1, file_name_ch2 in file_names_list]
+    titles = [data_analysis.get_display_name(file_names) for file_names in file_names_list]
+    return batch.run_batch(process_combined_files, args_list, titles, workers=workers, config=settings.get_config(),
+                           stages=_get_pipeline_stages(load_combined_files, output))
+
+
+def separate_files_processing(csv_directory, file_names_list, workers:int=1, output:str='full'):
+    args_list = [(csv_directory, file_name, output) for file_name in file_names_list]
+    return batch.run_batch(process_separate_file, args_list, file_names_list, workers=workers, config=settings.get_config(),
+                           stages=_get_pipeline_stages(load_separate_file, output))
+
+
+def parse_date(date_str:str):
+    for date_format in ('%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(date_str, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"wrong date '{date_str}' (expected YYYYMMDD or YYYY-MM-DD)")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse 'Oscilator' CSV files (Tension : ..._Ch1.csv, Current : ..._Ch2.csv). "
+                                                 "Without arguments the script asks for the parameters (interactive mode).")
+    parser.add_argument('-d', '--directory', help="'CSV' directory. Run in batch mode : no prompt, exit status 0 if all files succeeded")
+    parser.add_argument('-c', '--combined', action='store_true', help='process the two channels combined (Ch1 + Ch2)')
+    parser.add_argument('-s', '--select', default='all',
+                        help="files selection : 'all', one index, '1,2,3', '4:9' or a glob pattern ('20200729*'). Default : all")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="number of worker processes (0 : all CPU cores). Default : config.ini")
+    parser.add_argument('-o', '--output', choices=OUTPUT_PROFILES.keys(), default='full',
+                        help="generated files : 'full' (Excel + figures + columnar file), 'excel' (Excel + columnar file), 'figures', "
+                             "'export' (columnar file), 'view' (interactive viewer, no file) or 'delta' (console only). Default : full")
+    parser.add_argument('--date-from', type=parse_date, default=None, metavar='DATE',
+                        help="only the acquisitions of this date or later (YYYYMMDD or YYYY-MM-DD)")
+    parser.add_argument('--date-to', type=parse_date, default=None, metavar='DATE',
+                        help="only the acquisitions of this date or before (YYYYMMDD or YYYY-MM-DD)")
+    parser.add_argument('--channel', type=int, default=None, help="only the files of this channel (not combined)")
+    parser.add_argument('-l', '--list', action='store_true', help='print the files list and exit')
+    parser.add_argument('--config', default=None, help="configuration file. Default : config.ini (src directory)")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="override a configuration parameter, can be repeated (--set N=31 --set threshold_low_ch1=2.5)")
+    parser.add_argument('--report', default=None, metavar='FILE',
+                        help="write a JSON report : Delta times and per stage measurements of each file")
+    parser.add_argument('--serve', nargs='?', const='', default=None, metavar='ADDRESS',
+                        help="run the local analysis service (warm worker processes, JSON results) on 'host:port' or "
+                             "a Unix socket path. Default address : 127.0.0.1:8765")
+    parser.add_argument('--profile-import', action='store_true',
+                        help="print the startup time and the import time of the modules loaded on demand, then exit "
+                             f"(exit status 1 above the {STARTUP_BUDGET_MS} ms budget)")
+    return parser.parse_args(argv)
+
+
+def run_batch_mode(args):
+    if not os.path.isdir(args.directory):
+        print(f"{Fore.RED}Directory not found : {args.directory}")
+        return EXIT_USAGE_ERROR
+
+    # Figures are only saved, never shown (matplotlib is not imported here), except by the viewer
+    if args.output != 'view':
+        batch.use_agg_backend()
+
+    if args.combined and args.channel is not None:
+        print(f"{Fore.RED}--channel can not be used with --combined !")
+        return EXIT_USAGE_ERROR
+    file_names = data_analysis.list_file_names(args.directory, extension='csv', combined=args.combined,
+                                               date_from=args.date_from, date_to=args.date_to, channel=args.channel)
+    if args.list:
+        data_analysis.print_file_names_list(args.directory, file_names)
+        return EXIT_OK
+    if not file_names:
+        print(f"{Fore.RED}No file to process in {args.directory}{' (no Ch1 / Ch2 pair)' if args.combined else ''} !")
+        return EXIT_USAGE_ERROR
+
+    try:
+        file_names_list = data_analysis.select_files(args.select, file_names)
+    except ValueError as e:
+        print(f"{Fore.RED}Wrong files selection '{args.select}' !\nError Message : {e}")
+        return EXIT_USAGE_ERROR
+    if not file_names_list:
+        return EXIT_USAGE_ERROR
+
+    workers = get_workers(args)
+    if args.output == 'view':
+        workers = 1     # the viewer windows are opened one by one by the main process
+
+    if args.combined:
+        task_results = combined_files_processing(args.directory, file_names_list, workers=workers, output=args.output)
+    else:
+        task_results = separate_files_processing(args.directory, file_names_list, workers=workers, output=args.output)
+
+    batch.print_batch_summary(task_results)
+    if args.report:
+        write_report(args.report, task_results)
+    if any(task.error for task in task_results):
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def get_workers(args):
+    ''' --workers (0 : all CPU cores), default : 'workers' in config.ini '''
+    if args.workers is None:
+        return settings.get_config().get_workers()
+    if args.workers <= 0:
+        return os.cpu_count() or 1
+    return args.workers
+
+
+def run_service_mode(args):
+    ''' Local analysis service : the configuration stays in memory and the captures are analysed by warm
+    worker processes (process_separate_file() / process_combined_files()), see api/service.py
+    '''
+    from api import service
+    batch.use_agg_backend()
+
+    def reload_config():
+        settings.set_config(settings.load_config(args.config, settings.parse_overrides(args.set)))
+        return settings.get_config()
+
+    outputs = tuple(output for output in OUTPUT_PROFILES if output != 'view')   # no window in the service
+    analysis_service = service.AnalysisService({'separate': process_separate_file, 'combined': process_combined_files},
+                                               outputs, settings.get_config(), workers=get_workers(args),
+                                               warm_up_modules=tuple(module_name for module_name, _ in DEFERRED_IMPORTS))
+    try:
+        service.serve(analysis_service, args.serve or service.DEFAULT_ADDRESS, reload_config=reload_config)
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}Could not start the analysis service !\nError Message : {e}")
+        return EXIT_USAGE_ERROR
+    return EXIT_OK
+
+
+def write_report(report_path, task_results):
+    try:
+        batch.write_batch_report(task_results, report_path, config=settings.get_config())
+        print(f"\nReport saved : {report_path}")
+    except OSError as e:
+        print(f"{Fore.RED}Could not write the report !\nFile path : {report_path}\nError Message : {e}")
+
+
+def load_config(args):
+    ''' Read and validate the configuration once for the whole run (+ command line overrides) '''
+    try:
+        settings.set_config(settings.load_config(args.config, settings.parse_overrides(args.set)))
+    except ValueError as e:
+        print(f"{Fore.RED}Wrong configuration !\nError Message : {e}")
+        return False
+    return True
+
+
+def print_import_profile(args):
+    ''' Print the startup time (main.py imports + config.ini) and the time to import each module
+    loaded on demand (in this order, each time includes the dependencies not loaded yet).
+    '''
+    start = time.perf_counter()
+    if not load_config(args):
+        return EXIT_USAGE_ERROR
+    config_time = time.perf_counter() - start
+    startup_ms = (IMPORT_TIME + config_time) * 1000
+
+    rows = [('main.py imports', 'startup', IMPORT_TIME * 1000), ('config.ini', 'startup', config_time * 1000)]
+    for module_name, stage in DEFERRED_IMPORTS:
+        start = time.perf_counter()
+        importlib.import_module(module_name)
+        rows.append((module_name, stage, (time.perf_counter() - start) * 1000))
+
+    from prettytable import PrettyTable
+    table = PrettyTable(['Module', 'Loaded by', 'Import time (ms)'])
+    table.align['Module'] = 'l'
+    for module_name, stage, duration in rows:
+        table.add_row([module_name, stage, f'{duration:.1f}'])
+    print(table)
+
+    if startup_ms > STARTUP_BUDGET_MS:
+        print(f"{Fore.RED}\nStartup : {startup_ms:.1f} ms (budget : {STARTUP_BUDGET_MS} ms)")
+        return EXIT_FAILED
+    print(f"{Fore.GREEN}\nStartup : {startup_ms:.1f} ms (budget : {STARTUP_BUDGET_MS} ms)")
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.profile_import:
+        return print_import_profile(args)
+    if not load_config(args):
+        return EXIT_USAGE_ERROR
+    if args.serve is not None:
+        return run_service_mode(args)
+    if args.directory is not None:
+        return run_batch_mode(args)
 
     # Enter CSV Working Directory :
     csv_directory = data_analysis.enter_directory()
@@ -178,13 +402,21 @@ def main():
     # Get file name list to be processed :
     file_names_list = data_analysis.get_file_names_list(csv_directory, extension='csv', combined=combined)
 
+    workers = settings.get_config().get_workers()
+
     # -------   Processing :   -------
     if combined:
-        combined_files_processing(csv_directory, file_names_list)
+        task_results = combined_files_processing(csv_directory, file_names_list, workers=workers)
     else:
-        separate_files_processing(csv_directory, file_names_list)
+        task_results = separate_files_processing(csv_directory, file_names_list, workers=workers)
+
+    batch.print_batch_summary(task_results)
+    if any(task.error for task in task_results):
+        return EXIT_FAILED
+    return EXIT_OK
 
 
 if __name__ == '__main__':
-    main()
-    print(f"{Fore.BLACK}{Back.WHITE}\n\n{'='*40}   PROCESSING FINISHED   {'='*40}\n")
\ No newline at end of file
+    exit_status = main()
+    print(f"{Fore.BLACK}{Back.WHITE}\n\n{'='*40}   PROCESSING FINISHED   {'='*40}\n")
+    sys.exit(exit_status)
\ No newline at end of file